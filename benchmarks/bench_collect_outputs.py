@@ -0,0 +1,74 @@
+'''
+Benchmark collecting per-file outputs in grab_fish_angle_v5.run()
+Analyzes one synthetic .dlm file (see synthetic_dlm.py), then combines its output tables N times, as if N files were analyzed, using:
+    concat: the previous approach, pd.concat() of the accumulated table and each new table
+    collect: the current approach, tables are collected in lists and concatenated once
+Reports run time and peak memory (tracemalloc) of combining outputs for each N. Analysis time is not included.
+
+Usage:
+    python bench_collect_outputs.py <folder for the synthetic .dlm> [N ...]
+'''
+
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'SAMPL_analysis'))
+
+import pandas as pd
+
+FRAME_RATE = 166
+DEFAULT_FILE_COUNTS = [10, 30, 60]
+
+def combine_concat(res, n_files):
+    """combine n_files copies of res by concatenating each copy to the accumulated tables
+    """
+    acc = {key:pd.DataFrame() for key in res}
+    for _ in range(n_files):
+        for key, value in res.items():
+            acc[key] = pd.concat([acc[key], value], ignore_index=True)
+    return acc
+
+def combine_collect(res, n_files):
+    """combine n_files copies of res by collecting them in lists and concatenating once, as in run()
+    """
+    collected = defaultdict(list)
+    for _ in range(n_files):
+        for key, value in res.items():
+            collected[key].append(value)
+    return {key:pd.concat(value, ignore_index=True) for key, value in collected.items()}
+
+def analyze_synthetic_file(folder):
+    """write a 5 MB synthetic .dlm in folder if it doesn't exist and return its output tables, see analyze_file()
+    """
+    from bout_analysis.grab_fish_angle_v5 import analyze_file
+    from synthetic_dlm import write_synthetic_dlm
+    os.makedirs(folder, exist_ok=True)
+    filename = os.path.join(folder, "221212 10.30.00.dlm")
+    if not os.path.isfile(filename):
+        write_synthetic_dlm(filename, 5*1024**2, frame_rate=FRAME_RATE)
+    read_options = {'dlm_engine':'fast', 'dlm_cache':False, 'cache_budget':0, 'stream':False, 'chunk_size':0}
+    grab_options = {'split_aligned':False, 'compact':False, 'jit':False}
+    file_res, _, _, _ = analyze_file(0, filename, folder, FRAME_RATE, read_options, grab_options)
+    return file_res[0]
+
+def main(folder, file_counts):
+    res = analyze_synthetic_file(folder)
+    print(f"\n{'files':>6} {'concat':>22} {'collect':>22}")
+    for n_files in file_counts:
+        line = f"{n_files:>6}"
+        for combine in [combine_concat, combine_collect]:
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            combined = combine(res, n_files)
+            elapsed = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1] / 1024**2
+            tracemalloc.stop()
+            del combined
+            line += f" {elapsed:8.2f} s / {peak:6.0f} MB"
+        print(line)
+
+if __name__ == "__main__":
+    main(sys.argv[1], [int(n) for n in sys.argv[2:]] or DEFAULT_FILE_COUNTS)
@@ -0,0 +1,136 @@
+'''
+Benchmark bout detection kernels (src/SAMPL_analysis/bout_analysis/kernels.py)
+Times each kernel on random frames with NaN, comparing:
+    previous: implementations used before kernels.py (padded window arrays, see nanargmax_rows() and smooth_windows_ML() below, groupby idxmax for peak search)
+    numpy: kernels with jit=False
+    jit: numba-compiled kernels, skipped if numba is not installed
+Each function is run once before timing, so that compile time of numba kernels is not included. Results of all implementations are checked to be identical.
+
+Usage:
+    python bench_kernels.py [number of frames]
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'SAMPL_analysis'))
+
+import numpy as np
+import pandas as pd
+from bout_analysis import kernels
+from preprocessing.epoch_ops import smooth_segments_ML
+from bout_analysis.window_gather import get_ragged_frames
+from bout_analysis.bout_windows import gather_windows, get_loco_index, get_swim_windows, link_swim_windows
+
+N_FRAMES = 2_000_000
+MAX_WINDOW = 60
+WSZ = 3
+MIN_SWIM_INTERVAL = 0.1
+
+def nanargmax_rows(a):
+    """Get the column index of the max value in each row ignoring NaN, same as idxmax() of each row
+
+    Args:
+        a (ndarray): 2D array
+
+    Returns:
+        ndarray: column index of the first max value in each row, float. NaN if all values in the row are NaN
+    """
+    if_nan = np.isnan(a)
+    res = np.argmax(np.where(if_nan, -np.inf, a), axis=1).astype('float64')
+    res[if_nan.all(axis=1)] = np.nan
+    return res
+
+def smooth_windows_ML(values, window_start, window_end, width, WSZ):
+    """Smooth values in each window with smooth_series_ML() (MATLAB smooth), without looping through windows.
+    Each window is smoothed separately, windows need to be at least WSZ frames long
+
+    Args:
+        values (array): values of each frame
+        window_start (array): first frame (position) of each window
+        window_end (array): last frame (position) of each window, inclusive
+        width (int): number of columns of the output, should be >= the longest window
+        WSZ (int): smoothing window size, odd number
+
+    Returns:
+        ndarray: shape (windows, width), smoothed values of each window, padded with NaN
+    """
+    # windows are gathered into a flat array and smoothed as segments
+    frames, offsets = get_ragged_frames(window_start, window_end)
+    smoothed = smooth_segments_ML(np.asarray(values, dtype='float64')[frames], offsets, WSZ)
+    window_len = np.diff(offsets)
+    res = np.full((len(window_len), width), np.nan)
+    res[np.repeat(np.arange(len(window_len)), window_len), frames - np.repeat(np.asarray(window_start), window_len)] = smoothed
+    return res
+
+def time_func(func, *args, **kwargs):
+    """run func once, then return its result and run time of the second run in ms
+    """
+    func(*args, **kwargs)
+    t0 = time.perf_counter()
+    res = func(*args, **kwargs)
+    return res, (time.perf_counter() - t0) * 1e3
+
+def report(name, funcs):
+    """time functions with the same result and print one line
+    """
+    line = f"{name:<22}"
+    ref = None
+    for label, func in funcs.items():
+        if func is None:
+            line += f" {label} -"
+            continue
+        res, elapsed = time_func(func)
+        if ref is None:
+            ref = res
+        elif not np.array_equal(ref, res, equal_nan=True):
+            raise AssertionError(f"{name}: {label} result differs")
+        line += f" {label} {elapsed:8.1f} ms"
+    print(line)
+
+def main(n_frames):
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=n_frames)
+    values[rng.random(n_frames) < 0.05] = np.nan
+    values[::97] = 1.5  # ties
+    n_windows = n_frames // 20
+    window_start = np.sort(rng.integers(0, n_frames-MAX_WINDOW, n_windows))
+    window_end = window_start + rng.integers(WSZ+4, MAX_WINDOW, n_windows) - 1
+    swim_indicator = (rng.random(n_frames) < 0.3).astype(int)
+    swim_indicator[0] = 0
+    abs_time = np.datetime64('2022-12-12T10:30:00') + np.arange(n_frames)*np.timedelta64(6024096, 'ns')
+    loco_index = get_loco_index(swim_indicator)
+    swim_windows = get_swim_windows(loco_index)
+    jit = kernels.if_jit(True)
+    print(f"{n_frames} frames, {n_windows} windows, {len(swim_windows)} swim windows, numba {'on' if jit else 'not installed'}")
+
+    report('window argmax', {
+        'previous':lambda: nanargmax_rows(gather_windows(values, window_start, window_end, MAX_WINDOW)) + window_start,
+        'numpy':lambda: kernels.window_argmax(values, window_start, window_end),
+        'jit':(lambda: kernels.window_argmax(values, window_start, window_end, jit=True)) if jit else None,
+    })
+    report('smooth + diff argmax', {
+        'previous':lambda: nanargmax_rows(np.diff(smooth_windows_ML(values, window_start, window_end, MAX_WINDOW, WSZ), axis=1)) + window_start + 1,
+        'numpy':lambda: kernels.smooth_diff_argmax(values, window_start, window_end, WSZ),
+        'jit':(lambda: kernels.smooth_diff_argmax(values, window_start, window_end, WSZ, jit=True)) if jit else None,
+    })
+    report('swim gap linking', {
+        'previous':lambda: link_swim_windows(swim_indicator, loco_index, abs_time, MIN_SWIM_INTERVAL),
+        'numpy':None,
+        'jit':(lambda: kernels.link_swim_gaps(swim_indicator, abs_time, MIN_SWIM_INTERVAL)) if jit else None,
+    })
+    # groupby idxmax is slow with many windows, time it on the first 20000 swim windows
+    n_peak = min(len(swim_windows), 20000)
+    peak_frames = swim_windows['end'].values[n_peak-1] + 1
+    df = pd.DataFrame({'swimSpeed':np.abs(values[:peak_frames]), 'locoIDXadj':loco_index[:peak_frames]})
+    peak_start = swim_windows['start'].values[:n_peak]
+    peak_end = swim_windows['end'].values[:n_peak]
+    report(f'peaks ({n_peak} windows)', {
+        'previous':lambda: df.loc[df['locoIDXadj'] % 2 == 1].groupby('locoIDXadj', sort=False)['swimSpeed'].idxmax().to_numpy(dtype='float64'),
+        'numpy':lambda: kernels.window_argmax(df['swimSpeed'].values, peak_start, peak_end),
+        'jit':(lambda: kernels.window_argmax(df['swimSpeed'].values, peak_start, peak_end, jit=True)) if jit else None,
+    })
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else N_FRAMES)
@@ -0,0 +1,54 @@
+'''
+Benchmark .dlm parser engines of read_dlm()
+Writes a synthetic .dlm file (see synthetic_dlm.py) if it doesn't exist, then reads it with each engine in a separate process and reports run time and peak RSS.
+Outputs of the engines are compared to make sure they are identical.
+
+Usage:
+    python bench_read_dlm.py <.dlm file> [size in MB, used if the file doesn't exist]
+'''
+
+import os
+import sys
+import subprocess
+import resource
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'SAMPL_analysis'))
+
+ENGINES = ['pandas', 'fast']
+
+def run_engine(filename, engine, out_file):
+    """Read filename with one engine, print run time and peak RSS, save parsed data to out_file for comparison
+    """
+    from preprocessing.read_dlm import read_dlm
+    t0 = time.perf_counter()
+    raw = read_dlm(0, filename, engine=engine)
+    elapsed = time.perf_counter() - t0
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024**2
+    print(f"\n{engine:>8}: {elapsed:7.2f} s, peak RSS {peak_rss:6.2f} GB, {len(raw)} rows")
+    raw.to_pickle(out_file)
+
+def main(filename, size_mb):
+    import pandas as pd
+    from synthetic_dlm import write_synthetic_dlm
+    if not os.path.isfile(filename):
+        print(f"Writing {size_mb} MB synthetic .dlm to {filename}")
+        write_synthetic_dlm(filename, int(size_mb*1024**2))
+    print(f"{os.path.getsize(filename)/1024**3:.2f} GB .dlm")
+    out_files = {}
+    for engine in ENGINES:
+        out_files[engine] = f"{filename}.{engine}.pkl"
+        # one process per engine, so that peak RSS is not shared
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--engine', engine, filename, out_files[engine]], check=True)
+    ref = pd.read_pickle(out_files[ENGINES[0]])
+    for engine in ENGINES[1:]:
+        pd.testing.assert_frame_equal(ref, pd.read_pickle(out_files[engine]))
+        print(f"{engine} output is identical to {ENGINES[0]}")
+    for out_file in out_files.values():
+        os.remove(out_file)
+
+if __name__ == "__main__":
+    if sys.argv[1] == '--engine':
+        run_engine(sys.argv[3], sys.argv[2], sys.argv[4])
+    else:
+        main(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 1024)
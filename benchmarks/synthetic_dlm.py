@@ -0,0 +1,81 @@
+'''
+Write synthetic .dlm files for benchmarks
+Each epoch is a few seconds of one fish drifting at low speed, with swim bouts (speed peaks + pitch rotations) every 0.5 to 1.8 s, so that files run through the whole analysis pipeline.
+Epochs are generated and written one at a time, files of any size can be written without holding them in memory.
+
+Usage:
+    python synthetic_dlm.py <output folder> [size in MB] [number of files]
+'''
+
+import os
+import sys
+import numpy as np
+
+FRAME_RATE = 166
+
+def gen_epoch(rng, epoch_num, t0, frame_rate=FRAME_RATE):
+    """Generate rows of one epoch
+
+    Args:
+        rng (Generator): numpy random generator
+        epoch_num (int): epoch number
+        t0 (float): time of the first frame
+        frame_rate (int, optional): frame rate. Defaults to FRAME_RATE.
+
+    Returns:
+        ndarray: shape (frames, 10), columns in .dlm order
+    """
+    n = int(rng.integers(4*frame_rate, 12*frame_rate))
+    direction = 1 if rng.random() < 0.5 else -1
+    spd = np.abs(rng.normal(0.5, 0.3, n))
+    pitch = np.cumsum(rng.normal(0, 0.05, n)) + rng.normal(10, 10)
+    w = int(0.08*frame_rate)
+    k = int(0.6*frame_rate)
+    while k < n - int(0.6*frame_rate):
+        prof = rng.uniform(10, 30)*np.exp(-0.5*(np.arange(-3*w, 3*w)/w)**2)
+        end = min(n, k+6*w)
+        spd[k:end] += prof[:end-k]
+        pitch[k:] += rng.normal(2, 3)/(1+np.exp(-(np.arange(n-k)-3*w)/3))
+        k += int(rng.uniform(0.5, 1.8)*frame_rate)
+    heading = np.radians(pitch*0.5)
+    x = 500 + np.cumsum(spd/frame_rate*60*np.cos(heading)*direction)
+    y = 500 - np.cumsum(spd/frame_rate*60*np.sin(heading))
+    epoch = np.zeros((n, 10))
+    epoch[:,0] = t0 + np.arange(n)/frame_rate
+    epoch[:,2] = pitch
+    epoch[:,3] = x
+    epoch[:,4] = y
+    epoch[:,5] = x + direction*120*np.cos(np.radians(pitch))
+    epoch[:,6] = y - 120*np.sin(np.radians(pitch))
+    epoch[:,8] = epoch_num
+    epoch[:,9] = rng.normal(240, 5, n)
+    return epoch
+
+def write_synthetic_dlm(filename, size, seed=0, frame_rate=FRAME_RATE):
+    """Write a synthetic .dlm file of at least size bytes
+
+    Args:
+        filename (string): directory of the .dlm file
+        size (int): minimum file size in bytes
+        seed (int, optional): random seed. Defaults to 0.
+        frame_rate (int, optional): frame rate. Defaults to FRAME_RATE.
+    """
+    rng = np.random.default_rng(seed)
+    fmt = ['%.6f', '%d', '%.6f', '%.6f', '%.6f', '%.6f', '%.6f', '%d', '%d', '%.6f']
+    t0 = 0.0
+    epoch_num = 1
+    with open(filename, 'wb') as f:
+        while f.tell() < size:
+            epoch = gen_epoch(rng, epoch_num, t0, frame_rate)
+            np.savetxt(f, epoch, fmt=fmt, delimiter='\t')
+            t0 = epoch[-1,0] + 1.0
+            epoch_num += 1
+
+if __name__ == "__main__":
+    folder = sys.argv[1]
+    size_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    n_files = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    os.makedirs(folder, exist_ok=True)
+    for i in range(n_files):
+        # file names follow the "yymmdd HH.MM.SS.dlm" pattern of recorded data
+        write_synthetic_dlm(os.path.join(folder, f"2212{12+i//10:02d} {10+i%10:02d}.30.00.dlm"), int(size_mb*1024**2), seed=i)
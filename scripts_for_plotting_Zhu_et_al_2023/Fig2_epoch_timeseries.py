@@ -4,7 +4,7 @@ import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-from plot_functions.plt_tools import round_half_up
+from plot_functions.plt_tools import round_half_up, walk_data_dirs
 from plot_functions.plt_tools import (set_font_type)
 from plot_functions.get_data_dir import (get_figure_dir)
 
@@ -46,7 +46,7 @@ def Fig2_single_epoch(root):
 
     # %%
     # for each sub-folder, get the path
-    all_dir = [ele[0] for ele in os.walk(root)]
+    all_dir = [ele[0] for ele in walk_data_dirs(root)]
     if len(all_dir) > 1:
         all_dir = all_dir[1:]
         
@@ -1,6 +1,6 @@
 #%%
 from cmath import exp
-from plot_functions.plt_tools import round_half_up
+from plot_functions.plt_tools import round_half_up, walk_data_dirs
 import os
 import pandas as pd 
 import numpy as np
@@ -8,7 +8,7 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 from plot_functions.get_data_dir import ( get_figure_dir)
 from plot_functions.plt_tools import (set_font_type, day_night_split)
-from plot_functions.get_index import (get_index)
+from plot_functions.get_index import (get_index, get_aligned_rows)
 from scipy.signal import savgol_filter
 
 from tqdm import tqdm
@@ -61,14 +61,13 @@ def Fig2_parameters_alignedAverage(root):
 
     for condition_idx, folder in enumerate(folder_paths):
         # enter each condition folder (e.g. 7dd_ctrl)
-        for subpath, subdir_list, subfile_list in os.walk(folder):
+        for subpath, subdir_list, subfile_list in walk_data_dirs(folder):
             # if folder is not empty
             if subdir_list:
                 # reset for each condition
                 exp_data_all = pd.DataFrame()
                 # loop through each sub-folder (experiment) under each condition
                 for expNum, exp in enumerate(subdir_list):
-                    rows = []
                     exp_path = os.path.join(subpath, exp)
                     # get pitch                
                     raw = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout_aligned')
@@ -80,8 +79,7 @@ def Fig2_parameters_alignedAverage(root):
                     bout_time = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout2').loc[:,['aligned_time']]
                     # for i in bout_time.index:
                     # # if only need day or night bouts:
-                    for i in day_night_split(bout_time,'aligned_time').index:
-                        rows.extend(list(range(i*total_aligned+idxRANGE[0],i*total_aligned+idxRANGE[1])))
+                    rows = get_aligned_rows(day_night_split(bout_time,'aligned_time').index, total_aligned, idxRANGE)
                     selected_range = raw.loc[rows,:]
                     # calculate angular speed (smoothed)
                     grp = selected_range.groupby(np.arange(len(selected_range))//(idxRANGE[1]-idxRANGE[0]))
@@ -1,14 +1,14 @@
 #%%
 # import sys
 import os,glob
-from plot_functions.plt_tools import round_half_up
+from plot_functions.plt_tools import round_half_up, walk_data_dirs
 import pandas as pd # pandas library
 import numpy as np # numpy
 import seaborn as sns
 import matplotlib.pyplot as plt
 from scipy import stats
 from plot_functions.get_data_dir import ( get_figure_dir)
-from plot_functions.get_index import get_index
+from plot_functions.get_index import (get_index, get_aligned_rows)
 from plot_functions.plt_tools import (set_font_type, defaultPlotting, distribution_binned_average, day_night_split)
 from tqdm import tqdm
 import matplotlib as mpl
@@ -96,7 +96,7 @@ def Fig4_trajDeviation_pitchChg(root):
     # go through each condition folders under the root
     for condition_idx, folder in enumerate(folder_paths):
         # enter each condition folder (e.g. 7dd_ctrl)
-        for subpath, subdir_list, subfile_list in os.walk(folder):
+        for subpath, subdir_list, subfile_list in walk_data_dirs(folder):
             # if folder is not empty
             if subdir_list:
                 # reset for each condition
@@ -104,7 +104,6 @@ def Fig4_trajDeviation_pitchChg(root):
                 # loop through each sub-folder (experiment) under each condition
                 for expNum, exp in enumerate(subdir_list):
                     # angular velocity (angVel) calculation
-                    rows = []
                     # for each sub-folder, get the path
                     exp_path = os.path.join(subpath, exp)
                     # get pitch                
@@ -122,8 +121,7 @@ def Fig4_trajDeviation_pitchChg(root):
                     bout_time = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout2').loc[:,['aligned_time']]
                     # for i in bout_time.index:
                     # # if only need day or night bouts:
-                    for i in day_night_split(bout_time,'aligned_time').index:
-                        rows.extend(list(range(i*total_aligned+idxRANGE[0],i*total_aligned+idxRANGE[1])))
+                    rows = get_aligned_rows(day_night_split(bout_time,'aligned_time').index, total_aligned, idxRANGE)
                     exp_data = exp_data.assign(expNum = expNum,
                                             exp_id = condition_idx*100+expNum)
                     around_peak_data = pd.concat([around_peak_data,exp_data.loc[rows,:]])
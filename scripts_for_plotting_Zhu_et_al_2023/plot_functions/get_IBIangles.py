@@ -3,7 +3,7 @@ import pandas as pd # pandas library
 import numpy as np # numpy
 from plot_functions.plt_tools import (day_night_split)
 from plot_functions.get_index import get_index
-from plot_functions.plt_tools import round_half_up
+from plot_functions.plt_tools import round_half_up, walk_data_dirs
 
 def get_IBIangles(root, FRAME_RATE,**kwargs):
     peak_idx , total_aligned = get_index(FRAME_RATE)
@@ -33,7 +33,7 @@ def get_IBIangles(root, FRAME_RATE,**kwargs):
     # go through each condition folders under the root
     for condition_idx, folder in enumerate(folder_paths):
         # enter each condition folder (e.g. 7dd_ctrl)
-        for subpath, subdir_list, subfile_list in os.walk(folder):
+        for subpath, subdir_list, subfile_list in walk_data_dirs(folder):
             # if folder is not empty
             if subdir_list:
                 subdir_list.sort()
@@ -2,16 +2,77 @@ import os,glob
 import pandas as pd # pandas library
 import numpy as np # numpy
 from plot_functions.plt_tools import (day_night_split)
-from plot_functions.get_index import get_index
+from plot_functions.get_index import (get_index, get_aligned_rows, get_aligned_frames)
 from scipy.signal import savgol_filter
-from plot_functions.plt_tools import round_half_up
+from plot_functions.plt_tools import round_half_up, walk_data_dirs
 
 
+# columns of prop_bout_aligned used by extract_bout_features_v5()
+BOUT_FEATURE_COLS = ['propBoutAligned_pitch','propBoutAligned_instHeading','propBoutAligned_speed','propBoutAligned_x','propBoutAligned_y']
+
+def get_bout_frames(bout_data, cols):
+    """reshape columns of aligned bouts to arrays of (bouts, frames). Bouts are numbered by 'bout_num' and have the same frames ('idx')
+
+    Args:
+        bout_data (dataFrame): aligned bouts with 'idx' and 'bout_num' columns, frames of each bout in consecutive rows
+        cols (list): columns to reshape
+
+    Returns:
+        frames (ndarray): frame number (idx) of each frame
+        bout_frames (dict): array of (bouts, frames) for each column, a view of the column
+    """
+    n_bouts = bout_data['bout_num'].nunique()
+    n_frames = len(bout_data) // n_bouts if n_bouts else 1
+    frame_idx = get_aligned_frames(bout_data['idx'].to_numpy(), None, n_frames, [0, n_frames])
+    if n_bouts * n_frames != len(bout_data) or not (frame_idx == frame_idx[:1]).all():
+        raise ValueError("all bouts need to have the same frames")
+    frames = frame_idx[0] if n_bouts else np.array([], dtype=frame_idx.dtype)
+    bout_frames = {col:get_aligned_frames(bout_data[col].to_numpy(), None, n_frames, [0, n_frames]) for col in cols}
+    return frames, bout_frames
+
+def get_frame_values(values, frames, idx):
+    """values of each bout at frame idx
+
+    Args:
+        values (ndarray): (bouts, frames), see get_bout_frames()
+        frames (ndarray): frame number of each frame
+        idx (int): frame number to get
+
+    Returns:
+        ndarray: value of each bout, NaN if idx is not in frames
+    """
+    position = np.flatnonzero(frames == idx)
+    if len(position) == 0:
+        return np.full(len(values), np.nan)
+    return values[:, position[0]]
+
+def get_swim_displ(speed, x, y, threshold):
+    """displacement from the first to the last frame with speed above threshold of each bout
+
+    Args:
+        speed (ndarray): (bouts, frames) speed
+        x (ndarray): (bouts, frames) x position
+        y (ndarray): (bouts, frames) y position
+        threshold (numeric): speed threshold
+
+    Returns:
+        ndarray: displacement of each bout, NaN if speed is never above threshold
+    """
+    if_swim = speed > threshold
+    if_any = if_swim.any(axis=1)
+    first = if_swim.argmax(axis=1)
+    # last frame above threshold is the first one searching from the end
+    last = if_swim.shape[1] - 1 - if_swim[:, ::-1].argmax(axis=1)
+    bouts = np.arange(len(speed))
+    y_swim = np.where(if_any, y[bouts, first] - y[bouts, last], np.nan)
+    x_swim = np.where(if_any, x[bouts, first] - x[bouts, last], np.nan)
+    return np.sqrt(np.square(y_swim) + np.square(x_swim))
+
 def extract_bout_features_v5(bout_data,peak_idx, FRAME_RATE, **kwargs):
     """extract bout features from analyzed bout data.
 
     Args:
-        bout_data (dataFrame): bout data read from ('bout_data.h5', key='prop_bout_aligned')
+        bout_data (dataFrame): bout data read from ('bout_data.h5', key='prop_bout_aligned'), with frame number 'idx' and 'bout_num'. All bouts need to have the same frames
         PEAK_IDX (numeric): index of the frame at time of peak speed
         FRAME_RATE (int): frame rate
 
@@ -39,33 +100,32 @@ def extract_bout_features_v5(bout_data,peak_idx, FRAME_RATE, **kwargs):
         if key == 'idx_max_angvel':
             idx_max_angvel = value
     
+    # reshape once, features are read by frame position
+    frames, bout_frames = get_bout_frames(bout_data, BOUT_FEATURE_COLS)
+    pitch = bout_frames['propBoutAligned_pitch']
+    heading = bout_frames['propBoutAligned_instHeading']
     this_exp_features = pd.DataFrame(data={
-        'pitch_initial':bout_data.loc[bout_data['idx']==idx_initial,'propBoutAligned_pitch'].values, 
-        'pitch_mid_accel':bout_data.loc[bout_data['idx']==idx_mid_accel,'propBoutAligned_pitch'].values, 
-        'pitch_pre_bout':bout_data.loc[bout_data['idx']==idx_pre_bout,'propBoutAligned_pitch'].values, 
-        'pitch_peak':bout_data.loc[bout_data['idx']==peak_idx,'propBoutAligned_pitch'].values, 
-        'pitch_post_bout':bout_data.loc[bout_data['idx']==idx_post_bout,'propBoutAligned_pitch'].values, 
-        'pitch_end': bout_data.loc[bout_data['idx']==idx_end,'propBoutAligned_pitch'].values, 
-        'pitch_max_angvel': bout_data.loc[bout_data['idx']==idx_max_angvel,'propBoutAligned_pitch'].values,         
-        'traj_initial':bout_data.loc[bout_data['idx']==idx_initial,'propBoutAligned_instHeading'].values, 
-        'traj_pre_bout':bout_data.loc[bout_data['idx']==idx_pre_bout,'propBoutAligned_instHeading'].values, 
-        'traj_peak':bout_data.loc[bout_data['idx']==peak_idx,'propBoutAligned_instHeading'].values, 
-        'traj_post_bout':bout_data.loc[bout_data['idx']==idx_post_bout,'propBoutAligned_instHeading'].values, 
-        'traj_end':bout_data.loc[bout_data['idx']==idx_end,'propBoutAligned_instHeading'].values, 
-        'spd_peak':bout_data.loc[bout_data['idx']==peak_idx,'propBoutAligned_speed'].values, 
+        'pitch_initial':get_frame_values(pitch, frames, idx_initial), 
+        'pitch_mid_accel':get_frame_values(pitch, frames, idx_mid_accel), 
+        'pitch_pre_bout':get_frame_values(pitch, frames, idx_pre_bout), 
+        'pitch_peak':get_frame_values(pitch, frames, peak_idx), 
+        'pitch_post_bout':get_frame_values(pitch, frames, idx_post_bout), 
+        'pitch_end': get_frame_values(pitch, frames, idx_end), 
+        'pitch_max_angvel': get_frame_values(pitch, frames, idx_max_angvel),         
+        'traj_initial':get_frame_values(heading, frames, idx_initial), 
+        'traj_pre_bout':get_frame_values(heading, frames, idx_pre_bout), 
+        'traj_peak':get_frame_values(heading, frames, peak_idx), 
+        'traj_post_bout':get_frame_values(heading, frames, idx_post_bout), 
+        'traj_end':get_frame_values(heading, frames, idx_end), 
+        'spd_peak':get_frame_values(bout_frames['propBoutAligned_speed'], frames, peak_idx), 
     })
     
     # calculate attack angles
     # bout trajectory is the same as (bout_data.h5, key='prop_bout2')['epochBouts_trajectory']
-    yy = (bout_data.loc[bout_data['idx']==idx_post_bout,'propBoutAligned_y'].values - bout_data.loc[bout_data['idx']==idx_pre_bout,'propBoutAligned_y'].values)
-    absxx = np.absolute((bout_data.loc[bout_data['idx']==idx_post_bout,'propBoutAligned_x'].values - bout_data.loc[bout_data['idx']==idx_pre_bout,'propBoutAligned_x'].values))
+    yy = (get_frame_values(bout_frames['propBoutAligned_y'], frames, idx_post_bout) - get_frame_values(bout_frames['propBoutAligned_y'], frames, idx_pre_bout))
+    absxx = np.absolute((get_frame_values(bout_frames['propBoutAligned_x'], frames, idx_post_bout) - get_frame_values(bout_frames['propBoutAligned_x'], frames, idx_pre_bout)))
     epochBouts_trajectory = np.degrees(np.arctan(yy/absxx)) # direction of the bout, -90:90
-    swim_indicator = bout_data['propBoutAligned_speed'] > 4
-    y_swim = bout_data.loc[swim_indicator].groupby('bout_num').head(1)['propBoutAligned_y'].values - bout_data.loc[swim_indicator].groupby('bout_num').tail(1)['propBoutAligned_y'].values
-    x_swim = bout_data.loc[swim_indicator].groupby('bout_num').head(1)['propBoutAligned_x'].values - bout_data.loc[swim_indicator].groupby('bout_num').tail(1)['propBoutAligned_x'].values
-    displ = np.sqrt(np.square(y_swim) + np.square(x_swim))
-    # pitch_mid_accel = bout_data.loc[bout_data['idx']==idx_mid_accel,'propBoutAligned_pitch'].reset_index(drop=True)
-    pitch_mid_decel = bout_data.loc[bout_data['idx']==idx_mid_decel,'propBoutAligned_pitch'].reset_index(drop=True)
+    displ = get_swim_displ(bout_frames['propBoutAligned_speed'], bout_frames['propBoutAligned_x'], bout_frames['propBoutAligned_y'], 4)
 
     this_exp_features = this_exp_features.assign(rot_total=this_exp_features['pitch_end']-this_exp_features['pitch_initial'],
                                                  rot_bout = this_exp_features['pitch_post_bout']-this_exp_features['pitch_pre_bout'],
@@ -118,7 +178,7 @@ def get_bout_features(root, FRAME_RATE,**kwargs):
         cond1 = all_conditions[condition_idx].split("_")[0]
         cond2 = all_conditions[condition_idx].split("_")[1]
         # enter each condition folder (e.g. 7dd_ctrl)
-        for subpath, subdir_list, subfile_list in os.walk(folder):
+        for subpath, subdir_list, subfile_list in walk_data_dirs(folder):
             # if folder is not empty
             if subdir_list:
                 # reset for each condition
@@ -127,7 +187,6 @@ def get_bout_features(root, FRAME_RATE,**kwargs):
                 # loop through each sub-folder (experiment) under each condition
                 for expNum, exp in enumerate(subdir_list):
                     # angular velocity (angVel) calculation
-                    rows = []
                     # night_rows = []
                     # for each sub-folder, get the path
                     exp_path = os.path.join(subpath, exp)
@@ -142,8 +201,7 @@ def get_bout_features(root, FRAME_RATE,**kwargs):
                     bout_time = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout2').loc[:,'aligned_time']
                     
                     # truncate first, just incase some aligned bouts aren't complete
-                    for i in bout_time.index:
-                        rows.extend(list(range(i*total_aligned+round_half_up(idxRANGE[0]),i*total_aligned+round_half_up(idxRANGE[1]))))
+                    rows = get_aligned_rows(bout_time.index, total_aligned, [round_half_up(idxRANGE[0]), round_half_up(idxRANGE[1])])
                     
                     # assign bout numbers
                     trunc_exp_data = exp_data.loc[rows,:]
@@ -213,7 +271,7 @@ def get_max_angvel_rot(root, FRAME_RATE,**kwargs):
     # go through each condition folders under the root
     for condition_idx, folder in enumerate(folder_paths):
         # enter each condition folder (e.g. 7dd_ctrl)
-        for subpath, subdir_list, subfile_list in os.walk(folder):
+        for subpath, subdir_list, subfile_list in walk_data_dirs(folder):
             # if folder is not empty
             if subdir_list:
                 # reset for each condition
@@ -221,7 +279,6 @@ def get_max_angvel_rot(root, FRAME_RATE,**kwargs):
                 subdir_list.sort()
                 # loop through each sub-folder (experiment) under each condition
                 for expNum, exp in enumerate(subdir_list):
-                    rows = []
                     exp_path = os.path.join(subpath, exp)
                     exp_data = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout_aligned')
                     exp_data = exp_data.assign(idx=round_half_up(len(exp_data)/total_aligned)*list(range(0,total_aligned)))
@@ -230,8 +287,7 @@ def get_max_angvel_rot(root, FRAME_RATE,**kwargs):
                     bout_time = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout2')
                     
                     # truncate first, just incase some aligned bouts aren't complete
-                    for i in day_night_split(bout_time,'aligned_time').index:
-                        rows.extend(list(range(i*total_aligned+idxRANGE[0],i*total_aligned+idxRANGE[1])))
+                    rows = get_aligned_rows(day_night_split(bout_time,'aligned_time').index, total_aligned, idxRANGE)
                     selected_range = exp_data.loc[rows,:]
                     
                     # calculate angular vel (smoothed)
@@ -2,13 +2,13 @@ import os,glob
 import pandas as pd # pandas library
 import numpy as np # numpy
 from plot_functions.plt_tools import day_night_split
-from plot_functions.get_index import get_index
+from plot_functions.get_index import (get_index, get_aligned_rows)
 from plot_functions.plt_tools import jackknife_list
 from plot_functions.get_bout_features import (get_bout_features,extract_bout_features_v5)
 from numpy.polynomial.polynomial import Polynomial
 from scipy.stats import pearsonr 
 from scipy.optimize import curve_fit
-from plot_functions.plt_tools import round_half_up
+from plot_functions.plt_tools import round_half_up, walk_data_dirs
 
 
 def sigmoid_fit2(x_val, y_val,func,revFunc,**kwargs):
@@ -123,7 +123,7 @@ def get_bout_kinematics(root, FRAME_RATE,**kwargs):
     # go through each condition folders under the root
     for condition_idx, folder in enumerate(folder_paths):
         # enter each condition folder (e.g. 7dd_ctrl)
-        for subpath, subdir_list, subfile_list in os.walk(folder):
+        for subpath, subdir_list, subfile_list in walk_data_dirs(folder):
             # if folder is not empty
             if subdir_list:
                 # reset for each condition
@@ -133,7 +133,6 @@ def get_bout_kinematics(root, FRAME_RATE,**kwargs):
                 # loop through each sub-folder (experiment) under each condition
                 for expNum, exp in enumerate(subdir_list):
                     # angular velocity (angVel) calculation
-                    rows = []
                     night_rows = []
                     # for each sub-folder, get the path
                     exp_path = os.path.join(subpath, exp)
@@ -147,8 +146,7 @@ def get_bout_kinematics(root, FRAME_RATE,**kwargs):
                     bout_time = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout2').loc[:,'aligned_time']
                     
                     # truncate first, just incase some aligned bouts aren't complete
-                    for i in bout_time.index:
-                        rows.extend(list(range(i*total_aligned+round_half_up(idxRANGE[0]),i*total_aligned+round_half_up(idxRANGE[1]))))
+                    rows = get_aligned_rows(bout_time.index, total_aligned, [round_half_up(idxRANGE[0]), round_half_up(idxRANGE[1])])
                     
                     # assign bout numbers
                     trunc_exp_data = exp_data.loc[rows,:]
@@ -1,7 +1,41 @@
 import math
+import numpy as np
 
 def get_index(fr):
     peak_idx = math.ceil(0.5 * fr)
     total_aligned = math.ceil(0.5 * fr) + math.ceil(0.3 * fr) +1
     
-    return peak_idx, total_aligned
\ No newline at end of file
+    return peak_idx, total_aligned
+
+def get_aligned_rows(bout_index, total_aligned, idxRANGE):
+    """row numbers of frames idxRANGE[0] to idxRANGE[1]-1 of selected bouts in prop_bout_aligned, which has total_aligned rows per bout.
+    Same as extending range(i*total_aligned+idxRANGE[0], i*total_aligned+idxRANGE[1]) for each bout i, without building a list
+
+    Args:
+        bout_index (array): index of bouts (rows in prop_bout2), e.g. day_night_split(bout_time,'aligned_time').index
+        total_aligned (int): number of frames of each aligned bout, see get_index()
+        idxRANGE (list): [start, end) frames of each bout
+
+    Returns:
+        ndarray: row numbers, frames of the first selected bout followed by the second...
+    """
+    bout_index = np.asarray(bout_index, dtype='int64')
+    return (bout_index[:, np.newaxis] * total_aligned + np.arange(idxRANGE[0], idxRANGE[1])).ravel()
+
+def get_aligned_frames(values, bout_index, total_aligned, idxRANGE):
+    """frames idxRANGE[0] to idxRANGE[1]-1 of selected bouts as an array of (bouts, frames) or (bouts, frames, columns)
+
+    Args:
+        values (array): values of prop_bout_aligned, one or more columns, total_aligned rows per bout
+        bout_index (array): index of bouts (rows in prop_bout2). None for all bouts
+        total_aligned (int): number of frames of each aligned bout, see get_index()
+        idxRANGE (list): [start, end) frames of each bout
+
+    Returns:
+        ndarray: frames of each bout. A view of values if bout_index is None
+    """
+    values = np.asarray(values)
+    aligned = values.reshape((-1, total_aligned) + values.shape[1:])
+    if bout_index is None:
+        return aligned[:, idxRANGE[0]:idxRANGE[1]]
+    return aligned[np.asarray(bout_index, dtype='int64'), idxRANGE[0]:idxRANGE[1]]
@@ -5,8 +5,26 @@ import numpy as np
 from decimal import Decimal
 import decimal
 import matplotlib.pyplot as plt
+import os
 
 
+# folder of Parquet datasets saved in data folders by SAMPL_analysis(..., output_backend='parquet')
+PARQUET_DIR = 'parquet'
+
+def walk_data_dirs(root):
+    """os.walk() through data folders under root, skipping Parquet datasets and hidden folders (such as the .dlm cache) saved in data folders by SAMPL_analysis
+
+    Args:
+        root (str): data directory
+
+    Yields:
+        tuple: (path, dir_list, file_list) of each folder, same as os.walk()
+    """
+    for path, dir_list, file_list in os.walk(root):
+        # dir_list is edited inplace, so that os.walk() doesn't enter skipped folders
+        dir_list[:] = [folder for folder in dir_list if folder != PARQUET_DIR and not folder.startswith('.')]
+        yield path, dir_list, file_list
+
 def round_half_up(var):
     """round half up
 
@@ -16,48 +16,93 @@
 
 import sys
 import os,glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from bout_analysis import grab_fish_angle_v5
 from bout_analysis.logger import log_SAMPL_ana
 
 from tqdm import tqdm
 
-def SAMPL_analysis(root,frame_rate):
+def find_dlm_folders(root):
+    """Find all folders containing .dlm files under the root directory
+
+    Args:
+        root (string): directory of behavior data to be analyzed
+
+    Returns:
+        list: (folder, filenames) of each folder, root first, then subfolders in alphabetical order
+    """
+    dlm_folders = []
+    # determine if dlm is under root folder
+    filenames = glob.glob(os.path.join(root,"*.dlm"))
+    if filenames:
+        dlm_folders.append((root, filenames))
+    for path, dir_list, file_list in os.walk(root): # look for dlm in all subfolders
+        # loop through each subfolder
+        dir_list.sort()
+        for folder_name in dir_list:
+            # get the folder dir by joining path and subfolder name
+            folder = os.path.join(path, folder_name)
+            filenames = glob.glob(os.path.join(folder,"*.dlm"))
+            if filenames:
+                dlm_folders.append((folder, filenames))
+    return dlm_folders
+
+def analyze_folder(folder, filenames, frame_rate, **kwargs):
+    """Extract bouts from .dlm files in one folder. Runs in worker processes if SAMPL_analysis() is called with folder_workers > 1
+
+    Args:
+        folder (string): directory of the folder
+        filenames (list): .dlm files in the folder
+        frame_rate (int): Frame rate
+        ---kwargs---
+        passed to grab_fish_angle_v5.run()
+
+    Returns:
+        int: number of .dlm files analyzed
+    """
+    print(f"\n\n- In {folder}")
+    grab_fish_angle_v5.run(filenames, folder, frame_rate, **kwargs)
+    return len(filenames)
+
+def SAMPL_analysis(root,frame_rate,**kwargs):
     """Analyze behavior data. Extract bouts. Align bouts.
 
     Args:
         root (string): directory of behavior data to be analyzed. Data in all subfolders of the root directory will be analyzed. .dlm files in the same folder will be combined for bout extraction.
         frame_rate (int): Frame rate 
+        ---kwargs---
+        folder_workers (int): number of folders to analyze in parallel processes. Folders with more .dlm data are started first. Defaults to 1, folders are analyzed one by one.
+        other kwargs are passed to grab_fish_angle_v5.run(), e.g. dlm_cache=True to cache parsed .dlm files for faster reruns
     """
+    folder_workers = 1
+    run_kwargs = {}
+    for key, value in kwargs.items():
+        if key == 'folder_workers':
+            folder_workers = value
+        else:
+            run_kwargs[key] = value
+
     logger = log_SAMPL_ana('SAMPL_ana_log')
     logger.info(f"Analysis Started!")
     logger.info(f"Root dir: {root}")
     logger.info(f"Frame Rate: {frame_rate}")
-    # for progress bar and time estimation (2022.0126 update)
-    dlm_files_count = 0
-    for _, _, files in os.walk(root):
-        dlm_files_count = dlm_files_count + len([dlm_files for dlm_files in files if ".dlm" in dlm_files])
+    # find all folders first, for progress bar and scheduling
+    dlm_folders = find_dlm_folders(root)
+    dlm_files_count = sum(len(filenames) for _, filenames in dlm_folders)
 
-    all_folders = os.walk(root)
     with tqdm(total=dlm_files_count) as pbar:  # Do tqdm
-
-        # determine if dlm is under root folder
-        filenames = glob.glob(os.path.join(root,"*.dlm"))
-        if filenames:  # if dlm under root, process them
-            print(f"\n\n- In {root}")
-            grab_fish_angle_v5.run(filenames, root, frame_rate)
-            pbar.update(len(filenames)) # update progress bar after processing dlm in the current folder
-
-        for path, dir_list, file_list in all_folders: # look for dlm in all subfolders
-            # loop through each subfolder
-            dir_list.sort()
-            for folder_name in dir_list:
-                # get the folder dir by joining path and subfolder name
-                folder = os.path.join(path, folder_name)
-                filenames = glob.glob(os.path.join(folder,"*.dlm"))
-                if filenames:
-                    print(f"\n\n- In {folder}")
-                    grab_fish_angle_v5.run(filenames, folder,frame_rate)
-                    pbar.update(len(filenames)) # update progress bar after processing dlm in the current folder
+        if folder_workers > 1 and len(dlm_folders) > 1:
+            # largest folders first so that they don't end up running alone at the end
+            dlm_folders.sort(key=lambda f: sum(os.path.getsize(file) for file in f[1]), reverse=True)
+            # files within each folder are analyzed one by one to avoid oversubscribing cores
+            run_kwargs['workers'] = 1
+            with ProcessPoolExecutor(max_workers=min(folder_workers, len(dlm_folders))) as executor:
+                futures = [executor.submit(analyze_folder, folder, filenames, frame_rate, **run_kwargs) for folder, filenames in dlm_folders]
+                for future in as_completed(futures):
+                    pbar.update(future.result()) # update progress bar after processing dlm in each folder
+        else:
+            for folder, filenames in dlm_folders:
+                pbar.update(analyze_folder(folder, filenames, frame_rate, **run_kwargs)) # update progress bar after processing dlm in the current folder
 
 
 if __name__ == "__main__":
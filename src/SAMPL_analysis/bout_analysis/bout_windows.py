@@ -0,0 +1,218 @@
+'''
+Swim window detection using run-length encoding
+Functions:
+    1. Flag frames with swim speed above threshold (swim indicator)
+    2. Assign locomotion indices to runs of swim/non-swim frames. Swim windows have odd indices
+    3. Link swim windows separated by short intervals
+    4. Assign frames to bout windows around the peak speed of each swim window
+    5. Look up first and last frames of epochs, gather values in windows for per-bout calculations
+
+A run is a series of consecutive frames with the same swim indicator. All calculations are done on the start and end frames of runs, instead of scanning all frames for each run.
+Locomotion indices are the same as swimIndicator.diff().abs().cumsum(), the first frame has NaN as its locomotion index.
+
+To use, run find_swim_windows(), which returns swim indicators and locomotion indices before and after linking swim windows. get_swim_windows() returns start and end frames of each swim window.
+assign_bout_windows() returns (frame, bout) pairs of bout windows, which are limited to the epoch of the peak.
+get_epoch_index() maps epoch numbers to their first and last frames. gather_windows() collects values in windows of variable length into a 2D array, one row per window, for vectorized per-bout calculations.
+'''
+
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from bout_analysis.kernels import if_jit, link_swim_gaps
+
+def get_swim_indicator(swim_speed, epoch_num, speed_threshold):
+    """Flag frames with swim speed above threshold
+
+    Args:
+        swim_speed (array): swim speed of each frame
+        epoch_num (array): epoch number of each frame
+        speed_threshold (float): speed threshold for swim frames
+
+    Returns:
+        ndarray: swim indicator, 1 for swim, 0 for not swim
+    """
+    swim_indicator = (np.asarray(swim_speed) >= speed_threshold).astype(int)
+    # epochs are set to start with a non-swim frame: the first frame of epochs with all frames above threshold is set to 0
+    epoch_codes, epoch_index = pd.factorize(np.asarray(epoch_num))
+    all_swim = np.bincount(epoch_codes, weights=1-swim_indicator, minlength=len(epoch_index)) == 0
+    first_frames = np.unique(epoch_codes, return_index=True)[1]
+    swim_indicator[first_frames[all_swim]] = 0
+    return swim_indicator
+
+def get_loco_index(swim_indicator):
+    """Assign a locomotion index to each run of swim/non-swim frames. Runs of swim frames have odd indices
+
+    Args:
+        swim_indicator (array): swim indicator of each frame
+
+    Returns:
+        ndarray: locomotion index, float. NaN for the first frame
+    """
+    loco_index = np.empty(len(swim_indicator), dtype='float64')
+    loco_index[:1] = np.nan
+    np.cumsum(np.abs(np.diff(swim_indicator)), out=loco_index[1:])
+    return loco_index
+
+def get_runs(loco_index):
+    """Get start and end frames of runs
+
+    Args:
+        loco_index (array): locomotion index of each frame
+
+    Returns:
+        ndarray: start frame of each run (position)
+        ndarray: end frame of each run (position), inclusive
+        ndarray: locomotion index of each run
+    """
+    loco_index = np.asarray(loco_index)
+    if len(loco_index) < 2:
+        empty = np.array([], dtype=int)
+        return empty, empty, np.array([], dtype='float64')
+    # the first frame has no locomotion index, runs start from the second frame
+    changes = np.flatnonzero(loco_index[2:] != loco_index[1:-1]) + 2
+    starts = np.concatenate(([1], changes))
+    ends = np.concatenate((changes - 1, [len(loco_index) - 1]))
+    return starts, ends, loco_index[starts]
+
+def get_swim_windows(loco_index):
+    """Get start and end frames of swim windows (runs with odd locomotion indices)
+
+    Args:
+        loco_index (array): locomotion index of each frame
+
+    Returns:
+        DataFrame: locoIDX, start, end (positions, inclusive) of each swim window
+    """
+    starts, ends, values = get_runs(loco_index)
+    is_swim = values % 2 == 1
+    return pd.DataFrame({
+        'locoIDX':values[is_swim],
+        'start':starts[is_swim],
+        'end':ends[is_swim],
+    })
+
+def link_swim_windows(swim_indicator, loco_index, abs_time, min_swim_interval):
+    """Link swim windows closer than min_swim_interval by setting frames between them as swim
+
+    Args:
+        swim_indicator (array): swim indicator of each frame
+        loco_index (array): locomotion index of each frame, see get_loco_index()
+        abs_time (array): datetime of each frame
+        min_swim_interval (float): minimum interval between swim windows in seconds
+
+    Returns:
+        ndarray: adjusted swim indicator
+    """
+    starts, ends, values = get_runs(loco_index)
+    swim_runs = np.flatnonzero(values % 2 == 1)
+    abs_time = np.asarray(abs_time)
+    # delay between swim windows = start of the next swim window - end of the current one
+    swim_delay = abs_time[starts[swim_runs[1:]]] - abs_time[ends[swim_runs[:-1]]]
+    # runs between linked swim windows
+    gap_runs = swim_runs[:-1][swim_delay < np.timedelta64(timedelta(seconds=min_swim_interval))] + 1
+    # mark frames of gap runs: +1 at the start and -1 after the end of each gap run
+    gap_marks = np.zeros(len(swim_indicator)+1, dtype=int)
+    gap_marks[starts[gap_runs]] += 1
+    gap_marks[ends[gap_runs]+1] -= 1
+    swim_indicator_adj = np.array(swim_indicator, copy=True)
+    swim_indicator_adj[np.cumsum(gap_marks[:-1]) > 0] = 1
+    return swim_indicator_adj
+
+def find_swim_windows(swim_speed, epoch_num, abs_time, speed_threshold, min_swim_interval, jit=False):
+    """Find swim windows and link swim windows separated by short intervals
+
+    Args:
+        swim_speed (array): swim speed of each frame
+        epoch_num (array): epoch number of each frame
+        abs_time (array): datetime of each frame
+        speed_threshold (float): speed threshold for swim frames
+        min_swim_interval (float): minimum interval between swim windows in seconds
+        jit (bool, optional): whether to link swim windows with the compiled kernel, see kernels.py. Defaults to False.
+
+    Returns:
+        dict: swimIndicator, locoIDX before linking, swimIndicatorAdj, locoIDXadj after linking
+    """
+    swim_indicator = get_swim_indicator(swim_speed, epoch_num, speed_threshold)
+    loco_index = get_loco_index(swim_indicator)
+    if if_jit(jit):
+        swim_indicator_adj = link_swim_gaps(swim_indicator, abs_time, min_swim_interval)
+    else:
+        swim_indicator_adj = link_swim_windows(swim_indicator, loco_index, abs_time, min_swim_interval)
+    return {
+        'swimIndicator':swim_indicator,
+        'locoIDX':loco_index,
+        'swimIndicatorAdj':swim_indicator_adj,
+        'locoIDXadj':get_loco_index(swim_indicator_adj),
+    }
+
+def get_epoch_bounds(epoch_num):
+    """Get first and last frames of epochs. An epoch is a series of consecutive frames with the same epoch number
+
+    Args:
+        epoch_num (array): epoch number of each frame
+
+    Returns:
+        ndarray: first frame of each epoch (position)
+        ndarray: last frame of each epoch (position), inclusive
+    """
+    epoch_num = np.asarray(epoch_num)
+    changes = np.flatnonzero(epoch_num[1:] != epoch_num[:-1]) + 1
+    epoch_first = np.concatenate(([0], changes))
+    epoch_last = np.concatenate((changes - 1, [len(epoch_num) - 1]))
+    return epoch_first, epoch_last
+
+def assign_bout_windows(peak_idx, epoch_num, half_window):
+    """Assign frames within half_window of each peak to bout windows. Bout windows do not cross epochs.
+    Frames may be assigned to more than one bout if bout windows overlap.
+
+    Args:
+        peak_idx (array): frame (position) of the peak speed of each bout, in ascending order
+        epoch_num (array): epoch number of each frame
+        half_window (int): number of frames before and after the peak
+
+    Returns:
+        ndarray: frame (position) of each (frame, bout) pair
+        ndarray: bout index of each (frame, bout) pair, starting from 0
+    """
+    peak_idx = np.asarray(peak_idx, dtype=int)
+    epoch_first, epoch_last = get_epoch_bounds(epoch_num)
+    # epoch of each peak
+    peak_epoch = np.searchsorted(epoch_first, peak_idx, side='right') - 1
+    window_start = np.maximum(peak_idx - half_window, epoch_first[peak_epoch])
+    window_end = np.minimum(peak_idx + half_window, epoch_last[peak_epoch])
+    window_len = window_end - window_start + 1
+    bout_index = np.repeat(np.arange(len(peak_idx)), window_len)
+    # position of each frame within its bout window
+    frame_in_window = np.arange(window_len.sum()) - np.repeat(np.cumsum(window_len) - window_len, window_len)
+    frame_index = np.repeat(window_start, window_len) + frame_in_window
+    return frame_index, bout_index
+
+def get_epoch_index(epoch_num):
+    """Get first and last frames of each epoch number. Same as df.loc[df['epochNum']==epoch].index.min() and .max() for a df with default index
+
+    Args:
+        epoch_num (array): epoch number of each frame
+
+    Returns:
+        DataFrame: first and last frame (positions) of each epoch, indexed by epochNum
+    """
+    frames = pd.Series(np.arange(len(epoch_num)))
+    return frames.groupby(np.asarray(epoch_num), sort=False).agg(first='min', last='max')
+
+def gather_windows(values, window_start, window_end, width, fill=np.nan):
+    """Gather values of frames [start, end] of each window into a 2D array. Frames outside the window or outside values are filled
+
+    Args:
+        values (array): values of each frame
+        window_start (array): first frame (position) of each window
+        window_end (array): last frame (position) of each window, inclusive
+        width (int): number of columns of the output, should be >= the longest window
+        fill (optional): value for padding. Defaults to np.nan.
+
+    Returns:
+        ndarray: shape (windows, width), row i contains values[window_start[i]:window_end[i]+1]
+    """
+    values = np.asarray(values)
+    frames = np.asarray(window_start)[:,None] + np.arange(width)
+    in_window = (frames >= 0) & (frames <= np.asarray(window_end)[:,None]) & (frames < len(values))
+    return np.where(in_window, values[np.clip(frames, 0, max(len(values)-1, 0))], fill)
@@ -33,17 +33,64 @@ import configparser
 import pandas as pd # pandas library
 import numpy as np # numpy
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 import time
 from datetime import datetime
 from datetime import timedelta
 import math
-from preprocessing.read_dlm import read_dlm
+import uuid
+from preprocessing.read_dlm import read_dlm, iter_dlm, DEFAULT_CHUNK_SIZE
+from preprocessing.dlm_cache import DEFAULT_CACHE_BUDGET
 from preprocessing.analyze_dlm_v5 import analyze_dlm_resliced
+from preprocessing.epoch_ops import smooth_segments_ML, get_epoch_segments, to_segments, segment_max
+from preprocessing.epoch_filters import apply_epoch_filters, sum_qc
+from preprocessing.compact import compact_dtypes
 from bout_analysis.logger import log_SAMPL_ana
+from bout_analysis.bout_windows import find_swim_windows, get_swim_windows, assign_bout_windows, get_epoch_index, gather_windows
+from bout_analysis.window_gather import gather_aligned, gather_window_array, get_window_frames, window_array_to_table, gather_ragged
+from bout_analysis.window_stats import get_prefix_sums, window_means
+from bout_analysis.iei_windows import get_IEI_values, get_IEI_timed
+from bout_analysis.kernels import window_argmax, smooth_diff_argmax
+from bout_analysis.hdf_output import write_outputs, write_aligned_bouts, remove_aligned_bouts, DEFAULT_COMPLIB, DEFAULT_COMPLEVEL
+from bout_analysis.parquet_output import write_parquet_outputs, remove_parquet_outputs, get_dlm_date
 
 global program_version
 program_version = 'v5.0.221212'
 
+# bout category codes saved as propBout_category in prop_bout2, bit flags
+# bit 0: nose-up (hUp) if set, nose-down (hDn) if not. bit 1: flat, net pitch change within 3 deg
+CATEGORY_HUP = 1
+CATEGORY_FLAT = 2
+
+# columns of output tables holding row numbers of grabbed_all, bout numbers, IEI numbers and epoch numbers (position in epoch_attributes)
+# in streaming mode, these are offset by the rows/bouts/IEIs/epochs of previous chunks, see offset_chunk_positions()
+POSITION_COLUMNS = {
+    'rows':{
+        'bout_attributes':['peak_idx','swim_start_idx','swim_end_idx','bout_start_idx','bout_end_idx','boutInflectAlign','boutAccAlign'],
+        'prop_bout2':['epochBouts_indices'],
+        'prop_bout_aligned_long2':['boutAlignLong'],
+        'IEI_attributes':['swim_start_idx','swim_end_idx','swim_end_shift'],
+        'heading_matched':['dfIdx'],
+    },
+    'bouts':{
+        'bout_attributes':['boutNum'],
+        'prop_bout2':['propBout_matchIndex'],
+        'prop_bout_aligned_long2':['bout_matchIndex'],
+        'IEI_attributes':['boutNum'],
+        'prop_bout_IEI2':['boutNum'],
+    },
+    'IEIs':{
+        'prop_bout_IEI2':['IEI_matchIndex'],
+        'wolpert_IEI':['IEI_matchIndex'],
+    },
+    'epochs':{
+        'epoch_attributes':['index'],
+    },
+}
+# output table counted by each offset
+POSITION_TABLES = {'rows':'grabbed_all', 'bouts':'bout_attributes', 'IEIs':'prop_bout_IEI2', 'epochs':'epoch_attributes'}
+
 # %%
 # Define functions
 
@@ -101,13 +148,9 @@ def smooth_series_ML(a,WSZ):
     a: NumPy 1-D array containing the data to be smoothed
     WSZ: smoothing window size needs, which must be odd number,
     as in the original MATLAB implementation
+    The whole series is smoothed as one segment, see epoch_ops.smooth_segments_ML()
     '''
-    out0 = np.convolve(a,np.ones(WSZ,dtype=int),'valid')/WSZ
-    r = np.arange(1,WSZ-1,2)
-    start = np.cumsum(a[:WSZ-1])[::2]/r
-    stop = (np.cumsum(a[:-WSZ:-1])[::2]/r)[::-1]
-    res = np.concatenate((  start , out0, stop  ))
-    return pd.Series(data=res, index=a.index)
+    return pd.Series(data=smooth_segments_ML(a, [0, len(a)], WSZ), index=a.index)
 
 def smooth_ML(a,WSZ):
     '''
@@ -135,17 +178,60 @@ def smooth_ML(a,WSZ):
 # analyzed = pd.read_pickle(filenames[file_i])
 # fish_length = pd.read_pickle(f"./data/{file_i+1}_fish_length.pkl")
 
-def grab_fish_angle(analyzed, fish_length,sample_rate):
+def split_aligned_columns(bout_res, bout_category, n_frames):
+    """Copy aligned angVel, speed and pitch of nose-up, nose-down and flat bouts into _hUp, _hDn and _flat columns, NaN for other bouts.
+    Columns of each category are added in the order of the first bout of the category, hUp/hDn before flat. Categories without bouts are not added.
+
+    Args:
+        bout_res (DataFrame): aligned bout data, bout-major with n_frames rows per bout
+        bout_category (array): category code of each bout, see CATEGORY_HUP and CATEGORY_FLAT
+        n_frames (int): number of frames per bout
+
+    Returns:
+        DataFrame: bout_res with category columns
+    """
+    if_hUp = (bout_category & CATEGORY_HUP) > 0
+    bout_groups = {
+        'hUp':if_hUp,
+        'hDn':~if_hUp,
+        'flat':(bout_category & CATEGORY_FLAT) > 0,
+    }
+    group_order = sorted([(np.argmax(if_group), group_i, group) for group_i, (group, if_group) in enumerate(bout_groups.items()) if if_group.any()])
+    for _, _, group in group_order:
+        if_group_frames = np.repeat(bout_groups[group], n_frames)
+        for col in ['angVel', 'speed', 'pitch']:
+            bout_res[f'propBoutAligned_{col}_{group}'] = np.where(if_group_frames, bout_res[f'propBoutAligned_{col}'].values, np.nan)
+    return bout_res
+
+def grab_fish_angle(analyzed, fish_length,sample_rate, **kwargs):
     """    Function to analyze epochs, find bouts, and calculate things we care
 
     Args:
         analyzed (DataFrame): 
         fish_length (int): 
         sample_rate (int): 
+        ---kwargs---
+        split_aligned (bool): whether to save nose-up/nose-down/flat copies of aligned angVel, speed and pitch (_hUp, _hDn, _flat columns) in prop_bout_aligned. Defaults to False, use propBout_category in prop_bout2 to split bouts.
+        epoch_qc (list): rejection count table of the swim speed epoch filter is appended to this list. Defaults to None.
+        compact (bool): whether to convert output dataframes to compact data types, see preprocessing/compact.py. Defaults to False.
+        jit (bool): whether to use compiled kernels for swim window linking, peak search and bout alignment, see kernels.py. Defaults to False. NumPy is used if numba is not installed.
 
     Returns:
         dict: one dictionary with multiple dataframes
     """
+    split_aligned = False
+    epoch_qc = []
+    compact = False
+    jit = False
+    for key, value in kwargs.items():
+        if key == 'split_aligned':
+            split_aligned = value
+        elif key == 'epoch_qc':
+            epoch_qc = value
+        elif key == 'compact':
+            compact = value
+        elif key == 'jit':
+            jit = value
     # %%
     # Constants
     PROPULSION_THRESHOLD = 5  # mm/s, speed threshold above which samples are considered propulsion
@@ -182,9 +268,12 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
     frame_number125 = int(0.125*SAMPLE_RATE) # 125ms, 5 at 40Hz
 
     # find epochs with max speed above threshold
-    df = grp_by_epoch(analyzed).filter(
-        lambda g: np.nanmax(g['swimSpeed'].values) >= PROPULSION_THRESHOLD
-    ).reset_index(drop=True)
+    order, offsets = get_epoch_segments(analyzed['epochNum'].values)
+    df, qc = apply_epoch_filters(analyzed, {
+        'swimSpeed': segment_max(to_segments(analyzed['swimSpeed'].values, order), offsets) >= PROPULSION_THRESHOLD,
+    }, order, offsets)
+    df = df.reset_index(drop=True)
+    epoch_qc.append(qc)
     
     if len(df) < 3:    # if no epoch found
         return "> not enough epoches > dlm file skipped"
@@ -221,53 +310,27 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
     # 4. apply diff().abs().cumsum() to 'swimIndicator', assign values to a new column 'locoIdx' (locomotion index). In 'locoIdx', a unique index is assigned for each window with a swim speed below or above the threshold. All windows that are identified as swim activities have odd indices and those with swim speed below the threshold have even indices
     # 5. filter for inter swim duration. Link 2 fast swim windows (odd locoIdx) that are closer than MIN_SWIM_INTERVAL by changing swimIndicators of the window between them (even locoIdx) from 0 to 1
     # 6. repeat step 4 to calculate adjusted locomotion indices
+    # Steps 4-6 only use the start and end frames of each window (run-length encoding), see bout_windows.py
 
     # %%
     # Find swim windows
 
     speed_threshold = PROPULSION_THRESHOLD
-    spd_window = df[['epochNum','absTime','swimSpeed','angVel']]
-    # assign boolean to determine whether swim speed excede threshold
-    spd_window = spd_window.assign(
-        ifSwim = spd_window['swimSpeed']>= speed_threshold
-    )
-    # transfer boolean to int
-    spd_window = spd_window.assign(
-        swimIndicator = (spd_window['ifSwim']==True).astype(int)
-    )
-    # exclude bouts that start at the beginning of epochs by setting the beginning of each epoch to 0
-    spd_window.loc[grp_by_epoch(spd_window)['swimIndicator'].transform('idxmin'), 'swimIndicator'] = 0
-    # use cumsum to generate swim indices. All swims faster than threshold should have odd swim indices
-    spd_window = spd_window.assign(
-        locoIDX = spd_window['swimIndicator'].diff().abs().cumsum()
-    )
-
-    # %%
+    # steps 2-6 are done on runs of swim/non-swim frames in bout_windows.find_swim_windows()
     # NOTE, MANUALLY CAPPING DETECTED FREQUENCY at 10HZ
     # check if SpdWindStarts are realistically delayed from each other to constitute separate bouts. If not, link these bouts.
-    # get the first timepoint of each swim window
-    fast_win_st = grp_by_swim(spd_window,'locoIDX')[['locoIDX', 'absTime']].head(1)
-    fast_win_ed = grp_by_swim(spd_window,'locoIDX')[['locoIDX', 'absTime']].tail(1).reset_index(drop=True)
-    # delay between fast windows = fast_win_st[i+1] - fast_win_ed[i], therefore, drop the first fast window start
-    fast_win_st_shift = fast_win_st.iloc[1:].reset_index(drop=True)
-    # initialize the locomotion index adjustment calculator as a dataframe
-    loco_idx_adj_calculator = fast_win_ed[['locoIDX']]
-    # calculate swim delays (bout intervals).
-    loco_idx_adj_calculator = loco_idx_adj_calculator.assign(swimDelay = fast_win_st_shift['absTime'] - fast_win_ed['absTime'])
     #  In the matlab code, each speed window ends at the first frame when swim speed drops below threshold.
     #  Here, the fast_win_ed is the last frame above threshold.
-    # loco_idx_adj_calculator['swimDelay'] = loco_idx_adj_calculator['swimDelay'] - timedelta(seconds=1/SAMPLE_RATE)
-    # only keep bouts with delay > 0.1
-    loco_idx_adj = loco_idx_adj_calculator.loc[loco_idx_adj_calculator['swimDelay'] < timedelta(seconds=MIN_SWIM_INTERVAL),'locoIDX']
-    # get locomotion indices of the slow windows to adjust
-    loco_idx_adj = loco_idx_adj + 1
-
-    spd_window_adj = spd_window.copy()
-    for window_idx in loco_idx_adj:
-        spd_window_adj.loc[spd_window_adj.locoIDX==window_idx,'swimIndicator']=1
-
+    swim_windows = find_swim_windows(df['swimSpeed'].values, df['epochNum'].values, df['absTime'].values, speed_threshold, MIN_SWIM_INTERVAL, jit=jit)
+    spd_window_adj = df[['epochNum','absTime','swimSpeed','angVel']]
     spd_window_adj = spd_window_adj.assign(
-        locoIDXadj = spd_window_adj['swimIndicator'].diff().abs().cumsum()
+        # assign boolean to determine whether swim speed excede threshold
+        ifSwim = spd_window_adj['swimSpeed']>= speed_threshold,
+        # swim indicator after linking swim windows
+        swimIndicator = swim_windows['swimIndicatorAdj'],
+        # All swims faster than threshold should have odd swim indices
+        locoIDX = swim_windows['locoIDX'],
+        locoIDXadj = swim_windows['locoIDXadj'],
     )
 
     print(".", end = '')
@@ -279,31 +342,14 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
     # First, get the theoretical bout windows based on the peak swim speed
 
     # grab the index of the rows with maximun swim speed within each swim window
-    swim_spd_peak_idx = grp_by_swim(spd_window_adj,'locoIDXadj')['swimSpeed'].idxmax().swimSpeed  # added .swimSpeed for pandas 1.2 to drop the first col which is group keys
-    # calculate the starts and ends of bout windows
-    bout_window = pd.concat({
-        'start':swim_spd_peak_idx-BOUT_WINDOW_HALF,
-        'end':swim_spd_peak_idx+BOUT_WINDOW_HALF,
-        'peak':swim_spd_peak_idx
-    }, axis=1)
-
-    # Then, check bout windows for every bouts within each epoch. Assign bout indices for grouping bouts
-
-    # to avoid the new bout windows from crossing epochs, first, make an epoch generator
-    grouped_epoch = iter(grp_by_epoch(spd_window_adj))
-    # initialize a new dataframe
-    spd_bout_window = pd.DataFrame()
-    # get the first epoch
-    current_epoch = pd.DataFrame(next(grouped_epoch)[1])
-    # loop through bout_window, unpack start, end and peak for convenience
-    for i, (start, end, peak) in bout_window.iterrows():
-        # for each bout check if it is within the current epoch
-        if peak > current_epoch.index[-1]:
-            # if the peak of the bout is out of the current epoch, move to the next epoch
-            current_epoch = pd.DataFrame(next(grouped_epoch)[1])
-        # assign a bout index to the new bout window. index = i. start from 0
-        # bout indices are only assigned to rows within the current epoch
-        spd_bout_window = pd.concat([spd_bout_window,current_epoch.loc[start:end].assign(boutIDX = i)])
+    # same as grp_by_swim(spd_window_adj,'locoIDXadj')['swimSpeed'].idxmax()
+    swim_window_frames = get_swim_windows(swim_windows['locoIDXadj'])
+    swim_spd_peak_idx = pd.Series(window_argmax(df['swimSpeed'].values, swim_window_frames['start'].values, swim_window_frames['end'].values, jit=jit).astype('int64'))
+    # Then, assign bout indices for grouping bouts. Bout windows are +/- BOUT_WINDOW_HALF around the peaks.
+    # to avoid the new bout windows from crossing epochs, bout windows are truncated at the first and last frames of the epoch containing the peak
+    # bout index = i, start from 0
+    frame_index, bout_index = assign_bout_windows(swim_spd_peak_idx.values, spd_window_adj['epochNum'].values, BOUT_WINDOW_HALF)
+    spd_bout_window = spd_window_adj.iloc[frame_index].assign(boutIDX = bout_index)
     spd_bout_window = spd_bout_window.reset_index(drop=False)
 
     # Note, at this point, spd_bout_window has duplicated rows assigned to adjacent bouts because the MIN_SWIM_INTERVAL is 100 ms but bout windows are 625 ms.
@@ -381,24 +427,29 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
     # decide which bouts to "align".
     # if window is far enough from epoch edge to allow alignment & spd during pre/post peak window are sufficiently low
     # YZ add code to get rid of bouts with only 0.025s above speed threshold
-    for i, bout in bout_idx.iterrows():
-        # if bouts meet criteria below, if_align = True
-        if bout['peak_idx'] >= (df.loc[df['epochNum']== bout['epochNum']].index.min() + PRE_PEAK_FRAMES) and\
-        df.loc[(bout['peak_idx']-frame_number250):bout['peak_idx'], 'swimSpeed'].min() < 3 and\
-        df.loc[bout['peak_idx']:bout['bout_end_idx'], 'swimSpeed'].min() < 3: #  and\
-        # bout['swim_end_idx']-bout['swim_start_idx'] > frame_number25: # added by YZ, get rid of bouts with only 1 frame above speed threshold
-            # normal alignment, if bout peak far enough from epoch edges
-            if bout['peak_idx'] <= (df.loc[df['epochNum']== bout['epochNum']].index.max() - POST_PEAK_FRAMES):
-                bout_attributes.loc[i,'if_align'] = True
-                # For inflection alignment, find the index of the frame with max speed inflection from boutWindowStart to boutWindowPeak
-                bout_attributes.loc[i,'boutInflectAlign'] = df.loc[bout['bout_start_idx']:bout['peak_idx'],['swimSpeed']].diff().diff().idxmax().values
-                # for alignment to max acceleration
-                # in the Matlab code, since the smooth function doesn't actually smooth the first few values, this index is not accurate
-                bout_attributes.loc[i,'boutAccAlign'] = smooth_series_ML(df.loc[bout['bout_start_idx']+frame_number250:bout['peak_idx'],'swimSpeed'], SM_WINDOW).diff().idxmax()
-
-            # get bout number for longer duration alignment (20 extra frames for 40hz)
-            if bout['peak_idx'] < (df.loc[df['epochNum']== bout['epochNum']].index.max() - BOUT_LONG_TAIL):
-                bout_attributes.loc[i,'if_align_long'] = True
+    # epoch boundary index, first and last row of each epoch, for checking distance between bout peaks and epoch edges
+    epoch_index = get_epoch_index(df['epochNum'].values)
+    bout_epoch_first = epoch_index.loc[bout_idx['epochNum'], 'first'].values
+    bout_epoch_last = epoch_index.loc[bout_idx['epochNum'], 'last'].values
+    peak_idx = bout_idx['peak_idx'].values
+    bout_start_idx = bout_idx['bout_start_idx'].values
+    # min speed from 250 ms before the peak to the peak, and from the peak to the end of the bout window
+    pre_peak_min_spd = df['swimSpeed'].rolling(frame_number250+1, min_periods=1).min().values[peak_idx]
+    # fmin ignores NaN, same as .min()
+    post_peak_min_spd = np.fmin.reduce(gather_windows(df['swimSpeed'].values, peak_idx, bout_idx['bout_end_idx'].values, BOUT_WINDOW_HALF+1, fill=np.inf), axis=1)
+    # if bouts meet criteria below, if_align = True
+    if_low_spd_edges = (peak_idx >= bout_epoch_first + PRE_PEAK_FRAMES) & (pre_peak_min_spd < 3) & (post_peak_min_spd < 3)
+    # normal alignment, if bout peak far enough from epoch edges
+    if_align = if_low_spd_edges & (peak_idx <= bout_epoch_last - POST_PEAK_FRAMES)
+    bout_attributes['if_align'] = if_align
+    # get bout number for longer duration alignment (20 extra frames for 40hz)
+    bout_attributes['if_align_long'] = if_low_spd_edges & (peak_idx < bout_epoch_last - BOUT_LONG_TAIL)
+    # For inflection alignment, find the index of the frame with max speed inflection from boutWindowStart to boutWindowPeak
+    # diff().diff() in each window is NaN for the first 2 frames of the window
+    bout_attributes.loc[if_align, 'boutInflectAlign'] = window_argmax(df['swimSpeed'].diff().diff().values, bout_start_idx[if_align]+2, peak_idx[if_align], jit=jit)
+    # for alignment to max acceleration
+    # in the Matlab code, since the smooth function doesn't actually smooth the first few values, this index is not accurate
+    bout_attributes.loc[if_align, 'boutAccAlign'] = smooth_diff_argmax(df['swimSpeed'].values, bout_start_idx[if_align]+frame_number250, peak_idx[if_align], SM_WINDOW, jit=jit)
 
     # %% [markdown]
     # ## Extract values
@@ -471,11 +522,6 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
         aligned_time_flat = np.datetime64('NaT'),
     )
 
-    # some counters
-    aligned_headUp_counter = 0
-    aligned_headDn_counter = 0
-    aligned_flat_counter = 0
-
     # same as before, set up a res2 dataframe for 1-value-per-bout data
     bout_long_res2 = pd.DataFrame(index=bout_aligned.loc[bout_aligned['if_align_long']].index)
 
@@ -494,8 +540,8 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
 
     # %%
     # align to each epoch
-    bout_res_tmp1 = pd.concat([
-        df.loc[bout['peak_idx']-PRE_PEAK_FRAMES:bout['peak_idx']+POST_PEAK_FRAMES,[  # select rows to concat
+    # all aligned windows are gathered at once into 3D arrays (bouts, frames, features), then converted to tables indexed by (bout_i, frame_i)
+    bout_res_tmp1, _ = gather_aligned(df, bout_aligned['peak_idx'].values, PRE_PEAK_FRAMES, POST_PEAK_FRAMES, [
             'oriIndex',  # select columns to concat
             'absTime',  # added 06.17.2020
             'angVelSmoothed',
@@ -505,10 +551,8 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
             'absy',
             'x',
             'y',
-            'fishLen']
-        ].assign(bout_i=[i]*All_Aligned_FRAMES, frame_i=range(All_Aligned_FRAMES))  # assign bout_i for each bout, assign frame_i for each row
-        for i, bout in bout_aligned.iterrows()  # loop through bouts
-    ]).set_index(['bout_i','frame_i']).rename(columns={  # reset index
+            'fishLen'])
+    bout_res_tmp1 = bout_res_tmp1.rename(columns={
             'oriIndex':'oriIndex',
             'absTime':'propBoutAligned_time',
             'angVelSmoothed':'propBoutAligned_angVel', # is smoothed!!!!!!!!!
@@ -522,42 +566,36 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
     })
 
     # align to inflection point of speaed (peak of 2nd derivative)
-    bout_res_tmp2 = pd.concat([
-        df.loc[bout['boutInflectAlign']-PRE_PEAK_FRAMES:bout['boutInflectAlign']+POST_PEAK_FRAMES,[
+    # add a condition for inflect alignment, bouts that don't meet the condition are NaN
+    if_inflect_align = (bout_aligned['boutInflectAlign'] > PRE_PEAK_FRAMES) & (bout_aligned['boutInflectAlign'] < epoch_index.loc[bout_aligned['epochNum'], 'last'].values-POST_PEAK_FRAMES)
+    inflect_array = np.full((len(bout_aligned), All_Aligned_FRAMES, 3), np.nan)
+    inflect_array[if_inflect_align.values] = gather_window_array(df, get_window_frames(bout_aligned.loc[if_inflect_align, 'boutInflectAlign'].values, PRE_PEAK_FRAMES, POST_PEAK_FRAMES), [
             'angVelSmoothed',
             'swimSpeed',
-            'angAccel']
-        ].assign(bout_i=[i]*All_Aligned_FRAMES, frame_i=range(All_Aligned_FRAMES))
-        for i, bout in bout_aligned.iterrows()  # loop through bouts
-        # add a condition for inflect alignment
-        if bout['boutInflectAlign'] > PRE_PEAK_FRAMES and bout['boutInflectAlign'] < df.loc[df['epochNum']==bout['epochNum']].index.max()-POST_PEAK_FRAMES
-    ]).set_index(['bout_i','frame_i']).rename(columns={
-        'angVelSmoothed':'propBoutInflAligned_angVel',
-        'swimSpeed':'propBoutInflAligned_speed',
-        'angAccel':'propBoutInflAligned_accel'
-    })
+            'angAccel'])
+    bout_res_tmp2 = window_array_to_table(inflect_array, [
+        'propBoutInflAligned_angVel',
+        'propBoutInflAligned_speed',
+        'propBoutInflAligned_accel'
+    ])
 
     bout_res = pd.concat([bout_res_tmp1,bout_res_tmp2],axis=1)
 
     # long bout tail alignment
-    try:
-        bout_long_res = pd.concat([
-            df.loc[bout['peak_idx']-PRE_PEAK_FRAMES:bout['peak_idx']+BOUT_LONG_TAIL,[
+    # add a condition for long bout tail alignment
+    if bout_aligned['if_align_long'].any():
+        bout_long_res, _ = gather_aligned(df, bout_aligned.loc[bout_aligned['if_align_long'], 'peak_idx'].values, PRE_PEAK_FRAMES, BOUT_LONG_TAIL, [
                 'angVelSmoothed',
                 'swimSpeed',
                 'angAccel',
-                'ang']
-            ].assign(bout_i=i, frame_i=range(BOUT_LONG_TAIL+PRE_PEAK_FRAMES+1))
-            for i, bout in bout_aligned.iterrows()
-            # add a condition for long bout tail alignment
-            if bout['if_align_long']
-        ]).set_index(['bout_i','frame_i']).rename(columns={
+                'ang'], bout_index=bout_aligned.index[bout_aligned['if_align_long']])
+        bout_long_res = bout_long_res.rename(columns={
             'angVelSmoothed':'propBoutAlignedLong_angVel',
             'swimSpeed':'propBoutAlignedLong_speed',
             'angAccel':'propBoutAlignedLong_accel',
             'ang':'propBoutAlignedLong_pitch'
         })
-    except:
+    else:
         bout_long_res = pd.DataFrame()
 
     # %%
@@ -569,14 +607,9 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
     #         then: flip x axis
     #               move_angle = np.arctan2(yvel,-xvel)
 
-    bout_heading = pd.concat([
-        df_chopped.loc[bout['peak_idx']-PRE_PEAK_FRAMES:bout['peak_idx']+POST_PEAK_FRAMES,[  # select rows to concat
+    bout_heading = gather_window_array(df_chopped, get_window_frames(bout_aligned['peak_idx'].values, PRE_PEAK_FRAMES, POST_PEAK_FRAMES), [  # select rows to concat
             'xvel_sm',  # select columns to concat
-            'yvel_sm',
-            'x_dir',]
-        ].assign(bout_i=[i]*All_Aligned_FRAMES, frame_i=range(All_Aligned_FRAMES))  # assign bout_i for each bout, assign frame_i for each row
-        for i, bout in bout_aligned.iterrows()  # loop through bouts
-    ]).set_index(['bout_i','frame_i'])
+            'yvel_sm'])
 
     # get the heading in -180:180 deg, which is the same unit/range as the original PropBoutAlignedHeading after U_D/R_L modifications
     # bout_res = bout_res.assign(
@@ -588,77 +621,60 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
     # this heading notes the direction fish is moving, in a range -90:90 deg
     bout_res = bout_res.assign(
         propBoutAligned_instHeading = np.degrees(np.arctan2(
-            bout_heading['yvel_sm'], np.absolute(bout_heading['xvel_sm'])
-        ))
+            bout_heading[:,:,1], np.absolute(bout_heading[:,:,0])
+        )).ravel()
     )
 
     # %%
-    # for rest of the values, let's do it bout by bout!
-    for i, bout in bout_aligned.iterrows():
-        aligned_peak = bout['peak_idx']
-        # aligned_start = bout['peak_idx'] - PRE_PEAK_FRAMES
-        # aligned_end = bout['peak_idx'] + POST_PEAK_FRAMES
-        # put 1-per-bout values into res2
-        bout_res2.loc[i, 'propBout_initPitch'] = df.loc[aligned_peak-frame_number250:aligned_peak-frame_number125, 'ang'].mean()
-        bout_res2.loc[i, 'propBout_initYPos'] = df.loc[aligned_peak-frame_number250:aligned_peak-frame_number125, 'y'].mean()
-        bout_res2.loc[i, 'propBout_deltaY'] = df.loc[aligned_peak+frame_number125:aligned_peak+frame_number250, 'y'].mean() - bout_res2.loc[i, 'propBout_initYPos']
-        bout_res2.loc[i, 'propBout_netPitchChg'] = df.loc[aligned_peak+frame_number125:aligned_peak+frame_number250, 'ang'].mean() - bout_res2.loc[i, 'propBout_initPitch']
-
-        # if the current (alignable) bout is not the last bout in the epoch
-        if bout['boutNum'] < bout_attributes.loc[bout_attributes['epochNum']==bout['epochNum'],'boutNum'].max():
-            swim_start = bout['swim_start_idx']
-            swim_start_next = bout_attributes.loc[bout['boutNum']+1,'swim_start_idx']
-            swim_end = bout['swim_end_idx'] + 1  # match swim_end to Matlab code by +1
-            # and if IEI is long enough
-            IEI_min = math.ceil(MIN_SWIM_INTERVAL * SAMPLE_RATE)  # 4 frames/100ms for 40Hz sample rate
-            if (swim_start_next-1) - (swim_end+1) > IEI_min:
-                # get IEI info
-                bout_res2.loc[i, 'propBoutIEI_yDispl'] = df.loc[swim_start_next-1, 'y'] - df.loc[swim_end+IEI_min,'y']
-                bout_res2.loc[i, 'propBoutIEI_yDisplTimes'] = bout_res2.loc[i, 'aligned_time']
-                bout_res2.loc[i, 'propBoutIEI_yDisplMatchedIEIs'] = (swim_start_next - swim_start) / SAMPLE_RATE
-
-        # separate by head up and head down
-        if bout['peakRawAngVel'] > 0:
-            aligned_headUp_counter += 1
-            bout_res.loc[idx[i,:], 'propBoutAligned_angVel_hUp'] = bout_res.loc[idx[i,:], 'propBoutAligned_angVel']
-            bout_res.loc[idx[i,:], 'propBoutAligned_speed_hUp'] = bout_res.loc[idx[i,:], 'propBoutAligned_speed']
-            bout_res.loc[idx[i,:], 'propBoutAligned_pitch_hUp'] = bout_res.loc[idx[i,:], 'propBoutAligned_pitch']
-            bout_res2.loc[i, 'aligned_time_hUp'] = bout_res2.loc[i,'aligned_time']
-        else:
-            aligned_headDn_counter += 1
-            bout_res.loc[idx[i,:], 'propBoutAligned_angVel_hDn'] = bout_res.loc[idx[i,:], 'propBoutAligned_angVel']
-            bout_res.loc[idx[i,:], 'propBoutAligned_speed_hDn'] = bout_res.loc[idx[i,:], 'propBoutAligned_speed']
-            bout_res.loc[idx[i,:], 'propBoutAligned_pitch_hDn'] = bout_res.loc[idx[i,:], 'propBoutAligned_pitch']
-            bout_res2.loc[i, 'aligned_time_hDn'] = bout_res2.loc[i,'aligned_time']
-
-        # collect data for flat bouts: net rotation less than 3 deg
-        if np.absolute(bout_res2.loc[i, 'propBout_netPitchChg']) <= 3:
-            aligned_flat_counter += 1
-            bout_res.loc[idx[i,:], 'propBoutAligned_angVel_flat'] = bout_res.loc[idx[i,:], 'propBoutAligned_angVel']
-            bout_res.loc[idx[i,:], 'propBoutAligned_speed_flat'] = bout_res.loc[idx[i,:], 'propBoutAligned_speed']
-            bout_res.loc[idx[i,:], 'propBoutAligned_pitch_flat'] = bout_res.loc[idx[i,:], 'propBoutAligned_pitch']
-            bout_res2.loc[i, 'aligned_time_flat'] = bout_res2.loc[i,'aligned_time']
-
-        # long bout tail alignment  - see the cell above
-
-        if bout['if_align_long']:
-            bout_long_res2.loc[i,'propBoutLong_initPitch'] = df.loc[aligned_peak-frame_number250:aligned_peak-frame_number125,'ang'].mean()
-            bout_long_res2.loc[i,'propBoutLong_initYPos'] = df.loc[aligned_peak-frame_number250:aligned_peak-frame_number125,'y'].mean()
-            bout_long_res2.loc[i,'propBoutLong_netPitchChg'] = df.loc[aligned_peak+frame_number125:aligned_peak+frame_number250,'ang'].mean() - bout_res2.loc[i, 'propBout_initPitch']
-        #     bout_long_res.loc[idx[j,:], 'propBoutAlignedLong_angVel'] = df.loc[aligned_start:alignedLong_end,'angVelSmoothed'].values
-        #     bout_long_res.loc[idx[j,:], 'propBoutAlignedLong_speed'] = df.loc[aligned_start:alignedLong_end,'swimSpeed'].values
-        #     bout_long_res.loc[idx[j,:], 'propBoutAlignedLong_accel'] = df.loc[aligned_start:alignedLong_end,'angAccel'].values
-        #     bout_long_res.loc[idx[j,:], 'propBoutAlignedLong_pitch'] = df.loc[aligned_start:alignedLong_end,'ang'].values
-        #     j += 1
-        # align for mixed bouts at two thresholds (skipped)
-
-        # # align to inflection point of speaed (peak of 2nd derivative)  - see the cell above
-        # if bout['boutInflectAlign'] > 30 and bout['boutInflectAlign'] < df.loc[df['epochNum']==bout['epochNum']].index.max() - 20:
-        #     inflectAlign_start = bout['boutInflectAlign'] - 30
-        #     inflectAlign_end = bout['boutInflectAlign'] + 20
-        #     bout_res.loc[idx[i,:], 'propBoutInflAligned_angVel'] = df.loc[inflectAlign_start:inflectAlign_end,'angVelSmoothed'].values
-        #     bout_res.loc[idx[i,:], 'propBoutInflAligned_speed'] = df.loc[inflectAlign_start:inflectAlign_end,'swimSpeed'].values
-        #     bout_res.loc[idx[i,:], 'propBoutInflAligned_accel'] = df.loc[inflectAlign_start:inflectAlign_end,'angAccel'].values
+    # 1-per-bout values of all bouts at once. window means are calculated from cumulative sums of each column
+    aligned_peak = bout_aligned['peak_idx'].values
+    pitch_prefix = get_prefix_sums(df['ang'].values)
+    y_prefix = get_prefix_sums(df['y'].values)
+    pre_pitch = window_means(pitch_prefix, aligned_peak-frame_number250, aligned_peak-frame_number125)
+    pre_y = window_means(y_prefix, aligned_peak-frame_number250, aligned_peak-frame_number125)
+    post_pitch = window_means(pitch_prefix, aligned_peak+frame_number125, aligned_peak+frame_number250)
+    post_y = window_means(y_prefix, aligned_peak+frame_number125, aligned_peak+frame_number250)
+    bout_res2 = bout_res2.assign(
+        propBout_initPitch = pre_pitch,
+        propBout_initYPos = pre_y,
+        propBout_deltaY = post_y - pre_y,
+        propBout_netPitchChg = post_pitch - pre_pitch,
+    )
+
+    # IEI y displacement, if the current (alignable) bout is not the last bout in the epoch
+    last_boutNum = bout_attributes.groupby('epochNum')['boutNum'].transform('max')
+    if_not_last = (bout_aligned['boutNum'].values < last_boutNum.values[bout_aligned['boutNum'].values])
+    swim_start = bout_aligned['swim_start_idx'].values
+    swim_start_next = bout_attributes['swim_start_idx'].shift(-1).values[bout_aligned['boutNum'].values]
+    swim_end = bout_aligned['swim_end_idx'].values + 1  # match swim_end to Matlab code by +1
+    # and if IEI is long enough
+    IEI_min = math.ceil(MIN_SWIM_INTERVAL * SAMPLE_RATE)  # 4 frames/100ms for 40Hz sample rate
+    if_IEI = if_not_last.copy()
+    if_IEI[if_not_last] = (swim_start_next[if_not_last]-1) - (swim_end[if_not_last]+1) > IEI_min
+    IEI_start_next = swim_start_next[if_IEI].astype('int64')
+    bout_res2.loc[if_IEI, 'propBoutIEI_yDispl'] = df['y'].values[IEI_start_next-1] - df['y'].values[swim_end[if_IEI]+IEI_min]
+    bout_res2.loc[if_IEI, 'propBoutIEI_yDisplTimes'] = bout_res2.loc[if_IEI, 'aligned_time']
+    bout_res2.loc[if_IEI, 'propBoutIEI_yDisplMatchedIEIs'] = (IEI_start_next - swim_start[if_IEI]) / SAMPLE_RATE
+
+    # separate by head up and head down, collect data for flat bouts: net rotation less than 3 deg
+    if_hUp = (bout_aligned['peakRawAngVel'] > 0).values
+    if_flat = (np.absolute(bout_res2['propBout_netPitchChg']) <= 3).values
+    bout_res2.loc[if_hUp, 'aligned_time_hUp'] = bout_res2.loc[if_hUp, 'aligned_time']
+    bout_res2.loc[~if_hUp, 'aligned_time_hDn'] = bout_res2.loc[~if_hUp, 'aligned_time']
+    bout_res2.loc[if_flat, 'aligned_time_flat'] = bout_res2.loc[if_flat, 'aligned_time']
+    bout_res2 = bout_res2.assign(
+        propBout_category = (if_hUp * CATEGORY_HUP + if_flat * CATEGORY_FLAT).astype('int8'),
+    )
+    if split_aligned:
+        bout_res = split_aligned_columns(bout_res, bout_res2['propBout_category'].values, All_Aligned_FRAMES)
+
+    # long bout tail alignment  - see the cell above
+    if_long = bout_aligned['if_align_long'].values
+    bout_long_res2 = bout_long_res2.assign(
+        propBoutLong_initPitch = pre_pitch[if_long],
+        propBoutLong_initYPos = pre_y[if_long],
+        propBoutLong_netPitchChg = post_pitch[if_long] - bout_res2['propBout_initPitch'].values[if_long],
+    )
 
     # %%
     # BE AWARE THAT SOME PROPERTIES ARE HARDED-CODED FOR 40HZ DATA. IF NOT 40HZ, ADJUST ACCORDINGLY
@@ -749,90 +765,33 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
         # use smoothed angVel for post bout vel
         propBoutIEI_angVel_postBout = df.loc[IEI_attributes['swim_end_shift']+1+POST_BOUT_BUF, 'angVelSmoothed'].values,
         propBoutIEI_angVel_preNextBout = df.loc[IEI_attributes['swim_start_idx']-IEI_2_swim_buf, 'angVelSmoothed'].values,
-        # Other values to calculate
-        propBoutIEI_pitch = np.nan,
-        propBoutIEI_angVel = np.nan,
-        propBoutIEI_angAcc = np.nan,
-        propBoutIEI_pauseDur = np.nan,
-        propBoutIEI_yvel = np.nan,
-        IEI_matchIndex = np.nan,
-        rowsInRes = np.nan,
-        propBoutIEI_heading = np.nan,
     )
 
-    # initialize res3 for timed IEI results (multi-indexed)
-    IEI = range(len(IEI_attributes))
-    frames = range(IEI_tail)
-    index = pd.MultiIndex.from_product([IEI, frames], names=['IEI_i', 'frame_i'])
-    column = [  'propBoutIEI_timedHeading',
-                'propBoutIEI_timedPitch',
-                'propBoutIEI_timedHeadingPre',
-                'propBoutIEI_timedPitchPre',
-            ]
-    IEI_res3 = pd.DataFrame(index=index, columns=column, dtype=np.float64)
-
     # %%
-    # extract data
-    for i, row in IEI_attributes.iterrows():
-        # get some index calculation done
-        bout_end_post = row['swim_end_shift'] + 1 + POST_BOUT_BUF  # where last bout ends. to match the swim end in Matlab, +1
-        bout_start_pre = row['swim_start_idx'] - IEI_2_swim_buf  # where next bout starts
-        bout_end_5frames = row['swim_end_shift'] + 1 + math.ceil(0.05*SAMPLE_RATE)  # why use 0.05 but not POST_BOUT_BUF for duration calculation???????
-        bout_start_4frames = row['swim_start_idx'] - PRE_BOUT_BUF
-        # assign values. NOTE: smoothed results are used for angVel and angAccel
-        IEI_res2.loc[i,'propBoutIEI_pitch'] = df.loc[bout_end_post:bout_start_pre,'ang'].mean(skipna=True)
-        IEI_res2.loc[i,'propBoutIEI_angVel'] = df.loc[bout_end_post:bout_start_pre,'angVelSmoothed'].mean(skipna=True)
-        IEI_res2.loc[i,'propBoutIEI_angAcc'] = df.loc[bout_end_post:bout_start_4frames,'angVelSmoothed'].diff().mean(skipna=True)
-        IEI_res2.loc[i,'propBoutIEI_pauseDur'] = (bout_start_4frames - bout_end_5frames) / SAMPLE_RATE
-        # why use 0.3 but not POST_BOUT_BUF for yvel???????????
-        IEI_res2.loc[i,'propBoutIEI_yvel'] = df.loc[row['swim_end_shift']+1+math.ceil(0.3*SAMPLE_RATE):bout_start_4frames, 'yvel'].mean()
-        IEI_res2.loc[i,'IEI_matchIndex'] = i
-        IEI_res2.loc[i,'rowsInRes'] = bout_start_4frames - bout_end_5frames + 1
-        # is IEI long enough?
-        if row['swim_start_idx']-(row['swim_end_shift']+1) < IEI_tail:
-            # if not
-            IEI_res3.loc[idx[i,:],['propBoutIEI_timedHeading','propBoutIEI_timedPitch','propBoutIEI_timedHeadingPre','propBoutIEI_timedPitchPre']] = 500
-        else:
-            # if yes
-            swim_end = row['swim_end_shift'] + 1
-            swim_start = row['swim_start_idx']
-            # NOTE: headings below are different from the Matlab code. X differences are not abs()
-            # heading
-            IEI_res2.loc[i,'propBoutIEI_heading'] = np.degrees(np.arctan(
-                (df.loc[swim_start,'y'] - df.loc[swim_end,'y'])
-                / np.absolute(df.loc[swim_start,'x'] - df.loc[swim_end,'x'])
-                ))
-            # timed heading and heading pre
-            if df.loc[swim_end+IEI_tail, 'epochNum'] == row['epochNum']:
-                # if there's enough rows in the current epoch for getting (swim_end + IEI_tail)
-                IEI_res3.loc[idx[i,:],'propBoutIEI_timedHeading'] = np.degrees(np.arctan2(
-                    (df.loc[swim_end:swim_end+IEI_tail,'y'].diff().dropna().values),  # because of diff(), first value is na
-                     (df.loc[swim_end:swim_end+IEI_tail,'x'].diff().abs().dropna().values)  # use abs() to get rid of x directionality
-                ))
-                IEI_res3.loc[idx[i,:],'propBoutIEI_timedPitch'] = df.loc[swim_end:swim_end+IEI_tail-1,'ang'].values
-            else:
-                IEI_res3.loc[idx[i,:],'propBoutIEI_timedHeading'] = 500
-                IEI_res3.loc[idx[i,:],'propBoutIEI_timedPitch'] = 500
-
-            if df.loc[swim_start-IEI_tail, 'epochNum'] == row['epochNum']:
-                # if there's enough rows in the current epoch for getting (swim_start - IEI_tail)
-                IEI_res3.loc[idx[i,:],'propBoutIEI_timedHeadingPre'] = np.degrees(np.arctan2(
-                    (df.loc[swim_start-IEI_tail:swim_start,'y'].diff().dropna().values),
-                     (df.loc[swim_start-IEI_tail:swim_start,'x'].diff().abs().dropna().values)
-                ))
-                IEI_res3.loc[idx[i,:],'propBoutIEI_timedPitchPre'] = df.loc[swim_start-IEI_tail+1:swim_start,'ang'].values
-            else:
-                IEI_res3.loc[idx[i,:],'propBoutIEI_timedHeadingPre'] = 500
-                IEI_res3.loc[idx[i,:],'propBoutIEI_timedPitchPre'] = 500
-
-    # for aligned values (multiple values for each IEI), use pd.concat (which is more efficient)
-    IEI_res = pd.concat([
-        df.loc[(
-            IEI_attributes.loc[i,'swim_end_shift']+POST_BOUT_BUF  # bout_end_5frames
-        ):(
-            IEI_attributes.loc[i,'swim_start_idx']-PRE_BOUT_BUF  # bout_start_4frames
-        ),['angVelSmoothed','ang','yvel','absTime']] for i in range(len(IEI_attributes)  # get these values for each IEI
-    )], ignore_index=True)
+    # extract data of all IEIs at once
+    # again, when using swim_end as an index, +1 to match the idx to Matlab
+    IEI_swim_end = IEI_attributes['swim_end_shift'].values + 1
+    IEI_res2 = pd.concat([IEI_res2, get_IEI_values(
+        df, IEI_swim_end, IEI_attributes['swim_start_idx'].values, SAMPLE_RATE, POST_BOUT_BUF, PRE_BOUT_BUF, IEI_2_swim_buf, IEI_tail
+    )], axis=1)
+
+    # res3 for timed IEI results (multi-indexed)
+    IEI_res3 = window_array_to_table(get_IEI_timed(df, IEI_swim_end, IEI_attributes['swim_start_idx'].values, IEI_attributes['epochNum'].values, IEI_tail), [
+        'propBoutIEI_timedHeading',
+        'propBoutIEI_timedPitch',
+        'propBoutIEI_timedHeadingPre',
+        'propBoutIEI_timedPitchPre',
+    ]).rename_axis(['IEI_i', 'frame_i'])
+
+    # for aligned values (multiple values for each IEI), gather frames of all IEIs in one pass
+    # rows of each IEI are stored consecutively, the number of rows of each IEI is saved in prop_bout_IEI2 as rowsInAligned
+    IEI_res, IEI_offsets = gather_ragged(df,
+        IEI_attributes['swim_end_shift'].values+POST_BOUT_BUF,  # bout_end_5frames
+        IEI_attributes['swim_start_idx'].values-PRE_BOUT_BUF,  # bout_start_4frames
+        ['angVelSmoothed','ang','yvel','absTime'])  # get these values for each IEI
+    IEI_res2 = IEI_res2.assign(
+        rowsInAligned = np.diff(IEI_offsets),
+    )
 
     IEI_res = IEI_res.rename(columns = {'angVelSmoothed':'propBoutIEIAligned_angVel',
                                     'ang':'propBoutIEIAligned_pitch',
@@ -926,43 +885,190 @@ def grab_fish_angle(analyzed, fish_length,sample_rate):
               'epoch_attributes':epoch_attributes,
               'heading_matched':heading_res,
               'epoch_pitch_heading_RMS':heading_res2}
+    if compact:
+        output = {key:compact_dtypes(value) for key, value in output.items()}
     aligned_bout_num = len(bout_res2)
     print(f" {aligned_bout_num} bouts aligned")
 
     return output
 
-def run(filenames, folder, frame_rate):
+def offset_chunk_positions(res, offsets):
+    """Offset row numbers, bout numbers, IEI numbers, epoch positions and swim window indices of the output of one chunk by those of previous chunks of the same file, so that they match the output of the whole file. Modifies res inplace
+
+    Args:
+        res (dict): output dictionary of grab_fish_angle() for one chunk
+        offsets (dict): counts of previous chunks, keys of POSITION_COLUMNS and 'swimWindow'. Updated to include this chunk
+    """
+    for name, tables in POSITION_COLUMNS.items():
+        if offsets[name] > 0:
+            for key, cols in tables.items():
+                res[key][cols] = res[key][cols] + offsets[name]
+    # swim windows are numbered by cumsum of swim/non-swim changes, NaN for the first frame. Epochs start with a non-swim frame, so the chunk starts a new (even) window
+    grabbed = res['grabbed_all']
+    swim_window = grabbed['swimWindow'].to_numpy()
+    if offsets['rows'] > 0:
+        swim_window = swim_window + offsets['swimWindow']
+        swim_window[0] = offsets['swimWindow']
+        grabbed['swimWindow'] = swim_window.astype(grabbed['swimWindow'].dtype, copy=False)
+    last_window = int(swim_window[-1])
+    offsets['swimWindow'] = last_window + last_window % 2
+    for name, key in POSITION_TABLES.items():
+        offsets[name] += len(res[key])
+
+def analyze_file(i, file, folder, frame_rate, read_options, grab_options):
+    """Read, analyze and grab bouts from one .dlm file. Runs in worker processes if run() is called with workers > 1
+
+    Args:
+        i (int): file index
+        file (string): .dlm file directory
+        folder (string): directory of folder containing the .dlm
+        frame_rate (int): frame rate
+        read_options (dict): dlm_engine, dlm_cache, cache_budget, stream and chunk_size, see run()
+        grab_options (dict): kwargs of grab_fish_angle(), see run()
+
+    Returns:
+        list: output dictionaries of grab_fish_angle(), one per chunk
+        list: fish length dataframes, one per chunk
+        list: warning messages to log
+        DataFrame: rejection counts of epoch filters, see preprocessing/epoch_filters.py
+    """
+    if read_options['stream']:
+        # in streaming mode, each chunk of complete epochs is analyzed separately. Row/bout numbers are offset to match whole-file analysis, see offset_chunk_positions()
+        # NOTE bouts are not linked across chunks, the first IEI of each chunk is not paired for wolpert_IEI, and per-epoch means in epoch_attributes are matched to rows within each chunk
+        chunks = iter_dlm(i, file, chunk_size=read_options['chunk_size'], engine=read_options['dlm_engine'])
+    else:
+        chunks = [read_dlm(i, file, engine=read_options['dlm_engine'], cache=read_options['dlm_cache'], cache_budget=read_options['cache_budget'])]
+    file_res = []
+    file_fish_length = []
+    warnings = []
+    epoch_qc = []
+    offsets = dict.fromkeys(list(POSITION_TABLES)+['swimWindow'], 0)
+    for raw in chunks:
+        analyzed, fish_length = analyze_dlm_resliced(raw, i, file, folder, frame_rate, epoch_qc=epoch_qc)
+        del raw
+        if type(analyzed) == str:
+            print(analyzed)
+            warnings.append(analyzed)
+            continue
+        if grab_options['compact']:
+            analyzed = compact_dtypes(analyzed)
+        res = grab_fish_angle(analyzed, fish_length,frame_rate, epoch_qc=epoch_qc, **grab_options)
+        del analyzed
+        if type(res) == str:
+            print(res)
+            warnings.append(res)
+            continue
+        if read_options['stream']:
+            offset_chunk_positions(res, offsets)
+        file_res.append(res)
+        file_fish_length.append(fish_length)
+    return file_res, file_fish_length, warnings, sum_qc(epoch_qc)
+
+def run(filenames, folder, frame_rate, **kwargs):
     """    Loop through all .dlm, run analyze_dlm() and grab_fish_angle() functions. Concatinate results from different .dlm files
 
     Args:
         filenames (string): a .dlm file directory
         folder (string): root directory
         frame_rate (int): frame rate
+        ---kwargs---
+        dlm_engine (string): parser engine for .dlm files, 'fast' or 'pandas'. Defaults to 'fast'.
+        dlm_cache (bool): whether to cache parsed .dlm files on disk for faster reruns. Defaults to False.
+        cache_budget (int): disk budget of the .dlm cache folder in bytes. Defaults to 20 GB.
+        stream (bool): whether to read and analyze .dlm files in epoch-complete chunks to limit memory use. Row, bout and IEI numbers are offset to match whole-file analysis, see offset_chunk_positions(). Per-epoch means in epoch_attributes and wolpert_IEI depend on chunks. Defaults to False.
+        chunk_size (int): bytes of .dlm text per chunk in streaming mode. Defaults to 256 MB.
+        workers (int): number of worker processes to analyze .dlm files in parallel. Defaults to 1, files are analyzed one by one.
+        split_aligned (bool): whether to save _hUp, _hDn and _flat columns in prop_bout_aligned as in previous versions. Defaults to False, bouts are split using propBout_category in prop_bout2.
+        compact (bool): whether to keep analyzed frames and save output dataframes in compact data types (float32 kinematics, integer ids), see preprocessing/compact.py. Defaults to False, float64 as in previous versions.
+        jit (bool): whether to use numba-compiled kernels for bout detection, see bout_analysis/kernels.py. Defaults to False.
+        hdf_format (string): format of .h5 outputs, 'auto', 'table' or 'fixed'. Defaults to 'auto', bulk frame-level tables in fixed format and others in table format, see hdf_output.py. Use 'table' for the format of previous versions.
+        complib (string): compression library of .h5 outputs. Defaults to 'blosc:zstd'.
+        complevel (int): compression level of .h5 outputs, 0 to 9. Defaults to 1, 0 for no compression.
+        aligned_store (bool): whether to save aligned bouts as a (bouts, frames, features) array in aligned_bouts.h5. aligned_bouts.h5 of previous runs is removed if not saved. Defaults to True.
+        output_backend (string): 'hdf' for .h5 outputs, 'parquet' for partitioned Parquet datasets in the parquet folder, see parquet_output.py, or 'both'. Parquet datasets of previous runs are removed if not saved. Defaults to 'hdf'.
     """
+    dlm_engine = 'fast'
+    dlm_cache = False
+    cache_budget = DEFAULT_CACHE_BUDGET
+    stream = False
+    chunk_size = DEFAULT_CHUNK_SIZE
+    workers = 1
+    split_aligned = False
+    compact = False
+    jit = False
+    hdf_format = 'auto'
+    complib = DEFAULT_COMPLIB
+    complevel = DEFAULT_COMPLEVEL
+    aligned_store = True
+    output_backend = 'hdf'
+    for key, value in kwargs.items():
+        if key == 'dlm_engine':
+            dlm_engine = value
+        elif key == 'dlm_cache':
+            dlm_cache = value
+        elif key == 'cache_budget':
+            cache_budget = value
+        elif key == 'stream':
+            stream = value
+        elif key == 'chunk_size':
+            chunk_size = value
+        elif key == 'workers':
+            workers = value
+        elif key == 'split_aligned':
+            split_aligned = value
+        elif key == 'compact':
+            compact = value
+        elif key == 'jit':
+            jit = value
+        elif key == 'hdf_format':
+            hdf_format = value
+        elif key == 'complib':
+            complib = value
+        elif key == 'complevel':
+            complevel = value
+        elif key == 'aligned_store':
+            aligned_store = value
+        elif key == 'output_backend':
+            output_backend = value
+    if output_backend not in ['hdf', 'parquet', 'both']:
+        raise ValueError(f"unknown output backend: {output_backend}")
+    read_options = {
+        'dlm_engine':dlm_engine,
+        'dlm_cache':dlm_cache,
+        'cache_budget':cache_budget,
+        'stream':stream,
+        'chunk_size':chunk_size,
+    }
+    grab_options = {
+        'split_aligned':split_aligned,
+        'compact':compact,
+        'jit':jit,
+    }
+    hdf_options = {
+        'hdf_format':hdf_format,
+        'complib':complib,
+        'complevel':complevel,
+    }
     
     logger = log_SAMPL_ana('SAMPL_ana_log')
     logger.info(f'Folder analyzed: {folder}')
     logger.info(f"Program ver: {program_version}")
+    if stream:
+        # other outputs are the same as whole-file analysis
+        message = "Streaming mode: per-epoch means in epoch_attributes and wolpert_IEI pairs at chunk boundaries depend on chunk_size and differ from whole-file analysis"
+        logger.warning(message)
+        print(message)
 
-    # initialize output vars
-    grabbed_all = pd.DataFrame()
-    baseline_angVel = pd.DataFrame()
-    bout_attributes = pd.DataFrame()
-    prop_bout_aligned = pd.DataFrame()
-    prop_bout2 = pd.DataFrame()
-    prop_bout_aligned_long = pd.DataFrame()
-    prop_bout_aligned_long2 = pd.DataFrame()
-    IEI_attributes = pd.DataFrame()
-    prop_bout_IEI_aligned = pd.DataFrame()
-    prop_bout_IEI2 = pd.DataFrame()
-    prop_bout_IEI_timed = pd.DataFrame()
-    wolpert_IEI = pd.DataFrame()
-    epoch_attributes = pd.DataFrame()
-    heading_matched = pd.DataFrame()
-    epoch_pitch_heading_RMS = pd.DataFrame()
+    # initialize output collector. results of each file are appended to lists and concatenated once after all files are analyzed
+    collected_res = defaultdict(list)
+    collected_dates = defaultdict(list)
 
     total_bouts_aligned = 0
     metadata_from_bouts = pd.DataFrame()
+    # fish length of all files for analysis info
+    all_fish_length = []
+    # rejection counts of epoch filters of each file
+    epoch_qc = []
 
     # read ini files of dlm files, if there's any
     par_files = [name.split(".dlm")[0]+" parameters.ini" for name in filenames]
@@ -982,45 +1088,63 @@ def run(filenames, folder, frame_rate):
         exp_parameters.to_csv(f"{folder}/dlm metadata.csv")
 
     # analyze dlm
-    for i, file in enumerate(filenames):
-        logger.info(f"File {i}: {file[-19:]}")
-        raw = read_dlm(i, file)
-        analyzed, fish_length = analyze_dlm_resliced(raw, i, file, folder, frame_rate)
-        if type(analyzed) == str:
-            print(analyzed)
-            logger.warning(analyzed)
-            continue
-        res = grab_fish_angle(analyzed, fish_length,frame_rate)
-        if type(res) == str:
-            print(res)
-            logger.warning(res)
-            continue 
-        this_metadata = {
-            'filename':os.path.basename(file)[0:15],
-            'aligned_bout':len(res['prop_bout2']),
-            'mean_fish_len':fish_length['fishLenEst'].mean(),
-        }
-        this_metadata = pd.DataFrame(data=this_metadata,index=[0])
-        metadata_from_bouts = pd.concat([metadata_from_bouts,this_metadata])
-        # transfer values to final var
-        grabbed_all = pd.concat([grabbed_all, res['grabbed_all']], ignore_index=True)
-        baseline_angVel = pd.concat([baseline_angVel, res['baseline_angVel']], ignore_index=True)
-        bout_attributes = pd.concat([bout_attributes, res['bout_attributes']], ignore_index=True)
-        prop_bout_aligned = pd.concat([prop_bout_aligned, res['prop_bout_aligned']], ignore_index=True)
-        prop_bout2 = pd.concat([prop_bout2, res['prop_bout2']], ignore_index=True)
-        prop_bout_aligned_long = pd.concat([prop_bout_aligned_long, res['prop_bout_aligned_long']], ignore_index=True)
-        prop_bout_aligned_long2 = pd.concat([prop_bout_aligned_long2, res['prop_bout_aligned_long2']], ignore_index=True)
-        IEI_attributes = pd.concat([IEI_attributes, res['IEI_attributes']], ignore_index=True)
-        prop_bout_IEI_aligned = pd.concat([prop_bout_IEI_aligned, res['prop_bout_IEI_aligned']], ignore_index=True)
-        prop_bout_IEI2 = pd.concat([prop_bout_IEI2, res['prop_bout_IEI2']], ignore_index=True)
-        prop_bout_IEI_timed = pd.concat([prop_bout_IEI_timed, res['prop_bout_IEI_timed']], ignore_index=True)
-        wolpert_IEI = pd.concat([wolpert_IEI, res['wolpert_IEI']], ignore_index=True)
-        epoch_attributes = pd.concat([epoch_attributes, res['epoch_attributes']], ignore_index=True)
-        heading_matched = pd.concat([heading_matched, res['heading_matched']], ignore_index=True)
-        epoch_pitch_heading_RMS = pd.concat([epoch_pitch_heading_RMS, res['epoch_pitch_heading_RMS']], ignore_index=True)
-        
-        logger.info(f"Bouts aligned: {this_metadata.loc[0,'aligned_bout']}")
+    # the executor is shut down when the loop ends or a worker raises
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(filenames)))) if workers > 1 else nullcontext() as executor:
+        # executor.map() returns results in the order of filenames regardless of which worker finishes first
+        map_func = executor.map if executor is not None else map
+        file_outputs = map_func(analyze_file, range(len(filenames)), filenames, [folder]*len(filenames), [frame_rate]*len(filenames), [read_options]*len(filenames), [grab_options]*len(filenames))
+        for i, (file, (file_res, file_fish_length, warnings, file_qc)) in enumerate(zip(filenames, file_outputs)):
+            logger.info(f"File {i}: {file[-19:]}")
+            for message in warnings:
+                logger.warning(message)
+            for _, row in file_qc.iterrows():
+                logger.info(f"Epochs rejected by {row['filter']} filter: {row['epochs_rejected']}/{row['epochs_in']}")
+            epoch_qc.append(file_qc.assign(filename=os.path.basename(file)[0:15]))
+            if not file_res:
+                continue
+            fish_length = pd.concat(file_fish_length, ignore_index=True)
+            all_fish_length.append(fish_length)
+            this_metadata = {
+                'filename':os.path.basename(file)[0:15],
+                'aligned_bout':sum(len(res['prop_bout2']) for res in file_res),
+                'mean_fish_len':fish_length['fishLenEst'].mean(),
+            }
+            this_metadata = pd.DataFrame(data=this_metadata,index=[0])
+            metadata_from_bouts = pd.concat([metadata_from_bouts,this_metadata])
+            # transfer values to final var
+            for res in file_res:
+                for key, value in res.items():
+                    collected_res[key].append(value)
+                    # date of each row for partitioning parquet outputs
+                    collected_dates[key].append(np.repeat(get_dlm_date(file), len(value)))
+            del file_res
         
+            logger.info(f"Bouts aligned: {this_metadata.loc[0,'aligned_bout']}")
+
+    # nothing to save if no file produced results, e.g. no .dlm file found or all files skipped
+    if not collected_res:
+        logger.warning("No bout aligned in any file! No output saved")
+        print("No bout aligned in any file! No output saved")
+        return
+
+    # concatenate results from all files
+    concat_res = lambda key: pd.concat(collected_res[key], ignore_index=True) if collected_res[key] else pd.DataFrame()
+    grabbed_all = concat_res('grabbed_all')
+    baseline_angVel = concat_res('baseline_angVel')
+    bout_attributes = concat_res('bout_attributes')
+    prop_bout_aligned = concat_res('prop_bout_aligned')
+    prop_bout2 = concat_res('prop_bout2')
+    prop_bout_aligned_long = concat_res('prop_bout_aligned_long')
+    prop_bout_aligned_long2 = concat_res('prop_bout_aligned_long2')
+    IEI_attributes = concat_res('IEI_attributes')
+    prop_bout_IEI_aligned = concat_res('prop_bout_IEI_aligned')
+    prop_bout_IEI2 = concat_res('prop_bout_IEI2')
+    prop_bout_IEI_timed = concat_res('prop_bout_IEI_timed')
+    wolpert_IEI = concat_res('wolpert_IEI')
+    epoch_attributes = concat_res('epoch_attributes')
+    heading_matched = concat_res('heading_matched')
+    epoch_pitch_heading_RMS = concat_res('epoch_pitch_heading_RMS')
+    del collected_res
 
     # %%
     # concat metadata from bouts and metadata from ini. save in parent folder (condition folder)
@@ -1049,21 +1173,41 @@ def run(filenames, folder, frame_rate):
     total_bouts_aligned = metadata_from_bouts['aligned_bout'].sum()
     # %%
     output_dir = folder
-    grabbed_all.to_hdf(f'{output_dir}/all_data.h5', key='grabbed_all', mode='w', format='table')
-    baseline_angVel.to_hdf(f'{output_dir}/all_data.h5', key='baseline_angVel', format='table')
-    bout_attributes.to_hdf(f'{output_dir}/bout_data.h5', key='bout_attributes', mode='w', format='table')
-    prop_bout_aligned.to_hdf(f'{output_dir}/bout_data.h5', key='prop_bout_aligned', format='table')
-    prop_bout2.to_hdf(f'{output_dir}/bout_data.h5', key='prop_bout2', format='table')
-    prop_bout_aligned_long.to_hdf(f'{output_dir}/bout_data.h5', key='prop_bout_aligned_long', format='table')
-    prop_bout_aligned_long2.to_hdf(f'{output_dir}/bout_data.h5', key='prop_bout_aligned_long2', format='table')
-    IEI_attributes.to_hdf(f'{output_dir}/IEI_data.h5', key='IEI_attributes', mode='w', format='table')
-    prop_bout_IEI_aligned.to_hdf(f'{output_dir}/IEI_data.h5', key='prop_bout_IEI_aligned', format='table')
-    prop_bout_IEI2.to_hdf(f'{output_dir}/IEI_data.h5', key='prop_bout_IEI2', format='table')
-    prop_bout_IEI_timed.to_hdf(f'{output_dir}/IEI_data.h5', key='prop_bout_IEI_timed', format='table')
-    wolpert_IEI.to_hdf(f'{output_dir}/IEI_data.h5', key='wolpert_IEI', format='table')
-    epoch_attributes.to_hdf(f'{output_dir}/all_data.h5', key='epoch_attributes', format='table')
-    heading_matched.to_hdf(f'{output_dir}/all_data.h5', key='heading_matched', format='table')
-    epoch_pitch_heading_RMS.to_hdf(f'{output_dir}/all_data.h5', key='epoch_pitch_heading_RMS', format='table')
+    outputs = {
+        'grabbed_all':grabbed_all,
+        'baseline_angVel':baseline_angVel,
+        'bout_attributes':bout_attributes,
+        'prop_bout_aligned':prop_bout_aligned,
+        'prop_bout2':prop_bout2,
+        'prop_bout_aligned_long':prop_bout_aligned_long,
+        'prop_bout_aligned_long2':prop_bout_aligned_long2,
+        'IEI_attributes':IEI_attributes,
+        'prop_bout_IEI_aligned':prop_bout_IEI_aligned,
+        'prop_bout_IEI2':prop_bout_IEI2,
+        'prop_bout_IEI_timed':prop_bout_IEI_timed,
+        'wolpert_IEI':wolpert_IEI,
+        'epoch_attributes':epoch_attributes,
+        'heading_matched':heading_matched,
+        'epoch_pitch_heading_RMS':epoch_pitch_heading_RMS,
+    }
+    # aligned_bouts.h5 is only read with bout_data.h5 of the same run
+    run_id = uuid.uuid4().hex
+    if output_backend in ['hdf', 'both']:
+        write_outputs(output_dir, outputs, run_id=run_id, **hdf_options)
+    if output_backend in ['hdf', 'both'] and aligned_store:
+        write_aligned_bouts(output_dir, prop_bout_aligned, len(prop_bout2), run_id, complib=hdf_options['complib'], complevel=hdf_options['complevel'])
+    else:
+        # aligned_bouts.h5 of previous runs would be read instead of the new outputs
+        remove_aligned_bouts(output_dir)
+    if output_backend in ['parquet', 'both']:
+        row_dates = {key:np.concatenate(value) if value else np.array([], dtype=str) for key, value in collected_dates.items()}
+        write_parquet_outputs(output_dir, outputs, row_dates, exp_name, os.path.basename(os.path.dirname(os.path.abspath(folder))))
+    else:
+        # Parquet datasets of previous runs would be read instead of the new .h5 outputs
+        remove_parquet_outputs(output_dir)
+    # QC of epoch filters
+    if epoch_qc:
+        pd.concat(epoch_qc, ignore_index=True).to_csv(f'{output_dir}/epoch filter QC.csv')
 
     # %%
     data_file_explained = pd.DataFrame.from_dict(
@@ -1094,6 +1238,7 @@ def run(filenames, folder, frame_rate):
          'prop_bout2':['one-per-bout parameters'],
          'prop_bout_aligned_long':['including bout data with 1s after the time of peak speed'],
          'prop_bout_aligned_long2':['attributes for long bouts'],
+         'aligned_bouts.h5':['float columns of prop_bout_aligned as a (bouts, frames, features) array. Bouts are in the same order as prop_bout2'],
 
          'IEI_data.h5':[
          'Contains inter bout data. Includes following keys',
@@ -1140,10 +1285,11 @@ def run(filenames, folder, frame_rate):
     , orient='index')
     catalog_bout_data.to_csv(f'{output_dir}/catalog bout_data.csv')
 # %%
+    fish_length = pd.concat(all_fish_length, ignore_index=True)
     info_dict = {
         'frame_rate':frame_rate,
-        'fish_length':fish_length.mean()[1],
-        'fish_length_std':fish_length.std()[1],
+        'fish_length':fish_length['fishLenEst'].mean(),
+        'fish_length_std':fish_length['fishLenEst'].std(),
         'total_bouts_aligned':total_bouts_aligned,
         'ver':program_version
     }
@@ -0,0 +1,115 @@
+'''
+Write analysis outputs to .h5 files
+Functions:
+    1. Write all output dataframes into all_data.h5, bout_data.h5 and IEI_data.h5, keeping one open HDFStore per file
+    2. Write aligned bouts as a 3D array (bouts, frames, features) into aligned_bouts.h5
+
+Frame-level tables that are read as a whole (FIXED_KEYS: grabbed_all, baseline_angVel, heading_matched) are saved in fixed format, which is faster to write and read. Other tables are saved in table format, which allows selecting columns and rows when reading.
+Time columns of one-per-bout and one-per-IEI tables (DATA_COLUMNS) are saved as data columns, so rows can be selected by time, e.g. pd.read_hdf(file, 'prop_bout2', where="aligned_time >= '2022-12-12 09:00'").
+Use hdf_format='table' to save all tables in table format as in previous versions. Both formats can be read by pd.read_hdf().
+Tables are compressed with blosc:zstd at level 1 by default, which is about as fast to write as uncompressed tables. Higher levels are slower to write and save little more space. Set complevel=0 for uncompressed files.
+
+aligned_bouts.h5 contains one chunked array 'prop_bout_aligned' of float columns of prop_bout_aligned, shape (bouts, frames, features). Feature names are saved in the 'features' attribute.
+Each run of the analysis has a run id, saved in the 'run_id' attribute of the aligned array and of prop_bout_aligned in bout_data.h5. Readers only use aligned_bouts.h5 written in the same run as bout_data.h5.
+Bouts are in the same order as prop_bout2 in bout_data.h5, which holds the attributes of each bout. Each chunk contains frames of one feature of up to CHUNK_BOUTS bouts, so reading a few features doesn't load the others.
+Use plot_functions/data_access.py in SAMPL_visualization to read aligned bouts.
+'''
+
+import os
+import pandas as pd
+import tables
+
+# keys of each output file, in the order of writing
+OUTPUT_FILES = {
+    'all_data.h5':['grabbed_all','baseline_angVel','epoch_attributes','heading_matched','epoch_pitch_heading_RMS'],
+    'bout_data.h5':['bout_attributes','prop_bout_aligned','prop_bout2','prop_bout_aligned_long','prop_bout_aligned_long2'],
+    'IEI_data.h5':['IEI_attributes','prop_bout_IEI_aligned','prop_bout_IEI2','prop_bout_IEI_timed','wolpert_IEI'],
+}
+# bulk frame-level tables saved in fixed format if hdf_format='auto'
+FIXED_KEYS = ['grabbed_all','baseline_angVel','heading_matched']
+# time columns saved as data columns in table format, for selecting rows by time with where=
+DATA_COLUMNS = {
+    'prop_bout2':['aligned_time'],
+    'prop_bout_IEI2':['propBoutIEItime'],
+}
+DEFAULT_COMPLIB = 'blosc:zstd'
+DEFAULT_COMPLEVEL = 1
+ALIGNED_FILE = 'aligned_bouts.h5'
+ALIGNED_KEY = 'prop_bout_aligned'
+# number of bouts per chunk of aligned_bouts.h5
+CHUNK_BOUTS = 256
+# attribute of prop_bout_aligned in bout_data.h5 and aligned_bouts.h5 identifying the run that wrote them
+RUN_ID_ATTR = 'run_id'
+
+def get_key_format(key, hdf_format):
+    """Get the format to save a key
+
+    Args:
+        key (string): name of the output dataframe
+        hdf_format (string): 'auto', 'table' or 'fixed'
+
+    Returns:
+        string: 'table' or 'fixed'
+    """
+    if hdf_format == 'auto':
+        return 'fixed' if key in FIXED_KEYS else 'table'
+    elif hdf_format in ['table', 'fixed']:
+        return hdf_format
+    raise ValueError(f"unknown hdf format: {hdf_format}")
+
+def write_outputs(output_dir, outputs, hdf_format='auto', complib=DEFAULT_COMPLIB, complevel=DEFAULT_COMPLEVEL, run_id=None):
+    """Write output dataframes into all_data.h5, bout_data.h5 and IEI_data.h5. Existing files are overwritten
+
+    Args:
+        output_dir (string): directory of the data folder
+        outputs (dict): output dataframes, keys are listed in OUTPUT_FILES
+        hdf_format (string, optional): 'auto', 'table' or 'fixed'. Defaults to 'auto', fixed format for FIXED_KEYS and table format for others.
+        complib (string, optional): compression library. Defaults to 'blosc:zstd'.
+        complevel (int, optional): compression level, 0 to 9. Defaults to 1, 0 for no compression.
+        run_id (string, optional): id of the analysis run, saved with prop_bout_aligned to match aligned_bouts.h5. Defaults to None, not saved.
+    """
+    for filename, keys in OUTPUT_FILES.items():
+        with pd.HDFStore(f'{output_dir}/{filename}', mode='w', complib=complib if complevel else None, complevel=complevel) as store:
+            for key in keys:
+                df = outputs[key]
+                if get_key_format(key, hdf_format) == 'table':
+                    # expectedrows sets the chunk shape of the table for the number of rows saved
+                    data_columns = [col for col in DATA_COLUMNS.get(key, []) if col in df.columns]
+                    store.append(key, df, format='table', data_columns=data_columns, expectedrows=max(len(df), 1))
+                else:
+                    store.put(key, df, format='fixed')
+                if key == ALIGNED_KEY and run_id is not None:
+                    setattr(store.get_storer(key).attrs, RUN_ID_ATTR, run_id)
+
+def write_aligned_bouts(output_dir, prop_bout_aligned, n_bouts, run_id, complib=DEFAULT_COMPLIB, complevel=DEFAULT_COMPLEVEL):
+    """Write float columns of aligned bouts as a 3D array into aligned_bouts.h5. If there's no bout, nothing is written and aligned_bouts.h5 of previous runs is removed
+
+    Args:
+        output_dir (string): directory of the data folder
+        prop_bout_aligned (DataFrame): aligned bouts, same number of frames for each bout
+        n_bouts (int): number of bouts
+        run_id (string): id of the analysis run, same as the run_id passed to write_outputs()
+        complib (string, optional): compression library. Defaults to 'blosc:zstd'.
+        complevel (int, optional): compression level, 0 to 9. Defaults to 1, 0 for no compression.
+    """
+    if n_bouts == 0:
+        remove_aligned_bouts(output_dir)
+        return
+    features = [col for col, dtype in prop_bout_aligned.dtypes.items() if dtype.kind == 'f']
+    n_frames = len(prop_bout_aligned) // n_bouts
+    values = prop_bout_aligned[features].to_numpy().reshape(n_bouts, n_frames, len(features))
+    filters = tables.Filters(complevel=complevel, complib=complib) if complevel else None
+    with tables.open_file(f'{output_dir}/{ALIGNED_FILE}', mode='w') as h5:
+        aligned = h5.create_carray('/', ALIGNED_KEY, obj=values, filters=filters, chunkshape=(min(n_bouts, CHUNK_BOUTS), n_frames, 1))
+        aligned.attrs.features = features
+        setattr(aligned.attrs, RUN_ID_ATTR, run_id)
+
+def remove_aligned_bouts(output_dir):
+    """Remove aligned_bouts.h5 of previous runs. Readers use aligned_bouts.h5 if it exists, it needs to be removed if it's not rewritten with bout_data.h5
+
+    Args:
+        output_dir (string): directory of the data folder
+    """
+    aligned_file = os.path.join(output_dir, ALIGNED_FILE)
+    if os.path.isfile(aligned_file):
+        os.remove(aligned_file)
@@ -0,0 +1,109 @@
+'''
+Batched extraction of inter-event interval (IEI) values
+Functions:
+    1. Calculate 1-per-IEI values (mean pitch, angular velocity, angular acceleration, y velocity, heading...) of all IEIs at once from prefix sums
+    2. Gather timed heading and pitch after the previous bout and before the next bout of all IEIs into one (IEIs, frames, 4) array
+
+An IEI starts at the end of the previous bout (swim_end, +1 to match the Matlab code) and ends at the start of the next bout (swim_start). Both bouts are in the same epoch.
+Frame positions are row positions of df, which has a default index. Windows [a, b] include both ends, same as df.loc[a:b].
+
+IEIs shorter than IEI_tail frames, and timed windows that reach outside the epoch of the IEI, are filled with TIMED_FILL (500) in timed results.
+'''
+
+import math
+import numpy as np
+import pandas as pd
+from bout_analysis.window_stats import get_prefix_sums, window_means
+
+# value of timed results for IEIs that are too short or too close to epoch edges
+TIMED_FILL = 500
+
+def get_IEI_values(df, swim_end, swim_start, sample_rate, post_bout_buf, pre_bout_buf, IEI_2_swim_buf, IEI_tail):
+    """Calculate 1-per-IEI values of all IEIs
+
+    Args:
+        df (DataFrame): data with default index, including ang, angVelSmoothed, yvel, x, y
+        swim_end (array): end frame of the previous bout of each IEI, +1 to match the Matlab code
+        swim_start (array): start frame of the next bout of each IEI
+        sample_rate (int): frame rate
+        post_bout_buf (int): frames after swim_end to exclude
+        pre_bout_buf (int): frames before swim_start to exclude
+        IEI_2_swim_buf (int): frames before swim_start to exclude for mean pitch and angular velocity
+        IEI_tail (int): number of frames of timed windows. heading is only calculated for IEIs at least IEI_tail long
+
+    Returns:
+        DataFrame: propBoutIEI_pitch, propBoutIEI_angVel, propBoutIEI_angAcc, propBoutIEI_pauseDur, propBoutIEI_yvel, IEI_matchIndex, rowsInRes, propBoutIEI_heading of each IEI
+    """
+    swim_end = np.asarray(swim_end).astype('int64')
+    swim_start = np.asarray(swim_start).astype('int64')
+    bout_end_post = swim_end + post_bout_buf  # where last bout ends
+    bout_start_pre = swim_start - IEI_2_swim_buf  # where next bout starts
+    bout_end_5frames = swim_end + math.ceil(0.05*sample_rate)  # why use 0.05 but not POST_BOUT_BUF for duration calculation???????
+    bout_start_4frames = swim_start - pre_bout_buf
+
+    # NOTE: smoothed results are used for angVel and angAccel
+    angVel = df['angVelSmoothed'].to_numpy(dtype='float64')
+    # diff() of frames [a, b] are differences of frames a+1 to b
+    angVel_diff = np.concatenate(([np.nan], np.diff(angVel)))
+    x = df['x'].to_numpy(dtype='float64')
+    y = df['y'].to_numpy(dtype='float64')
+
+    # heading of IEIs long enough. NOTE: headings below are different from the Matlab code. X differences are not abs()
+    if_long = swim_start - swim_end >= IEI_tail
+    heading = np.full(len(swim_start), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        heading[if_long] = np.degrees(np.arctan(
+            (y[swim_start[if_long]] - y[swim_end[if_long]])
+            / np.absolute(x[swim_start[if_long]] - x[swim_end[if_long]])
+        ))
+
+    return pd.DataFrame({
+        'propBoutIEI_pitch':window_means(get_prefix_sums(df['ang'].values), bout_end_post, bout_start_pre),
+        'propBoutIEI_angVel':window_means(get_prefix_sums(angVel), bout_end_post, bout_start_pre),
+        'propBoutIEI_angAcc':window_means(get_prefix_sums(angVel_diff), bout_end_post+1, bout_start_4frames),
+        'propBoutIEI_pauseDur':(bout_start_4frames - bout_end_5frames) / sample_rate,
+        # why use 0.3 but not POST_BOUT_BUF for yvel???????????
+        'propBoutIEI_yvel':window_means(get_prefix_sums(df['yvel'].values), swim_end+math.ceil(0.3*sample_rate), bout_start_4frames),
+        'IEI_matchIndex':np.arange(len(swim_start), dtype='float64'),
+        'rowsInRes':(bout_start_4frames - bout_end_5frames + 1).astype('float64'),
+        'propBoutIEI_heading':heading,
+    })
+
+def get_IEI_timed(df, swim_end, swim_start, epoch_num, IEI_tail):
+    """Gather timed heading and pitch of all IEIs into one array
+    timedHeading and timedPitch: IEI_tail frames after the end of the previous bout
+    timedHeadingPre and timedPitchPre: IEI_tail frames before the start of the next bout
+
+    Args:
+        df (DataFrame): data with default index, including ang, x, y, epochNum
+        swim_end (array): end frame of the previous bout of each IEI, +1 to match the Matlab code
+        swim_start (array): start frame of the next bout of each IEI
+        epoch_num (array): epoch number of each IEI
+        IEI_tail (int): number of frames of timed windows
+
+    Returns:
+        ndarray: shape (IEIs, IEI_tail, 4), features are timedHeading, timedPitch, timedHeadingPre, timedPitchPre
+    """
+    swim_end = np.asarray(swim_end).astype('int64')
+    swim_start = np.asarray(swim_start).astype('int64')
+    epoch_num = np.asarray(epoch_num)
+    ang = df['ang'].to_numpy(dtype='float64')
+    x = df['x'].to_numpy(dtype='float64')
+    y = df['y'].to_numpy(dtype='float64')
+    df_epoch = df['epochNum'].to_numpy()
+    n_frames = len(df)
+
+    timed = np.full((len(swim_start), IEI_tail, 4), float(TIMED_FILL))
+    if_long = swim_start - swim_end >= IEI_tail
+    # if there's enough rows in the current epoch for getting (swim_end + IEI_tail) and (swim_start - IEI_tail)
+    if_post = if_long & (df_epoch[np.clip(swim_end + IEI_tail, 0, n_frames-1)] == epoch_num)
+    if_pre = if_long & (df_epoch[np.clip(swim_start - IEI_tail, 0, n_frames-1)] == epoch_num)
+
+    # frames of timed windows, IEI_tail+1 frames to take diff()
+    post_frames = swim_end[if_post][:,None] + np.arange(IEI_tail+1)
+    pre_frames = swim_start[if_pre][:,None] + np.arange(-IEI_tail, 1)
+    timed[if_post, :, 0] = np.degrees(np.arctan2(np.diff(y[post_frames], axis=1), np.absolute(np.diff(x[post_frames], axis=1))))  # use abs() to get rid of x directionality
+    timed[if_post, :, 1] = ang[post_frames[:, :-1]]
+    timed[if_pre, :, 2] = np.degrees(np.arctan2(np.diff(y[pre_frames], axis=1), np.absolute(np.diff(x[pre_frames], axis=1))))
+    timed[if_pre, :, 3] = ang[pre_frames[:, 1:]]
+    return timed
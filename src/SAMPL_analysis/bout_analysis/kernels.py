@@ -0,0 +1,199 @@
+'''
+Compiled kernels for sequential steps of bout detection
+Functions:
+    1. Link swim windows separated by short intervals in one pass through the frames
+    2. Find the first max value in each window of frames, used to find speed peaks of swim windows and speed inflections of bouts
+    3. Smooth values in each window with the MATLAB smooth() moving average and find the max difference between smoothed frames, used for boutAccAlign
+
+Kernels are compiled with numba if it is installed and jit=True. Otherwise the NumPy implementations are used, which give the same results.
+link_swim_gaps() replaces bout_windows.link_swim_windows() in bout_windows.find_swim_windows(jit=True).
+Compiled kernels loop through frames of each window without building padded (windows, frames) arrays.
+Compiled kernels are cached in __pycache__, the first run after installing or updating takes a few seconds to compile.
+
+Windows [start, end] include both ends, frame positions are row positions of df, which has a default index.
+
+To use, call grab_fish_angle(analyzed, fish_length, sample_rate, jit=True), or SAMPL_analysis(root, frame_rate, jit=True).
+'''
+
+import numpy as np
+from datetime import timedelta
+from preprocessing.epoch_ops import smooth_segments_ML
+from bout_analysis.window_gather import get_ragged_frames
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+def _compile(func):
+    """Compile a kernel with numba, returns None if numba is not installed
+    """
+    if numba is None:
+        return None
+    return numba.njit(cache=True, nogil=True)(func)
+
+def if_jit(jit):
+    """Whether compiled kernels are used
+
+    Args:
+        jit (bool): whether compiled kernels are requested
+
+    Returns:
+        bool: True if jit and numba is installed
+    """
+    return bool(jit) and numba is not None
+
+def _link_swim_gaps_loop(swim_indicator, abs_time, min_interval):
+    res = swim_indicator.copy()
+    n = len(swim_indicator)
+    # runs start from the second frame, runs with a different swim indicator from the first frame have odd locomotion indices (swim windows)
+    first = swim_indicator[0]
+    last_swim_end = -1
+    i = 1
+    while i < n:
+        j = i
+        while j + 1 < n and swim_indicator[j + 1] == swim_indicator[i]:
+            j += 1
+        if swim_indicator[i] != first:
+            if last_swim_end >= 0 and abs_time[i] - abs_time[last_swim_end] < min_interval:
+                for k in range(last_swim_end + 1, i):
+                    res[k] = 1
+            last_swim_end = j
+        i = j + 1
+    return res
+
+def _window_argmax_loop(values, window_start, window_end):
+    res = np.full(len(window_start), np.nan)
+    for w in range(len(window_start)):
+        best = -np.inf
+        for k in range(max(window_start[w], 0), min(window_end[w], len(values) - 1) + 1):
+            # first max, NaN is skipped
+            if values[k] > best or (np.isnan(res[w]) and values[k] == best):
+                best = values[k]
+                res[w] = k
+    return res
+
+def _smooth_diff_argmax_loop(values, window_start, window_end, WSZ):
+    half = (WSZ - 1) // 2
+    res = np.full(len(window_start), np.nan)
+    smoothed = np.empty(np.max(window_end - window_start) + 1)
+    for w in range(len(window_start)):
+        start = window_start[w]
+        n = window_end[w] - start + 1
+        # same as smooth_segments_ML(): moving average of WSZ frames, NaN is not skipped
+        for k in range(half, n - half):
+            total = 0.0
+            for m in range(k - half, k + half + 1):
+                total += values[start + m]
+            smoothed[k] = total / WSZ
+        # frames near edges: average of 1, 3, 5... frames, NaN is skipped unless the farthest frame is NaN
+        total_start = 0.0
+        total_stop = 0.0
+        for m in range(2 * half - 1):
+            v = values[start + m]
+            if not np.isnan(v):
+                total_start += v
+            v = values[start + n - 1 - m]
+            if not np.isnan(v):
+                total_stop += v
+            if m % 2 == 0:
+                r = m + 1
+                v = values[start + m]
+                smoothed[m // 2] = np.nan if np.isnan(v) else total_start / r
+                v = values[start + n - 1 - m]
+                smoothed[n - 1 - m // 2] = np.nan if np.isnan(v) else total_stop / r
+        # first max of differences between smoothed frames, NaN is skipped
+        best = -np.inf
+        for k in range(n - 1):
+            d = smoothed[k + 1] - smoothed[k]
+            if d > best or (np.isnan(res[w]) and d == best):
+                best = d
+                res[w] = start + k + 1
+    return res
+
+_link_swim_gaps_jit = _compile(_link_swim_gaps_loop)
+_window_argmax_jit = _compile(_window_argmax_loop)
+_smooth_diff_argmax_jit = _compile(_smooth_diff_argmax_loop)
+
+def link_swim_gaps(swim_indicator, abs_time, min_swim_interval):
+    """Link swim windows closer than min_swim_interval by setting frames between them as swim, same as bout_windows.link_swim_windows().
+    Runs the compiled kernel, or the same loop in Python if numba is not installed. bout_windows.find_swim_windows() calls this function only if compiled kernels are used
+
+    Args:
+        swim_indicator (array): swim indicator of each frame
+        abs_time (array): datetime of each frame
+        min_swim_interval (float): minimum interval between swim windows in seconds
+
+    Returns:
+        ndarray: adjusted swim indicator
+    """
+    swim_indicator = np.asarray(swim_indicator)
+    if len(swim_indicator) == 0:
+        return swim_indicator.copy()
+    abs_time = np.asarray(abs_time, dtype='datetime64[ns]').view('int64')
+    min_interval = np.timedelta64(timedelta(seconds=min_swim_interval)).astype('timedelta64[ns]').astype('int64')
+    if numba is None:
+        return _link_swim_gaps_loop(swim_indicator, abs_time, min_interval)
+    return _link_swim_gaps_jit(swim_indicator, abs_time, min_interval)
+
+def window_argmax(values, window_start, window_end, jit=False):
+    """Frame of the first max value in each window ignoring NaN, same as values.loc[start:end].idxmax() of each window
+
+    Args:
+        values (array): values of each frame
+        window_start (array): first frame (position) of each window
+        window_end (array): last frame (position) of each window, inclusive
+        jit (bool, optional): whether to use the compiled kernel. Defaults to False.
+
+    Returns:
+        ndarray: frame (position) of the max value of each window, float. NaN if all values in the window are NaN
+    """
+    values = np.asarray(values, dtype='float64')
+    window_start = np.asarray(window_start, dtype='int64')
+    window_end = np.asarray(window_end, dtype='int64')
+    if if_jit(jit):
+        return _window_argmax_jit(values, window_start, window_end)
+    res = np.full(len(window_start), np.nan)
+    window_start = np.clip(window_start, 0, None)
+    window_end = np.clip(window_end, None, len(values)-1)
+    if_frames = window_end >= window_start
+    if not if_frames.any():
+        return res
+    # windows are gathered into a flat array and reduced as segments
+    frames, offsets = get_ragged_frames(window_start[if_frames], window_end[if_frames])
+    window_values = values[frames]
+    window_max = np.fmax.reduceat(window_values, offsets[:-1])
+    if_max = window_values == np.repeat(window_max, np.diff(offsets))
+    first_max = np.minimum.reduceat(np.where(if_max, frames, len(values)), offsets[:-1])
+    res[if_frames] = np.where(np.isnan(window_max), np.nan, first_max)
+    return res
+
+def smooth_diff_argmax(values, window_start, window_end, WSZ, jit=False):
+    """Smooth values in each window with the MATLAB smooth() moving average, see epoch_ops.smooth_segments_ML(), and find the first max difference between consecutive smoothed frames
+
+    Args:
+        values (array): values of each frame
+        window_start (array): first frame (position) of each window
+        window_end (array): last frame (position) of each window, inclusive. Windows need to be at least WSZ frames long and inside values
+        WSZ (int): smoothing window size, odd number
+        jit (bool, optional): whether to use the compiled kernel. Defaults to False.
+
+    Returns:
+        ndarray: frame (position) of the max difference of each window, which is the later frame of the two, float. NaN if all differences are NaN
+    """
+    values = np.asarray(values, dtype='float64')
+    window_start = np.asarray(window_start, dtype='int64')
+    window_end = np.asarray(window_end, dtype='int64')
+    if np.any(window_end - window_start + 1 < WSZ):
+        raise ValueError(f"segments need to be at least {WSZ} frames long for smoothing")
+    if len(window_start) == 0:
+        return np.array([], dtype='float64')
+    if if_jit(jit):
+        return _smooth_diff_argmax_jit(values, window_start, window_end, WSZ)
+    frames, offsets = get_ragged_frames(window_start, window_end)
+    smoothed = smooth_segments_ML(values[frames], offsets, WSZ)
+    # differences within windows, the first frame of each window has no difference
+    smoothed_diff = np.empty_like(smoothed)
+    smoothed_diff[1:] = np.diff(smoothed)
+    smoothed_diff[offsets[:-1]] = np.nan
+    return window_argmax(smoothed_diff, offsets[:-1], offsets[1:]-1) - offsets[:-1] + window_start
@@ -0,0 +1,91 @@
+'''
+Write analysis outputs as partitioned Parquet datasets
+Functions:
+    1. Get the date of a .dlm file from its filename
+    2. Write all output dataframes as Parquet datasets, one dataset per key, partitioned by experiment folder and .dlm date
+
+Layout of each data folder:
+    folder/parquet/
+    ├── grabbed_all/
+    │   └── exp=folder/
+    │       ├── date=221212/
+    │       │   └── part-0.parquet
+    │       └── date=221213/
+    │           └── part-0.parquet
+    ├── prop_bout2/
+    ...
+
+Partition values (exp, date) are stored as dictionary-encoded columns when read with partitioning='hive'. The condition (name of the parent folder) is saved as a dictionary-encoded column in each file.
+Rows of each date are in the same order as in .h5 outputs. Dates are read in ascending order.
+Datasets of different data folders can be read together, e.g. pyarrow.dataset.dataset([f'{folder}/parquet/prop_bout2' for folder in folders], partitioning='hive').
+
+To use, call SAMPL_analysis(root, frame_rate, output_backend='parquet') or 'both'. Requires pyarrow. Use plot_functions/data_access.py in SAMPL_visualization to read either backend.
+'''
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+PARQUET_DIR = 'parquet'
+PARTITION_COLS = ['exp', 'date']
+CONDITION_COL = 'condition'
+PARQUET_COMPRESSION = 'zstd'
+
+def get_dlm_date(filename):
+    """Get the date of a .dlm file from its filename, e.g. '221212' for '221212 10.30.00.dlm' or 'fish0 221212 10.30.00.dlm'
+
+    Args:
+        filename (string): .dlm file directory
+
+    Returns:
+        string: date in YYMMDD
+    """
+    # filenames end with the time stamp 'yymmdd HH.MM.SS.dlm', same as in analyze_dlm_v5.analyze_dlm_resliced()
+    return os.path.basename(filename)[-19:-13]
+
+def remove_parquet_outputs(output_dir):
+    """Remove Parquet datasets of previous runs. Readers use Parquet datasets if they exist, they need to be removed if they are not rewritten with .h5 outputs
+
+    Args:
+        output_dir (string): directory of the data folder
+    """
+    shutil.rmtree(os.path.join(output_dir, PARQUET_DIR), ignore_errors=True)
+
+def write_parquet_outputs(output_dir, outputs, row_dates, exp_name, condition):
+    """Write output dataframes as Parquet datasets in output_dir/parquet/. Existing datasets are overwritten
+
+    Args:
+        output_dir (string): directory of the data folder
+        outputs (dict): output dataframes
+        row_dates (dict): date of each row of each output dataframe, see get_dlm_date()
+        exp_name (string): name of the data folder
+        condition (string): name of the condition folder containing the data folder
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to write parquet outputs")
+    root = os.path.join(output_dir, PARQUET_DIR)
+    remove_parquet_outputs(output_dir)
+    for key, df in outputs.items():
+        if df.empty:
+            continue
+        df = df.assign(**{
+            CONDITION_COL:pd.Categorical(np.repeat(condition, len(df))),
+            'exp':exp_name,
+            'date':np.asarray(row_dates[key]),
+        })
+        pq.write_to_dataset(
+            pa.Table.from_pandas(df, preserve_index=False),
+            root_path=os.path.join(root, key),
+            partition_cols=PARTITION_COLS,
+            basename_template='part-{i}.parquet',
+            compression=PARQUET_COMPRESSION,
+            # dictionary encoding only for the condition column, float columns don't benefit from it
+            use_dictionary=[CONDITION_COL],
+        )
@@ -0,0 +1,172 @@
+'''
+Extract aligned windows of frames for all bouts at once
+Functions:
+    1. Build a (bouts, frames) array of row positions from alignment anchors, e.g. the peak speed of each bout
+    2. Gather values of multiple columns into a contiguous (bouts, frames, features) float array with one fancy-index per column
+    3. Convert between the 3D array and long tables indexed by (bout_i, frame_i), which is how aligned data are stored
+
+    4. Gather windows of variable length (e.g. IEIs) into one flat table in a single pass, with offsets of each window
+
+Tables saved to bout_data.h5 (e.g. prop_bout_aligned) are bout-major with a fixed number of frames per bout. Use aligned_table_to_array() to get the 3D array back from them.
+Ragged tables (e.g. prop_bout_IEI_aligned) are window-major. Rows of window k are rows offsets[k] to offsets[k+1]-1, see get_ragged_offsets() and split_ragged().
+'''
+
+import numpy as np
+import pandas as pd
+
+def get_window_frames(anchors, pre_frames, post_frames):
+    """Get row positions of frames in aligned windows
+
+    Args:
+        anchors (array): row position of the alignment frame of each bout
+        pre_frames (int): number of frames before the anchor
+        post_frames (int): number of frames after the anchor
+
+    Returns:
+        ndarray: shape (bouts, pre_frames+post_frames+1)
+    """
+    return np.asarray(anchors, dtype=int)[:,None] + np.arange(-pre_frames, post_frames+1)
+
+def gather_window_array(df, frames, columns):
+    """Gather values of float columns in aligned windows into a 3D array
+
+    Args:
+        df (DataFrame): data with default index
+        frames (ndarray): row positions, shape (bouts, frames), see get_window_frames()
+        columns (list): columns to gather
+
+    Returns:
+        ndarray: float64 array, shape (bouts, frames, features). Features are in the order of columns
+    """
+    window_array = np.empty(frames.shape + (len(columns),), dtype='float64')
+    for j, col in enumerate(columns):
+        window_array[:,:,j] = df[col].to_numpy(dtype='float64')[frames]
+    return window_array
+
+def window_array_to_table(window_array, columns, bout_index=None):
+    """Convert a 3D array of aligned windows to a long table
+
+    Args:
+        window_array (ndarray): shape (bouts, frames, features)
+        columns (list): column names of features
+        bout_index (array, optional): bout_i of each bout. Defaults to None, 0 to bouts-1.
+
+    Returns:
+        DataFrame: indexed by (bout_i, frame_i), one row per frame
+    """
+    n_bouts, n_frames, _ = window_array.shape
+    return pd.DataFrame(window_array.reshape(n_bouts*n_frames, -1), columns=columns, index=get_aligned_index(n_bouts, n_frames, bout_index))
+
+def get_aligned_index(n_bouts, n_frames, bout_index=None):
+    """MultiIndex (bout_i, frame_i) of long tables of aligned windows
+    """
+    if bout_index is None:
+        bout_index = np.arange(n_bouts)
+    return pd.MultiIndex.from_arrays(
+        [np.repeat(np.asarray(bout_index, dtype='int64'), n_frames), np.tile(np.arange(n_frames, dtype='int64'), n_bouts)],
+        names=['bout_i', 'frame_i'])
+
+def gather_aligned(df, anchors, pre_frames, post_frames, columns, bout_index=None):
+    """Gather aligned windows of frames into a long table, same as concatenating df.loc[anchor-pre_frames:anchor+post_frames, columns] of each bout.
+    Float columns are gathered as one 3D array, other columns (datetime, int) are gathered separately to keep their dtypes.
+
+    Args:
+        df (DataFrame): data with default index
+        anchors (array): row position of the alignment frame of each bout
+        pre_frames (int): number of frames before the anchor
+        post_frames (int): number of frames after the anchor
+        columns (list): columns to gather
+        bout_index (array, optional): bout_i of each bout. Defaults to None, 0 to bouts-1.
+
+    Returns:
+        DataFrame: indexed by (bout_i, frame_i), columns in the order of columns
+        ndarray: 3D float array of float columns, shape (bouts, frames, float features)
+    """
+    frames = get_window_frames(anchors, pre_frames, post_frames)
+    float_columns = [col for col in columns if df[col].dtype == 'float64']
+    window_array = gather_window_array(df, frames, float_columns)
+    flat_values = window_array.reshape(frames.size, -1)
+    aligned = {}
+    for col in columns:
+        if col in float_columns:
+            aligned[col] = flat_values[:, float_columns.index(col)]
+        else:
+            aligned[col] = df[col].to_numpy()[frames.ravel()]
+    aligned = pd.DataFrame(aligned, index=get_aligned_index(frames.shape[0], frames.shape[1], bout_index))
+    return aligned, window_array
+
+def aligned_table_to_array(table, n_frames, columns=None):
+    """Reshape a long table of aligned windows (e.g. prop_bout_aligned) into a 3D array
+
+    Args:
+        table (DataFrame): bout-major table with n_frames rows per bout
+        n_frames (int): number of frames per bout
+        columns (list, optional): columns to include. Defaults to None, all columns.
+
+    Returns:
+        ndarray: shape (bouts, n_frames, features)
+    """
+    if columns is None:
+        columns = table.columns.to_list()
+    return table[columns].to_numpy(dtype='float64').reshape(-1, n_frames, len(columns))
+
+def get_ragged_offsets(window_len):
+    """Offsets of windows in a ragged table from the number of rows of each window
+
+    Args:
+        window_len (array): number of rows of each window
+
+    Returns:
+        ndarray: shape (windows+1,), rows of window k are offsets[k] to offsets[k+1]-1
+    """
+    offsets = np.zeros(len(window_len)+1, dtype='int64')
+    np.cumsum(window_len, out=offsets[1:])
+    return offsets
+
+def get_ragged_frames(window_start, window_end):
+    """Row positions of frames of windows of variable length, concatenated
+
+    Args:
+        window_start (array): first frame (position) of each window
+        window_end (array): last frame (position) of each window, inclusive. Windows with end < start are empty
+
+    Returns:
+        ndarray: row positions of all frames, window-major
+        ndarray: offsets of windows, see get_ragged_offsets()
+    """
+    window_start = np.asarray(window_start).astype('int64')
+    window_len = np.maximum(np.asarray(window_end).astype('int64') - window_start + 1, 0)
+    offsets = get_ragged_offsets(window_len)
+    # position of each frame within its window
+    frame_in_window = np.arange(offsets[-1]) - np.repeat(offsets[:-1], window_len)
+    return np.repeat(window_start, window_len) + frame_in_window, offsets
+
+def gather_ragged(df, window_start, window_end, columns):
+    """Gather windows of variable length into one table, same as pd.concat() of df.loc[start:end, columns] of each window with ignore_index=True
+
+    Args:
+        df (DataFrame): data with default index
+        window_start (array): first frame (position) of each window
+        window_end (array): last frame (position) of each window, inclusive
+        columns (list): columns to gather
+
+    Returns:
+        DataFrame: window-major table with default index, columns in the order of columns
+        ndarray: offsets of windows, see get_ragged_offsets()
+    """
+    frames, offsets = get_ragged_frames(window_start, window_end)
+    ragged = df[columns].take(frames)
+    ragged.index = pd.RangeIndex(len(frames))
+    return ragged, offsets
+
+def split_ragged(values, offsets):
+    """Split values of a ragged table into windows
+
+    Args:
+        values (array): values of a ragged table, e.g. prop_bout_IEI_aligned['propBoutIEIAligned_pitch'].values
+        offsets (array): offsets of windows, see get_ragged_offsets()
+
+    Returns:
+        list: values of each window
+    """
+    return np.split(np.asarray(values), np.asarray(offsets)[1:-1])
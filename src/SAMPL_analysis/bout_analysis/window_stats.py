@@ -0,0 +1,65 @@
+'''
+Batched statistics of many frame windows from cumulative sums
+Functions:
+    1. Build prefix sums and prefix counts of non-NaN values of a column
+    2. Calculate sums, counts and means of values in [start, end] windows of all bouts at once
+
+A window [start, end] includes both ends, same as df.loc[start:end] for a df with default index. Windows are clipped to the range of frames, empty windows (start > end) have a mean of NaN.
+Means skip NaN values, same as pd.Series.mean().
+
+To use, get_prefix_sums() once for each column, then window_means() for each set of windows, e.g. pre-bout and post-bout windows of all bouts.
+'''
+
+import numpy as np
+
+def get_prefix_sums(values):
+    """Cumulative sums and counts of non-NaN values, with a leading 0
+
+    Args:
+        values (array): values of each frame
+
+    Returns:
+        ndarray: prefix sums, shape (frames+1,). prefix_sums[k] is the sum of values[:k] ignoring NaN
+        ndarray: prefix counts, shape (frames+1,). prefix_counts[k] is the number of non-NaN values in values[:k]
+    """
+    values = np.asarray(values, dtype='float64')
+    if_valid = ~np.isnan(values)
+    prefix_sums = np.zeros(len(values)+1, dtype='float64')
+    np.cumsum(np.where(if_valid, values, 0), out=prefix_sums[1:])
+    prefix_counts = np.zeros(len(values)+1, dtype='int64')
+    np.cumsum(if_valid, out=prefix_counts[1:])
+    return prefix_sums, prefix_counts
+
+def window_sums(prefix, window_start, window_end):
+    """Sums and counts of non-NaN values in windows
+
+    Args:
+        prefix (tuple): prefix sums and counts, output of get_prefix_sums()
+        window_start (array): first frame (position) of each window
+        window_end (array): last frame (position) of each window, inclusive
+
+    Returns:
+        ndarray: sum of each window
+        ndarray: number of non-NaN values in each window
+    """
+    prefix_sums, prefix_counts = prefix
+    n_frames = len(prefix_sums) - 1
+    lo = np.clip(np.asarray(window_start, dtype='int64'), 0, n_frames)
+    hi = np.clip(np.asarray(window_end, dtype='int64') + 1, 0, n_frames)
+    hi = np.maximum(hi, lo)
+    return prefix_sums[hi] - prefix_sums[lo], prefix_counts[hi] - prefix_counts[lo]
+
+def window_means(prefix, window_start, window_end):
+    """Means of values in windows ignoring NaN. Same as df.loc[start:end, col].mean() of each window
+
+    Args:
+        prefix (tuple): prefix sums and counts, output of get_prefix_sums()
+        window_start (array): first frame (position) of each window
+        window_end (array): last frame (position) of each window, inclusive
+
+    Returns:
+        ndarray: mean of each window, NaN if the window has no valid values
+    """
+    sums, counts = window_sums(prefix, window_start, window_end)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
@@ -5,6 +5,8 @@ import numpy as np # numpy
 from datetime import datetime
 from datetime import timedelta
 import math
+from preprocessing.epoch_ops import get_epoch_segments, to_segments, from_segments, smooth_segments_ML, segment_max, segment_mean, segment_last, segment_rolling3, segment_diff
+from preprocessing.epoch_filters import apply_epoch_filters
 
 # %%
 # Constants
@@ -22,6 +24,9 @@ SCALE = 60           #(pix/mm)
 SM_WINDOW_FOR_FILTER = 9     # smoothing
 SM_WINDOW_FOR_ANGVEL = 5
 
+# columns calculated by derive_kinematics()
+KINEMATICS_COLS = ['xvel','yvel','dist','displ','angVel','angVelSmoothed','angAccel']
+
 # %%
 # Define functions
 def grp_by_epoch(df):
@@ -34,13 +39,9 @@ def smooth_series_ML(a,WSZ):
     a: NumPy 1-D array containing the data to be smoothed
     WSZ: smoothing window size needs, which must be odd number,
     as in the original MATLAB implementation
+    The whole series is smoothed as one segment, see epoch_ops.smooth_segments_ML()
     '''
-    out0 = np.convolve(a,np.ones(WSZ,dtype=int),'valid')/WSZ    
-    r = np.arange(1,WSZ-1,2)
-    start = np.cumsum(a[:WSZ-1])[::2]/r
-    stop = (np.cumsum(a[:-WSZ:-1])[::2]/r)[::-1]
-    res = np.concatenate((  start , out0, stop  ))
-    return pd.Series(data=res, index=a.index)
+    return pd.Series(data=smooth_segments_ML(a, [0, len(a)], WSZ), index=a.index)
 
 def epoch_reslice(df):
     '''
@@ -56,6 +57,7 @@ def epoch_reslice(df):
     return df
 
 # define filter function
+# filters calculate per-epoch values of all epochs at once, see epoch_filters.py. Each returns filtered frames and a rejection count table
 def raw_filter(df,EPOCH_BUF,MIN_DUR):
     # Trim epoch by EPOCH_BUF and filter by duration & fish number
     # First, group by epoch number
@@ -65,57 +67,82 @@ def raw_filter(df,EPOCH_BUF,MIN_DUR):
     del_buf = df[(grouped.cumcount(ascending=False) >= EPOCH_BUF) 
         & (grouped.cumcount() >= EPOCH_BUF)]
     # Flter by epoch duration & number of fish in the frame
-    filtered = grp_by_epoch(del_buf).filter(
-        lambda g: len(g) >= MIN_DUR 
-        # and 
+    order, offsets = get_epoch_segments(del_buf['epochNum'].values)
+    filtered, qc = apply_epoch_filters(del_buf, {
+        'duration': np.diff(offsets) >= MIN_DUR,
         # np.nanmax(g['fishNum'].values) < MAX_FISH
-    )
+    }, order, offsets)
     print(".", end = '')
-    return filtered
+    return filtered, qc
 
 def dur_y_x_filter(df,MAX_DELTA_T):
-    # drop epochs with inexplicably large gaps between frame
-    f1 = grp_by_epoch(df).filter(
-        lambda g: np.nanmax(g['deltaT'].values) <= MAX_DELTA_T
-    # turned off in Kyla's version
-    #     # exclude fish bouts vertically down (sinking faster than 5mm/sec). 
-    #     # Flip the sign so positive deltaY corresponds to upward motion
-    #     and -(np.nanmax(np.diff(g['y'].values, prepend=g['y'].values[0]))) > MIN_VERTICLE_VEL * FRAME_INTERVAL * SCALE
-    )
-    # only keep swims in which fish is pointed in the direction it moves. Within an epoch, if headx is greater than x (pointing right), x.tail should also be greater than x.head, and vice versa.
-    f2 = grp_by_epoch(f1).filter(
-        lambda g: ((g['headx'].mean() - g['x'].mean()) * g.tail(1)['x'].values)[0] >= 0
-    )
+    order, offsets = get_epoch_segments(df['epochNum'].values)
+    x = to_segments(df['x'].values, order)
+    f2, qc = apply_epoch_filters(df, {
+        # drop epochs with inexplicably large gaps between frame
+        'deltaT': segment_max(to_segments(df['deltaT'].values, order), offsets) <= MAX_DELTA_T,
+        # turned off in Kyla's version
+        #     # exclude fish bouts vertically down (sinking faster than 5mm/sec). 
+        #     # Flip the sign so positive deltaY corresponds to upward motion
+        #     and -(np.nanmax(np.diff(g['y'].values, prepend=g['y'].values[0]))) > MIN_VERTICLE_VEL * FRAME_INTERVAL * SCALE
+        # only keep swims in which fish is pointed in the direction it moves. Within an epoch, if headx is greater than x (pointing right), x.tail should also be greater than x.head, and vice versa.
+        'heading_direction': (segment_mean(to_segments(df['headx'].values, order), offsets) - segment_mean(x, offsets)) * segment_last(x, offsets) >= 0,
+    }, order, offsets)
     print(".", end='')
-    return f2
+    return f2, qc
 
 def displ_dist_vel_filter(df,MAX_DIST_TRAVEL):
-    # drop epochs with improbably large instantaneous displacement, which happens where #fish > 1 but appear as 1 fish
-    f1 = grp_by_epoch(df).filter(
-        lambda g: np.nanmax(np.absolute(g['displ'].values)) <= MAX_INST_DISPL
+    order, offsets = get_epoch_segments(df['epochNum'].values)
+    dist = to_segments(df['dist'].values, order)
+    # angVel of all epochs are smoothed in one pass, each epoch separately
+    angVel_sm = smooth_segments_ML(to_segments(df['angVel'].values, order), offsets, SM_WINDOW_FOR_FILTER)
+    f3, qc = apply_epoch_filters(df, {
+        # drop epochs with improbably large instantaneous displacement, which happens where #fish > 1 but appear as 1 fish
+        'displ': segment_max(np.absolute(to_segments(df['displ'].values, order)), offsets) <= MAX_INST_DISPL,
         # exclude epochs with sudden & large instantaneous movement (distance). Found in ~1-2 epochs per .dlm after MAX_INST_DISPL filtration - YZ 2020.05.13
-        # turn off vor now
-        and np.nanmax(np.abs(
-            g['dist'].values - g['dist'].rolling(3, center=True).median().values
-        )) < MAX_DIST_TRAVEL   
-    )
-    # exclude epochs with improbably large angular velocity. use smoothed results
-    f2 = grp_by_epoch(f1).filter(
-        lambda g: np.nanmax(np.abs(
-            smooth_series_ML(g.loc[1:,'angVel'], SM_WINDOW_FOR_FILTER).values
-        )) <= MAX_ANG_VEL
-    )
-    # exclude epochs with improbably large angular accel. numpy calculation is faster
-    f3 = grp_by_epoch(f2).filter(
-        lambda g: np.nanmax(np.abs(g['angAccel'].rolling(3, center=True).mean())) <= MAX_ANG_ACCEL
-        # lambda g: np.nanmax(np.abs(g['angAccel'])) <= MAX_ANG_ACCEL
-    )
+        'dist_jump': segment_max(np.abs(dist - segment_rolling3(dist, offsets, 'median')), offsets) < MAX_DIST_TRAVEL,
+        # exclude epochs with improbably large angular velocity. use smoothed results
+        'angVel': segment_max(np.abs(angVel_sm), offsets) <= MAX_ANG_VEL,
+        # exclude epochs with improbably large angular accel. use moving average (window 3) of angAccel
+        'angAccel': segment_max(np.abs(segment_rolling3(to_segments(df['angAccel'].values, order), offsets, 'mean')), offsets) <= MAX_ANG_ACCEL,
+    }, order, offsets)
     print(".", end="")
-    return f3
+    return f3, qc
+
+def derive_kinematics(df):
+    """Calculate velocity, distance, displacement, angular velocity and angular acceleration of all epochs at once. Differences are calculated within each epoch, the first frame of each epoch is NA
+
+    Args:
+        df (DataFrame): frames with epochNum, x, y, ang and deltaT
+
+    Returns:
+        DataFrame: KINEMATICS_COLS of each frame, same index as df
+    """
+    order, offsets = get_epoch_segments(df['epochNum'].values)
+    xy = to_segments(df[['x','y']].to_numpy(dtype='float64'), order)
+    deltaT = to_segments(df['deltaT'].to_numpy(dtype='float64'), order)
+    xy_diff = segment_diff(xy, offsets)
+    kinematics = np.empty((len(df), len(KINEMATICS_COLS)))
+    # x and y velocity
+    kinematics[:,0] = np.divide(xy_diff[:,0], deltaT)
+    kinematics[:,1] = np.divide(xy_diff[:,1], deltaT)
+    # use numpy function np.linalg.norm() for displacement and distance
+    kinematics[:,2] = np.linalg.norm(xy_diff, axis=1)
+    # since beginning coordinates for each epoch has been set to 0, just use (x, y) values for displ
+    kinematics[:,3] = segment_diff(np.linalg.norm(xy, axis=1), offsets)
+    angVel = np.divide(segment_diff(to_segments(df['ang'].to_numpy(dtype='float64'), order), offsets), deltaT)
+    kinematics[:,4] = angVel
+    # smooth second to last angVel values of each epoch (exclude the first one which is NA)
+    if_first = np.zeros(len(df), dtype=bool)
+    if_first[offsets[:-1]] = True
+    kinematics[:,5] = np.nan
+    kinematics[~if_first,5] = smooth_segments_ML(angVel[~if_first], offsets - np.arange(len(offsets)), SM_WINDOW_FOR_ANGVEL)
+    kinematics[:,6] = np.divide(segment_diff(angVel, offsets), deltaT)
+    return pd.DataFrame(from_segments(kinematics, order), index=df.index, columns=KINEMATICS_COLS)
 
 # %%
 # Main function
-def analyze_dlm_resliced(raw, file_i, file, folder, frame_rate):
+def analyze_dlm_resliced(raw, file_i, file, folder, frame_rate, epoch_qc=None):
     """
     Analyze Free Vertical (YZ 2021.06.18)
     1. Truncate epochs
@@ -129,6 +156,7 @@ def analyze_dlm_resliced(raw, file_i, file, folder, frame_rate):
         file (string): .dlm directory
         folder (string): directory of folder containing the current dlm
         frame_rate (int): frame rate
+        epoch_qc (list, optional): rejection count tables of epoch filters are appended to this list. Defaults to None.
 
     Returns:
         DataFrame: scaled epochs contain quality bouts
@@ -153,7 +181,10 @@ def analyze_dlm_resliced(raw, file_i, file, folder, frame_rate):
         resliced['absy'] = smooth_series_ML(resliced.loc[:,'absy'],XY_SM_WSZ)
         
     # truncate epochs
-    raw_truncate = raw_filter(resliced.reset_index().rename(columns={'index': 'oriIndex'}),EPOCH_BUF,MIN_DUR)
+    raw_truncate, qc = raw_filter(resliced.reset_index().rename(columns={'index': 'oriIndex'}),EPOCH_BUF,MIN_DUR)
+    if epoch_qc is None:
+        epoch_qc = []
+    epoch_qc.append(qc)
 
     raw_truncate.reset_index(inplace=True, drop=True)
 
@@ -191,38 +222,20 @@ def analyze_dlm_resliced(raw, file_i, file, folder, frame_rate):
     ana = ana.join(centered_coordinates)
     
     # Apply filters
-    ana_f = dur_y_x_filter(ana,MAX_DELTA_T)
+    ana_f, qc = dur_y_x_filter(ana,MAX_DELTA_T)
+    epoch_qc.append(qc)
     if ana_f.empty:
         return "> no usable epoch detected > dlm file skipped", 0
     # %%
     # Calculate displacement, distance traveled, angular velocity, angular acceleration and filter epochs
 
-    ana_f_g = grp_by_epoch(ana_f)
-    ana_f = ana_f.assign(
-        # x and y velocity. using np.divide() has shorter runtime than df.div()
-        xvel = np.divide(ana_f_g['x'].diff().values, ana_f['deltaT'].values),
-        yvel = np.divide(ana_f_g['y'].diff().values, ana_f['deltaT'].values),
-        # use numpy function np.linalg.norm() for displacement and distance
-        dist = np.linalg.norm(ana_f_g[['x','y']].diff(), axis=1),
-        # since beginning coordinates for each epoch has been set to 0, just use (x, y) values for displ
-        displ = ana_f.groupby('epochNum', as_index=False, sort=False).apply(
-            lambda g: pd.Series((np.linalg.norm(g[['x','y']], axis=1)),index = g.index).diff()
-        ).reset_index(level=0, drop=True),
-        # array calculation is more time effieient
-        angVel = np.divide(ana_f_g['ang'].diff().values, ana_f['deltaT'].values)
-    )
-    # now let's get smoothed angular vel and angular acceleration
-    ana_f = ana_f.assign(  
-        # loop through each epoch, get second to last angVel values (exclude the first one which is NA)
-        # calculate smooth, keep the index, assign to the new column
-        angVelSmoothed = pd.concat(
-            smooth_series_ML(g.tail(len(g)-1)['angVel'],SM_WINDOW_FOR_ANGVEL) for i, g in grp_by_epoch(ana_f)
-        ),
-        angAccel = np.divide(grp_by_epoch(ana_f)['angVel'].diff().values, ana_f['deltaT'].values),
-    )
+    # derive kinematics of all epochs on numpy arrays
+    ana_f = pd.concat([ana_f, derive_kinematics(ana_f)], axis=1)
 
     # Apply filters, drop previous index
-    ana_ff = displ_dist_vel_filter(ana_f,MAX_DIST_TRAVEL).reset_index(drop=True)
+    ana_ff, qc = displ_dist_vel_filter(ana_f,MAX_DIST_TRAVEL)
+    ana_ff = ana_ff.reset_index(drop=True)
+    epoch_qc.append(qc)
 
     # Acquire fish length from raw data
     ana_ff['fishLen'] = raw.loc[ana_ff['oriIndex'],'fishLen'].values
@@ -0,0 +1,51 @@
+'''
+Compact data types for analyzed data
+In compact mode (SAMPL_analysis(root, frame_rate, compact=True)), analyzed frames and output tables are stored with smaller data types:
+    float64 -> float32 for kinematics (angles, coordinates, velocities...)
+    float64 -> int64 for integer ids stored as floats (epochNum, frame indices), if there's no NaN. Ids with NaN stay float64
+    int64 -> int32 for frame and bout indices, except for epochNum which may exceed the int32 range after epoch reslicing
+Datetime and boolean columns are not changed. Time in seconds from the start of a recording (time) stays float64, float32 can't resolve frame intervals of 24 hr recordings.
+'''
+
+import numpy as np
+
+# float columns holding integer ids or frame indices
+ID_COLUMNS = [
+    'epochNum',
+    'swimWindow',
+    'swim_end_shift',
+    'boutInflectAlign',
+    'boutAccAlign',
+    'IEI_matchIndex',
+    'rowsInRes',
+]
+# columns kept as float64
+FLOAT64_COLUMNS = ['time']
+# integer columns kept as int64
+INT64_COLUMNS = ['epochNum']
+
+def compact_dtypes(df):
+    """Convert columns of df to compact data types
+
+    Args:
+        df (DataFrame): analyzed data
+
+    Returns:
+        DataFrame: data with compact types, index is not changed
+    """
+    new_types = {}
+    for col, dtype in df.dtypes.items():
+        if col in FLOAT64_COLUMNS:
+            continue
+        if dtype == 'float64':
+            if col in ID_COLUMNS:
+                values = df[col].to_numpy()
+                if not np.isnan(values).any() and np.array_equal(values, np.round(values)):
+                    new_types[col] = 'int64'
+            else:
+                new_types[col] = 'float32'
+        elif dtype == 'int64' and col not in INT64_COLUMNS:
+            new_types[col] = 'int32'
+    if not new_types:
+        return df
+    return df.astype(new_types, copy=False)
@@ -0,0 +1,147 @@
+'''
+Persistent cache for parsed .dlm files
+Parsed and type-cast .dlm data (output of read_dlm) are saved as binary .npy files in a ".dlm_cache" folder next to the .dlm files.
+Reruns of the analysis load the .npy file instead of parsing the text file again.
+
+Cache entries are keyed by file size, modification time and content hash of the .dlm file:
+    <cache dir>/<dlm name>.json     size, mtime and content hash of the .dlm when it was last parsed
+    <cache dir>/<dlm name>.<hash>.npy     parsed data. First column is the row index, followed by data columns
+The content hash is only recalculated if size or mtime of the .dlm file changed.
+Least recently used entries are deleted when the total size of the cache folder exceeds the disk budget.
+'''
+
+import os
+import glob
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+CACHE_DIR_NAME = '.dlm_cache'
+DEFAULT_CACHE_BUDGET = 20 * 1024**3  # bytes, disk budget of each cache folder
+HASH_BLOCK_SIZE = 16 * 1024**2  # bytes, block size for reading .dlm files when calculating hash
+
+def get_cache_dir(filename):
+    """directory of the cache folder for a .dlm file
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR_NAME)
+
+def content_hash(filename):
+    """calculate blake2b hash of file content
+
+    Args:
+        filename (string): file directory
+
+    Returns:
+        string: hex digest
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def get_cache_key(filename):
+    """get size, mtime and content hash of a .dlm file. Reuse the previous hash if size and mtime haven't changed
+
+    Args:
+        filename (string): directory of the .dlm file
+
+    Returns:
+        dict: cache key
+    """
+    stat = os.stat(filename)
+    key = {'size':stat.st_size, 'mtime':stat.st_mtime_ns}
+    key_file = os.path.join(get_cache_dir(filename), os.path.basename(filename)+'.json')
+    try:
+        with open(key_file) as f:
+            previous_key = json.load(f)
+    except (FileNotFoundError, ValueError):
+        previous_key = {}
+    if (previous_key.get('size'), previous_key.get('mtime')) == (key['size'], key['mtime']):
+        key['hash'] = previous_key['hash']
+    else:
+        key['hash'] = content_hash(filename)
+    key['columns'] = previous_key.get('columns')
+    return key
+
+def get_cache_file(filename, key):
+    return os.path.join(get_cache_dir(filename), f"{os.path.basename(filename)}.{key['hash']}.npy")
+
+def load_cached_dlm(filename):
+    """load parsed .dlm data from cache
+
+    Args:
+        filename (string): directory of the .dlm file
+
+    Returns:
+        DataFrame: parsed .dlm data. None if no valid cache entry found
+        dict: cache key of the .dlm file
+    """
+    key = get_cache_key(filename)
+    cache_file = get_cache_file(filename, key)
+    if key['columns'] is None or not os.path.isfile(cache_file):
+        return None, key
+    try:
+        values = np.load(cache_file)
+    except (OSError, ValueError):
+        return None, key
+    # mark as recently used
+    os.utime(cache_file)
+    raw = pd.DataFrame(values[:,1:], index=values[:,0].astype('int64'), columns=key['columns'])
+    return raw, key
+
+def save_cached_dlm(filename, raw, key, budget=DEFAULT_CACHE_BUDGET):
+    """save parsed .dlm data to cache, then evict least recently used entries to fit the disk budget
+
+    Args:
+        filename (string): directory of the .dlm file
+        raw (DataFrame): parsed .dlm data, output of read_dlm()
+        key (dict): cache key of the .dlm file, see load_cached_dlm()
+        budget (int, optional): disk budget of the cache folder in bytes. Defaults to DEFAULT_CACHE_BUDGET.
+    """
+    values = np.empty((len(raw), raw.shape[1]+1), dtype='float64')
+    values[:,0] = raw.index.to_numpy()
+    values[:,1:] = raw.to_numpy(dtype='float64')
+    if values.nbytes > budget:
+        return
+    cache_dir = get_cache_dir(filename)
+    os.makedirs(cache_dir, exist_ok=True)
+    # remove outdated entries of the same .dlm
+    for old_file in glob.glob(os.path.join(cache_dir, glob.escape(os.path.basename(filename))+'.*.npy')):
+        os.remove(old_file)
+    # write to a temporary file first so that an interrupted run doesn't leave a broken entry
+    cache_file = get_cache_file(filename, key)
+    with open(cache_file+'.tmp', 'wb') as f:
+        np.save(f, values)
+    os.replace(cache_file+'.tmp', cache_file)
+    key = dict(key, columns=raw.columns.to_list())
+    key_file = os.path.join(cache_dir, os.path.basename(filename)+'.json')
+    with open(key_file+'.tmp', 'w') as f:
+        json.dump(key, f)
+    os.replace(key_file+'.tmp', key_file)
+    evict_lru(cache_dir, budget)
+
+def evict_lru(cache_dir, budget=DEFAULT_CACHE_BUDGET):
+    """delete least recently used cache entries until the total size of the cache folder fits the disk budget
+
+    Args:
+        cache_dir (string): directory of the cache folder
+        budget (int, optional): disk budget in bytes. Defaults to DEFAULT_CACHE_BUDGET.
+    """
+    entries = []
+    for cache_file in glob.glob(os.path.join(cache_dir, '*.npy')):
+        try:
+            stat = os.stat(cache_file)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, cache_file))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, cache_file in sorted(entries):
+        if total_size <= budget:
+            break
+        try:
+            os.remove(cache_file)
+        except FileNotFoundError:
+            pass
+        total_size -= size
@@ -0,0 +1,53 @@
+'''
+Epoch filter engine
+Epochs are filtered by per-epoch aggregates (max, mean, last value...) calculated with segmented reductions, see epoch_ops.py.
+Each filter is a check that returns True for epochs to keep. All checks of a filter step are combined, and rejected epochs are dropped through a single boolean mask of frames.
+
+Filter steps also return a rejection count table for QC, one row per check:
+    filter: name of the check
+    epochs_in: number of epochs passing previous checks
+    epochs_rejected: number of epochs rejected by the check. Each epoch is counted under the first check it fails, same as applying checks one after another
+    frames_rejected: number of frames of rejected epochs
+'''
+
+import numpy as np
+import pandas as pd
+from preprocessing.epoch_ops import from_segments
+
+QC_COLUMNS = ['filter', 'epochs_in', 'epochs_rejected', 'frames_rejected']
+
+def apply_epoch_filters(df, epoch_checks, order, offsets):
+    """Drop epochs that fail any check, same as groupby('epochNum').filter() with the checks applied one after another
+
+    Args:
+        df (DataFrame): frames of epochs
+        epoch_checks (dict): name of each check: boolean array, True for epochs to keep. Epochs are in the order of segments
+        order (ndarray): output of epoch_ops.get_epoch_segments() of df['epochNum']
+        offsets (ndarray): output of epoch_ops.get_epoch_segments() of df['epochNum']
+
+    Returns:
+        DataFrame: frames of epochs that pass all checks, original index is kept
+        DataFrame: rejection counts of each check
+    """
+    epoch_len = np.diff(offsets)
+    if_keep = np.ones(len(epoch_len), dtype=bool)
+    qc = []
+    for name, if_pass in epoch_checks.items():
+        if_rejected = if_keep & ~np.asarray(if_pass, dtype=bool)
+        qc.append([name, if_keep.sum(), if_rejected.sum(), epoch_len[if_rejected].sum()])
+        if_keep &= ~if_rejected
+    frame_mask = from_segments(np.repeat(if_keep, epoch_len), order)
+    return df.loc[frame_mask], pd.DataFrame(qc, columns=QC_COLUMNS)
+
+def sum_qc(qc_tables):
+    """Sum rejection counts of the same checks, e.g. of chunks of a .dlm file
+
+    Args:
+        qc_tables (list): rejection count tables
+
+    Returns:
+        DataFrame: rejection counts of each check, in the order of first appearance
+    """
+    if not qc_tables:
+        return pd.DataFrame(columns=QC_COLUMNS)
+    return pd.concat(qc_tables).groupby('filter', sort=False).sum().reset_index()
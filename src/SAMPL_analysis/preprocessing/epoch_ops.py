@@ -0,0 +1,178 @@
+'''
+Segmented operations on epochs
+Functions:
+    1. Arrange frames into segments of consecutive rows, one segment per epoch, described by an offsets array
+    2. Smooth all segments in one pass with the MATLAB smooth() moving average, including the shrinking windows at the edges of each segment
+    3. Reduce each segment to its max, mean or last value
+    4. Centered rolling median/mean of 3 frames within each segment
+    5. Differences between consecutive frames within each segment
+
+Segment k consists of rows offsets[k] to offsets[k+1]-1 of a flat array. Epochs are grouped the same way as df.groupby('epochNum', sort=False): segments are in the order of the first frame of each epoch, frames keep their order within each epoch.
+To use, get_epoch_segments() of frames, rearrange values with to_segments(), run segmented functions, then rearrange results back with from_segments().
+
+smooth_segments_ML() is the smoothing primitive used by smooth_series_ML() (a whole series as one segment), per-epoch smoothing in analyze_dlm_v5.py and per-window smoothing in bout_analysis/kernels.py.
+'''
+
+import numpy as np
+import pandas as pd
+
+def cumsum_skipna(a):
+    """Cumulative sum along rows skipping NaN, same as pd.Series.cumsum(), which is what np.cumsum() calls on a Series
+
+    Args:
+        a (ndarray): 2D array
+
+    Returns:
+        ndarray: cumulative sum of each row, NaN where a is NaN
+    """
+    if_nan = np.isnan(a)
+    res = np.cumsum(np.where(if_nan, 0, a), axis=1)
+    res[if_nan] = np.nan
+    return res
+
+def get_epoch_segments(epoch_num):
+    """Arrange frames into one segment per epoch
+
+    Args:
+        epoch_num (array): epoch number of each frame
+
+    Returns:
+        ndarray: positions of frames sorted by segment, values[order] is the flat array of segments. None if frames of each epoch are already consecutive
+        ndarray: offsets of segments, shape (epochs+1,)
+    """
+    codes, uniques = pd.factorize(np.asarray(epoch_num))
+    offsets = np.zeros(len(uniques)+1, dtype='int64')
+    np.cumsum(np.bincount(codes, minlength=len(uniques)), out=offsets[1:])
+    if np.all(codes[1:] >= codes[:-1]):
+        return None, offsets
+    return np.argsort(codes, kind='stable'), offsets
+
+def to_segments(values, order):
+    """Rearrange values of frames into the flat array of segments, see get_epoch_segments()
+    """
+    values = np.asarray(values)
+    return values if order is None else values[order]
+
+def from_segments(values, order):
+    """Rearrange the flat array of segments back into the original order of frames, reverses to_segments()
+    """
+    values = np.asarray(values)
+    if order is None:
+        return values
+    res = np.empty_like(values)
+    res[order] = values
+    return res
+
+def segment_diff(values, offsets):
+    """Difference from the previous frame within each segment, same as groupby('epochNum').diff(). The first frame of each segment is NaN
+
+    Args:
+        values (ndarray): flat array of segments, 1D or 2D with one row per frame
+        offsets (array): offsets of segments, see get_epoch_segments()
+
+    Returns:
+        ndarray: differences, same shape as values
+    """
+    values = np.asarray(values, dtype='float64')
+    res = np.empty_like(values)
+    res[1:] = values[1:] - values[:-1]
+    res[np.asarray(offsets)[:-1]] = np.nan
+    return res
+
+def smooth_segments_ML(values, offsets, WSZ):
+    """Smooth each segment with the MATLAB smooth() moving average, same as smooth_series_ML() of each segment.
+    Frames within (WSZ-1)/2 of segment edges are averaged over 1, 3, 5... frames, ignoring NaN. Other frames are averaged over WSZ frames.
+
+    Args:
+        values (array): flat array of segments
+        offsets (array): offsets of segments, see get_epoch_segments()
+        WSZ (int): smoothing window size, odd number
+
+    Returns:
+        ndarray: smoothed values
+    """
+    values = np.asarray(values, dtype='float64')
+    offsets = np.asarray(offsets, dtype='int64')
+    seg_start = offsets[:-1]
+    seg_end = offsets[1:]
+    if np.any(seg_end - seg_start < WSZ):
+        raise ValueError(f"segments need to be at least {WSZ} frames long for smoothing")
+    half = (WSZ-1)//2
+    # moving average of all frames, frames affected by segment edges are replaced below
+    res = np.full(len(values), np.nan)
+    if len(values) >= WSZ:
+        res[half:len(values)-half] = np.convolve(values,np.ones(WSZ,dtype=int),'valid')/WSZ
+    # segment edges
+    r = np.arange(1,WSZ-1,2)
+    edge = np.arange(WSZ-1)
+    start = cumsum_skipna(values[seg_start[:,None] + edge])[:,::2]/r
+    stop = cumsum_skipna(values[seg_end[:,None] - 1 - edge])[:,::2]/r
+    res[seg_start[:,None] + np.arange(half)] = start
+    res[seg_end[:,None] - 1 - np.arange(half)] = stop
+    return res
+
+def segment_max(values, offsets):
+    """Max value of each segment ignoring NaN, same as np.nanmax() of each segment
+
+    Args:
+        values (array): flat array of segments
+        offsets (array): offsets of segments, see get_epoch_segments(). Segments can't be empty
+
+    Returns:
+        ndarray: max of each segment, NaN if all values of the segment are NaN
+    """
+    if len(offsets) < 2:
+        return np.array([], dtype='float64')
+    return np.fmax.reduceat(np.asarray(values, dtype='float64'), np.asarray(offsets)[:-1])
+
+def segment_mean(values, offsets):
+    """Mean of each segment ignoring NaN, same as pd.Series.mean() of each segment
+
+    Args:
+        values (array): flat array of segments
+        offsets (array): offsets of segments, see get_epoch_segments(). Segments can't be empty
+
+    Returns:
+        ndarray: mean of each segment, NaN if all values of the segment are NaN
+    """
+    if len(offsets) < 2:
+        return np.array([], dtype='float64')
+    values = np.asarray(values, dtype='float64')
+    if_valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(if_valid, values, 0), np.asarray(offsets)[:-1])
+    counts = np.add.reduceat(if_valid.astype('int64'), np.asarray(offsets)[:-1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def segment_last(values, offsets):
+    """Last value of each segment
+    """
+    return np.asarray(values)[np.asarray(offsets)[1:]-1]
+
+def segment_rolling3(values, offsets, how):
+    """Centered rolling window of 3 frames within each segment, same as .rolling(3, center=True).median() or .mean() of each segment.
+    Frames at segment edges and windows containing NaN are NaN
+
+    Args:
+        values (array): flat array of segments
+        offsets (array): offsets of segments, see get_epoch_segments()
+        how (string): 'median' or 'mean'
+
+    Returns:
+        ndarray: rolling median or mean
+    """
+    values = np.asarray(values, dtype='float64')
+    offsets = np.asarray(offsets)
+    res = np.full(len(values), np.nan)
+    if len(values) >= 3:
+        a, b, c = values[:-2], values[1:-1], values[2:]
+        if how == 'median':
+            res[1:-1] = np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c))
+        elif how == 'mean':
+            res[1:-1] = (a + b + c) / 3
+        else:
+            raise ValueError(f"unknown rolling function: {how}")
+    # windows at segment edges cross into neighboring segments
+    res[offsets[:-1]] = np.nan
+    res[offsets[1:]-1] = np.nan
+    return res
@@ -2,58 +2,244 @@
 Read one .dlm file and return a dataframe containing extracted features
 Modified from:
 analyzeFreeVerticalGrouped2.m by DEE 1.30.2015
-    "the LabView code returns a value to mark an "epoch," which is a continuous series of frames that had at least one identified particle 
-+ lines to output head location in addition to body, for detection direction of movement." 
+    "the LabView code returns a value to mark an "epoch," which is a continuous series of frames that had at least one identified particle
++ lines to output head location in addition to body, for detection direction of movement."
+
+Two parser engines are available:
+    'fast' (default): dedicated parser for the fixed 10-column .dlm layout. Uses the multi-threaded pyarrow csv tokenizer if pyarrow is installed, otherwise the numpy C tokenizer (np.loadtxt). Returns float64 columns directly, no type casting needed afterwards.
+    'pandas': the original pd.read_csv() path.
+If the fast parser can't read a file (non-numeric values, ragged rows), it falls back to the pandas path.
+
+Set cache=True to save parsed data as binary files next to the .dlm files. Reruns will skip text parsing. See dlm_cache.py for details.
+
+For multi-GB .dlm files, iter_dlm() memory-maps the file and yields epoch-complete chunks, so that only one chunk is parsed and kept in memory at a time.
 '''
 
+import io
+import os
+import mmap
 import pandas as pd
 import numpy as np
+from preprocessing.dlm_cache import (load_cached_dlm, save_cached_dlm, DEFAULT_CACHE_BUDGET)
 # from scipy.signal import savgol_filter
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
 
-def read_dlm(i, filename):
-    """Read .dlm files into a DataFrame
+# column names of .dlm files
+DLM_COLS = ['time','fishNum','ang','absx','absy','absHeadx','absHeady','col7','epochNum','fishLen']
+# legacy V2 program saves epochNum before col7
+DLM_COLS_V2 = ['time','fishNum','ang','absx','absy','absHeadx','absHeady','epochNum','col7','fishLen']
+# bytes of .dlm text to parse at a time in streaming mode
+DEFAULT_CHUNK_SIZE = 256 * 1024**2
+
+def parse_dlm_fast(source):
+    """Tokenize .dlm data into a 2D float64 array using pyarrow or numpy
 
     Args:
-        i (int): index of the file in the folder
-        filename (string): directory of the .dlm file
+        source (string or bytes): directory of the .dlm file, or raw bytes of (part of) a .dlm file
 
     Returns:
-        DataFrame: 
+        ndarray: parsed values, shape (rows, 10) for tab-delimited data or (rows, 1) for the legacy one-column layout. None if data can't be parsed by the fast parser
     """
-    # read_dlm takes file index: i, and the file name end with .dlm
-    col_names = ['time','fishNum','ang','absx','absy','absHeadx','absHeady','col7','epochNum','fishLen']
-    try:
-        # raw = pd.read_csv(filename, sep="\t",names = col_names) # load .dlm
-        raw = pd.read_csv(filename, sep="\t",header=None)
-    except FileNotFoundError:
-        print(f"No .dlm file found in the directory entered")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source_pa = pa.BufferReader(source) if pa is not None else None
+        source_np = io.BytesIO(source)
     else:
-        print(f"File {i+1}: {filename[-19:]}", end=' ')
-    
+        source_pa = source
+        source_np = source
+    if pa is not None:
+        try:
+            table = pa_csv.read_csv(
+                source_pa,
+                read_options=pa_csv.ReadOptions(autogenerate_column_names=True),
+                parse_options=pa_csv.ParseOptions(delimiter='\t'),
+                convert_options=pa_csv.ConvertOptions(column_types={f"f{c}":pa.float64() for c in range(len(DLM_COLS))}),
+            )
+        except (pa.ArrowInvalid, ValueError):
+            return None
+        if table.num_columns not in [1, len(DLM_COLS)]:
+            return None
+        values = np.empty((table.num_rows, table.num_columns), dtype='float64')
+        for c, col in enumerate(table.itercolumns()):
+            values[:,c] = col.to_numpy(zero_copy_only=False)
+        return values
+    try:
+        values = np.loadtxt(source_np, delimiter='\t', dtype='float64', ndmin=2)
+    except ValueError:
+        return None
+    if values.shape[1] not in [1, len(DLM_COLS)]:
+        return None
+    return values
+
+def parse_dlm_pandas(source):
+    """Read .dlm data using pd.read_csv()
+
+    Args:
+        source (string or bytes): directory of the .dlm file, or raw bytes of (part of) a .dlm file
+
+    Returns:
+        DataFrame: parsed values, columns are not named
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    # raw = pd.read_csv(filename, sep="\t",names = col_names) # load .dlm
+    return pd.read_csv(source, sep="\t",header=None)
+
+def format_dlm(raw, if_first_block=True, fishNum_min=None):
+    """Name columns, fix legacy layouts and clean up rows of parsed .dlm data
+
+    Args:
+        raw (DataFrame): parsed .dlm data, see parse_dlm_fast() and parse_dlm_pandas()
+        if_first_block (bool, optional): whether raw starts from the first row of the .dlm file. Defaults to True.
+        fishNum_min (float, optional): min fish number of the .dlm file, used to tell gen2 data. Defaults to None, calculated from raw.
+
+    Returns:
+        DataFrame:
+    """
     if raw.shape[1] > 1: # if data CRLF is correct
-        raw.columns = col_names
+        raw.columns = DLM_COLS
     else: # if data only comes in one column, legacy V2 program debug code
-        raw_reshaped = pd.DataFrame(np.reshape(raw.to_numpy(),(-1,10)), columns = ['time','fishNum','ang','absx','absy','absHeadx','absHeady','epochNum','col7','fishLen']) # reshape 1d array to 2d
+        raw_reshaped = pd.DataFrame(np.reshape(raw.to_numpy(),(-1,10)), columns = DLM_COLS_V2) # reshape 1d array to 2d
         # assuming timestamp is not saved correctly
         raw_reshaped['time'] = np.arange(0,1/160*raw_reshaped.shape[0],1/160)
         # edit fish number
         raw_reshaped['fishNum'] = raw_reshaped['fishNum']-1
         raw = raw_reshaped
-    
-    # if from gen2 program, fish num == 1 for 1 fish detected, change that to 0 
-    if raw['fishNum'].min() > 0:
+
+    # if from gen2 program, fish num == 1 for 1 fish detected, change that to 0
+    if fishNum_min is None:
+        fishNum_min = raw['fishNum'].min()
+    if fishNum_min > 0:
         raw['fishNum'] = raw['fishNum']-1
-        
+
     # Clear original time data stored in the first row
-    raw.loc[0,'time'] = 0
-    # data error results in NA values in epochNum, exclude rows with NA
-    raw.dropna(inplace=True)
+    if if_first_block:
+        raw.loc[raw.index[0],'time'] = 0
+    # data error results in NA values in epochNum, exclude rows with NA. skip the copy made by dropna() if there's no NA
+    if raw.isna().to_numpy().any():
+        raw.dropna(inplace=True)
     # rows with epochNum == NA may have non-numeric data recorded. In this case, change column types to float for calculation. not necessary for most .dlm.
-    raw[['fishNum','ang','absx','absy','absHeadx','absHeady','col7','epochNum','fishLen']] = raw[['fishNum','ang','absx','absy','absHeadx','absHeady','col7','epochNum','fishLen']].astype('float64',copy=False)
-    
+    if (raw.dtypes != 'float64').any():
+        raw[DLM_COLS[1:]] = raw[DLM_COLS[1:]].astype('float64',copy=False)
+
     # V4.4 smooth angle by window of 5
     # beause in analyze_dlm.py, each epoch is truncated at the beginning, mistakenly smoothed pitch between epochs will be cleared
     # raw['ang'] = savgol_filter(raw['ang'], 5, 3)
 
     return raw
+
+def read_dlm(i, filename, engine='fast', cache=False, cache_budget=DEFAULT_CACHE_BUDGET):
+    """Read .dlm files into a DataFrame
+
+    Args:
+        i (int): index of the file in the folder
+        filename (string): directory of the .dlm file
+        engine (string, optional): parser engine, 'fast' or 'pandas'. Defaults to 'fast'.
+        cache (bool, optional): whether to load/save parsed data from/to the cache folder next to the .dlm file. Defaults to False.
+        cache_budget (int, optional): disk budget of the cache folder in bytes. Defaults to DEFAULT_CACHE_BUDGET.
+
+    Returns:
+        DataFrame:
+    """
+    # read_dlm takes file index: i, and the file name end with .dlm
+    try:
+        if cache:
+            raw, cache_key = load_cached_dlm(filename)
+            if raw is not None:
+                print(f"File {i+1}: {filename[-19:]} (cached)", end=' ')
+                return raw
+        values = parse_dlm_fast(filename) if engine == 'fast' else None
+        if values is None:
+            raw = parse_dlm_pandas(filename)
+        else:
+            raw = pd.DataFrame(values)
+    except FileNotFoundError:
+        print(f"No .dlm file found in the directory entered")
+    else:
+        print(f"File {i+1}: {filename[-19:]}", end=' ')
+
+    raw = format_dlm(raw)
+    if cache:
+        save_cached_dlm(filename, raw, cache_key, cache_budget)
+    return raw
+
+def iter_dlm(i, filename, chunk_size=DEFAULT_CHUNK_SIZE, engine='fast'):
+    """Memory-map a .dlm file and read it in epoch-complete chunks. Each chunk is formatted the same way as read_dlm() output and keeps the row index of the whole file.
+    Chunks are only split where epochNum changes, rows of the last epoch in a block are carried over to the next chunk.
+    Legacy one-column .dlm files are read as one chunk.
+    Row and bout numbers in the analysis output of each chunk start from 0, see grab_fish_angle_v5.offset_chunk_positions() for matching them to whole-file analysis.
+
+    Args:
+        i (int): index of the file in the folder
+        filename (string): directory of the .dlm file
+        chunk_size (int, optional): bytes of text to parse at a time. Defaults to DEFAULT_CHUNK_SIZE.
+        engine (string, optional): parser engine, 'fast' or 'pandas'. Defaults to 'fast'.
+
+    Yields:
+        DataFrame: rows of complete epochs
+    """
+    try:
+        f = open(filename, 'rb')
+    except FileNotFoundError:
+        print(f"No .dlm file found in the directory entered")
+        return
+    with f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size == 0 or b'\t' not in f.readline():
+            # legacy layout can't be split by lines
+            yield read_dlm(i, filename, engine=engine)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            row_offset = 0
+            fishNum_min = None
+            carry = None
+            chunk_i = 0
+            while start < file_size:
+                # end each block at a line break
+                end = min(start + chunk_size, file_size)
+                if end < file_size:
+                    end = mm.rfind(b'\n', start, end) + 1
+                    if end <= start:  # line longer than chunk_size
+                        end = mm.find(b'\n', start + chunk_size) + 1 or file_size
+                block = mm[start:end]
+                values = parse_dlm_fast(block) if engine == 'fast' else None
+                if values is None:
+                    raw = parse_dlm_pandas(block)
+                else:
+                    raw = pd.DataFrame(values)
+                del block, values
+                raw.index = pd.RangeIndex(row_offset, row_offset+len(raw))
+                row_offset += len(raw)
+                # decide whether it's gen2 data using the first block
+                if fishNum_min is None:
+                    fishNum_min = pd.to_numeric(raw[1], errors='coerce').min() if raw.shape[1] > 1 else None
+                raw = format_dlm(raw, if_first_block=(start == 0), fishNum_min=fishNum_min)
+                if carry is not None:
+                    raw = pd.concat([carry, raw])
+                start = end
+                if start >= file_size:
+                    carry = raw
+                    break
+                # keep rows of the last epoch, which may continue in the next block
+                epochs = raw['epochNum'].to_numpy()
+                epoch_changes = np.flatnonzero(epochs[1:] != epochs[:-1])
+                if len(epoch_changes) == 0:
+                    carry = raw
+                    continue
+                split = epoch_changes[-1] + 1
+                chunk = raw.iloc[:split].copy()
+                carry = raw.iloc[split:].copy()
+                del raw
+                chunk_i += 1
+                print(f"File {i+1}: {filename[-19:]} chunk {chunk_i}", end=' ')
+                yield chunk
+                del chunk
+            if carry is not None and len(carry):
+                chunk_i += 1
+                print(f"File {i+1}: {filename[-19:]} chunk {chunk_i}", end=' ')
+                yield carry
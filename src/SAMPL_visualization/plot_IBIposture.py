@@ -30,6 +30,7 @@ import numpy as np # numpy
 import seaborn as sns
 import matplotlib.pyplot as plt
 from plot_functions.plt_tools import (set_font_type, day_night_split, round_half_up, setup_vis_parameter, defaultPlotting)
+from plot_functions.plot_data import PlotData
 
 def plot_IBIposture(root, **kwargs):
     """Plot Inter Bout Interval (IBI) posture distribution and standard deviation
@@ -39,6 +40,7 @@ def plot_IBIposture(root, **kwargs):
         ---kwargs---
         sample_bout (int): number of bouts to sample from each experimental repeat. default is off
         figure_dir (str): directory to save figures. If not defined, figures will be saved to folder "figures"
+        data (PlotData): data shared with other plotting functions, see plot_functions/plot_data.py. If not defined, data is read for this function only
     """
     
     print('------\n+ Plotting inter-bout-interval posture')
@@ -48,6 +50,10 @@ def plot_IBIposture(root, **kwargs):
     fig_dir = os.path.join(folder_dir, 'figures', folder_name)
     
     root, all_dir, fig_dir, if_sample, SAMPLE_N, if_multiple_repeats = setup_vis_parameter(root, fig_dir, if_sample=False, SAMPLE_N=-1, if_multiple_repeats=False, **kwargs)
+    data = PlotData()
+    for key, value in kwargs.items():
+        if key == 'data':
+            data = value
 
     bins = list(range(-90,94,4))
 
@@ -62,8 +68,7 @@ def plot_IBIposture(root, **kwargs):
     # go through each condition folders under the root
     for expNum, exp_path in enumerate(all_dir):
         # for each sub-folder, get the path
-        df = pd.read_hdf(f"{exp_path}/IEI_data.h5", key='prop_bout_IEI2')
-        df = day_night_split(df,'propBoutIEItime')
+        df = data.read_day_table(exp_path, 'prop_bout_IEI2', ['propBoutIEI_pitch', 'propBoutIEItime'], 'propBoutIEItime')
 
         # get pitch
         body_angles = df.loc[:,['propBoutIEI_pitch']].assign(expNum = expNum)
@@ -1,5 +1,6 @@
 """
 Plots all figures using data from one root directory. See individual function for details.
+Data is read once and shared by all plotting functions, see plot_functions/plot_data.py.
 """
 
 from plot_IBIposture import plot_IBIposture
@@ -10,38 +11,40 @@ from plot_kinematics_jackknifed import plot_kinematics_jackknifed
 from plot_fin_body_coordination import plot_fin_body_coordination
 from plot_fin_body_coordination_byAngvelMax import plot_fin_body_coordination_byAngvelMax
 from plot_parameters import plot_parameters
+from plot_functions.plot_data import PlotData
 import matplotlib.pyplot as plt
 
 def main(root, sample):
+    data = PlotData()
     plt.close('all')
-    plot_bout_timing(root, sample_bout=sample)
+    plot_bout_timing(root, sample_bout=sample, data=data)
     
     plt.close('all')
-    plot_IBIposture(root, sample_bout=sample)
+    plot_IBIposture(root, sample_bout=sample, data=data)
     
     plt.close('all')
-    plot_parameters(root)
+    plot_parameters(root, data=data)
     
     plt.close('all')
-    plot_kinematics(root, sample_bout=sample)
+    plot_kinematics(root, sample_bout=sample, data=data)
 
     # If to plot jackknifed kinematic parameters:
     # plt.close('all')
-    # plot_kinematics_jackknifed(root, sample_bout=sample)
+    # plot_kinematics_jackknifed(root, sample_bout=sample, data=data)
     
     # Timeseries for aligned bouts may take long to plot for large dataset (>10GB)
     plt.close('all')
-    plot_aligned(root)
+    plot_aligned(root, data=data)
         
     # If to use fixed time of max angvel to calculate steering related rotatioin (-250 to -40 ms)
     # plt.close('all')
-    # plot_fin_body_coordination(root, sample_bout=sample)
+    # plot_fin_body_coordination(root, sample_bout=sample, data=data)
         
     plt.close('all')
-    plot_fin_body_coordination_byAngvelMax(root, sample_bout=sample)
+    plot_fin_body_coordination_byAngvelMax(root, sample_bout=sample, data=data)
     
     plt.close('all')
-    plot_raw(root)
+    plot_raw(root, data=data)
     
 if __name__ == "__main__":
     root_dir = input("- Which data to plot? \n")
@@ -34,6 +34,7 @@ import matplotlib.pyplot as plt
 
 from scipy.optimize import curve_fit
 from plot_functions.plt_tools import (set_font_type, day_night_split, round_half_up, setup_vis_parameter, defaultPlotting)
+from plot_functions.plot_data import PlotData
 
 # %%
 def distribution_binned_average(df, bin_width):
@@ -75,6 +76,7 @@ def plot_bout_timing(root:str, **kwargs):
         ---kwargs---
         sample_bout (int): number of bouts to sample from each experimental repeat. default is off
         figure_dir (str): directory to save figures. If not defined, figures will be saved to folder "figures"
+        data (PlotData): data shared with other plotting functions, see plot_functions/plot_data.py. If not defined, data is read for this function only
     """
     print('------\n+ Plotting bout frequency as a function of pitch')
     # CONSTANTS
@@ -86,6 +88,10 @@ def plot_bout_timing(root:str, **kwargs):
     fig_dir = os.path.join(folder_dir, 'figures', folder_name)
     
     root, all_dir, fig_dir, if_sample, SAMPLE_N, if_multiple_rep = setup_vis_parameter(root, fig_dir, if_sample=False, SAMPLE_N=-1, if_multiple_repeats=False, **kwargs)
+    data = PlotData()
+    for key, value in kwargs.items():
+        if key == 'data':
+            data = value
 
     # %%
     # main function
@@ -97,9 +103,7 @@ def plot_bout_timing(root:str, **kwargs):
 
     # go through each condition folders under the root
     for expNum, exp_path in enumerate(all_dir):
-        df = pd.read_hdf(f"{exp_path}/IEI_data.h5", key='prop_bout_IEI2')               
-        body_angles = df.loc[:,['propBoutIEI', 'propBoutIEI_pitch', 'propBoutIEItime']]
-        day_angles = day_night_split(body_angles,'propBoutIEItime').assign(expNum=expNum)
+        day_angles = data.read_day_table(exp_path, 'prop_bout_IEI2', ['propBoutIEI', 'propBoutIEI_pitch', 'propBoutIEItime'], 'propBoutIEItime').assign(expNum=expNum)
         day_angles.dropna(inplace=True)
         
         if if_multiple_rep == True:
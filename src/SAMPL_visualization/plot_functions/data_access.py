@@ -0,0 +1,234 @@
+'''
+Read data saved by SAMPL_analysis
+Functions:
+    1. Read a table (e.g. prop_bout2) from .h5 files or parquet datasets (SAMPL_analysis(..., output_backend='parquet')), with column projection and aligned time ranges
+    2. Read aligned bouts from aligned_bouts.h5 (see bout_analysis/hdf_output.py), as an array of shape (bouts, frames, features). Bouts are in the same order as prop_bout2 in bout_data.h5
+
+Only the requested columns, rows, frames and features are read where the format allows:
+    parquet datasets: columns are read separately. Time ranges are filtered using statistics of each file, files outside the range are skipped
+    .h5 tables in table format: rows are selected by position with HDFStore.select(start=, stop=), and by time with where= if the time column is a data column (aligned_time of prop_bout2, propBoutIEItime of prop_bout_IEI2)
+    prop_bout_aligned: float columns are read from aligned_bouts.h5 if it exists and matches bout_data.h5, one feature at a time
+    .h5 tables in fixed format (grabbed_all, baseline_angVel, heading_matched): rows are selected by position, all columns are read
+
+Example:
+    bout_time = read_table(exp_path, 'prop_bout2', columns=['aligned_time'], time_range=['2022-12-12 09:00', '2022-12-12 23:00'])
+    exp_data = read_table(exp_path, 'prop_bout_aligned', columns=['propBoutAligned_pitch','propBoutAligned_speed'])
+    peak_idx, total_aligned = get_index(FRAME_RATE)
+    pitch_speed = read_aligned_bouts(exp_path, idx_start, idx_end, ['pitch','speed'])  # shape (bouts, idx_end-idx_start, 2)
+'''
+
+import os
+import numpy as np
+import pandas as pd
+import tables
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+
+# .h5 file of each key
+KEY_FILES = {
+    'grabbed_all':'all_data.h5',
+    'baseline_angVel':'all_data.h5',
+    'epoch_attributes':'all_data.h5',
+    'heading_matched':'all_data.h5',
+    'epoch_pitch_heading_RMS':'all_data.h5',
+    'bout_attributes':'bout_data.h5',
+    'prop_bout_aligned':'bout_data.h5',
+    'prop_bout2':'bout_data.h5',
+    'prop_bout_aligned_long':'bout_data.h5',
+    'prop_bout_aligned_long2':'bout_data.h5',
+    'IEI_attributes':'IEI_data.h5',
+    'prop_bout_IEI_aligned':'IEI_data.h5',
+    'prop_bout_IEI2':'IEI_data.h5',
+    'prop_bout_IEI_timed':'IEI_data.h5',
+    'wolpert_IEI':'IEI_data.h5',
+}
+PARQUET_DIR = 'parquet'
+# columns added to parquet datasets, not included unless requested
+PARQUET_EXTRA_COLS = ['condition', 'exp', 'date']
+
+def get_backend(exp_path, key):
+    """get the backend to read a key: 'parquet' if the parquet dataset of the key exists, otherwise 'hdf'
+
+    Args:
+        exp_path (string): directory of the analyzed data folder
+        key (string): name of the table, e.g. 'prop_bout2'
+
+    Returns:
+        string: 'parquet' or 'hdf'
+    """
+    if os.path.isdir(os.path.join(exp_path, PARQUET_DIR, key)):
+        return 'parquet'
+    return 'hdf'
+
+def get_time_mask(time_values, time_range):
+    """whether each time is in [start, end) of time_range
+    """
+    return (time_values >= pd.Timestamp(time_range[0])) & (time_values < pd.Timestamp(time_range[1]))
+
+def get_read_columns(columns, time_range, time_column):
+    """columns to read, including time_column if rows are selected by time_range. None for all columns
+    """
+    if columns is None:
+        return None
+    columns = list(columns)
+    if time_range is not None and time_column not in columns:
+        columns.append(time_column)
+    return columns
+
+def read_parquet_dataset(exp_path, key, columns=None, rows=None, time_range=None, time_column='aligned_time'):
+    """read a parquet dataset saved by SAMPL_analysis, see read_table()
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to read parquet datasets")
+    # partition values are read as dictionary-encoded strings
+    partitioning = ds.partitioning(pa.schema([
+        ('exp', pa.dictionary(pa.int32(), pa.string())),
+        ('date', pa.dictionary(pa.int32(), pa.string())),
+    ]), flavor='hive', dictionaries='infer')
+    dataset = ds.dataset(os.path.join(exp_path, PARQUET_DIR, key), format='parquet', partitioning=partitioning)
+    if columns is None:
+        columns = [col for col in dataset.schema.names if col not in PARQUET_EXTRA_COLS]
+    row_filter = None
+    if time_range is not None:
+        time_type = dataset.schema.field(time_column).type
+        row_filter = (ds.field(time_column) >= pa.scalar(pd.Timestamp(time_range[0]), type=time_type)) & (ds.field(time_column) < pa.scalar(pd.Timestamp(time_range[1]), type=time_type))
+    if rows is None:
+        return dataset.to_table(columns=list(columns), filter=row_filter).to_pandas()
+    # row positions are counted before filtering by time
+    table = dataset.to_table(columns=get_read_columns(columns, time_range, time_column))
+    table = table.slice(rows[0], rows[1]-rows[0])
+    if row_filter is not None:
+        table = table.filter(row_filter)
+    return table.select(list(columns)).to_pandas()
+
+def read_hdf_table(exp_path, key, columns=None, rows=None, time_range=None, time_column='aligned_time'):
+    """read a table from .h5 files saved by SAMPL_analysis, see read_table()
+    """
+    # float columns of prop_bout_aligned are read from aligned_bouts.h5, which saves each feature in separate chunks
+    if key == ALIGNED_KEY and columns is not None and rows is None and time_range is None and if_aligned_store(exp_path):
+        if all(col in get_aligned_features(exp_path) for col in columns):
+            values = read_aligned_bouts(exp_path, features=list(columns))
+            return pd.DataFrame(values.reshape(-1, len(columns)), columns=list(columns))
+    start, stop = rows if rows is not None else (None, None)
+    with pd.HDFStore(os.path.join(exp_path, KEY_FILES[key]), mode='r') as store:
+        storer = store.get_storer(key)
+        if not storer.is_table:
+            # fixed format can only be read as a whole or by row positions
+            df = store.select(key, start=start, stop=stop)
+        elif time_range is not None and time_column in storer.data_columns:
+            df = store.select(key, where=f"{time_column} >= '{pd.Timestamp(time_range[0])}' & {time_column} < '{pd.Timestamp(time_range[1])}'",
+                              columns=get_read_columns(columns, time_range, time_column), start=start, stop=stop)
+            time_range = None
+        else:
+            df = store.select(key, columns=get_read_columns(columns, time_range, time_column), start=start, stop=stop)
+    if time_range is not None:
+        df = df.loc[get_time_mask(df[time_column], time_range)]
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
+
+def read_table(exp_path, key, columns=None, rows=None, time_range=None, time_column='aligned_time', backend='auto'):
+    """read a table saved by SAMPL_analysis from .h5 files or the parquet dataset. Only requested columns and rows are read if possible
+
+    Args:
+        exp_path (string): directory of the analyzed data folder
+        key (string): name of the table, e.g. 'prop_bout2'
+        columns (list, optional): columns to read. Defaults to None, all columns.
+        rows (list, optional): [start, stop) row positions to read. Defaults to None, all rows.
+        time_range (list, optional): [start, end) of time_column, datetime or string. Rows outside the range are dropped. Defaults to None, all rows.
+        time_column (string, optional): datetime column for time_range. Defaults to 'aligned_time'.
+        backend (string, optional): 'hdf', 'parquet' or 'auto'. Defaults to 'auto', see get_backend().
+
+    Returns:
+        DataFrame: selected rows and columns, with a default index
+    """
+    if backend == 'auto':
+        backend = get_backend(exp_path, key)
+    if backend == 'parquet':
+        return read_parquet_dataset(exp_path, key, columns, rows, time_range, time_column)
+    return read_hdf_table(exp_path, key, columns, rows, time_range, time_column)
+
+ALIGNED_FILE = 'aligned_bouts.h5'
+ALIGNED_KEY = 'prop_bout_aligned'
+# attribute identifying the run of the analysis that wrote aligned_bouts.h5 and bout_data.h5, see bout_analysis/hdf_output.py
+RUN_ID_ATTR = 'run_id'
+# features can be called without the prefix, e.g. 'pitch' for 'propBoutAligned_pitch'
+FEATURE_PREFIX = 'propBoutAligned_'
+
+def if_aligned_store(exp_path):
+    """whether aligned_bouts.h5 exists in the folder and was written with bout_data.h5 in the same run of the analysis, i.e. run ids saved in both files are the same.
+    aligned_bouts.h5 left by a previous analysis, or written by versions without run ids, is not used
+
+    Args:
+        exp_path (string): directory of the analyzed data folder
+
+    Returns:
+        bool: True if aligned_bouts.h5 exists and matches bout_data.h5
+    """
+    if not os.path.isfile(os.path.join(exp_path, ALIGNED_FILE)) or not os.path.isfile(os.path.join(exp_path, KEY_FILES[ALIGNED_KEY])):
+        return False
+    with tables.open_file(os.path.join(exp_path, ALIGNED_FILE), mode='r') as h5:
+        aligned = h5.get_node('/', ALIGNED_KEY)
+        n_bouts, n_frames, _ = aligned.shape
+        aligned_run_id = getattr(aligned.attrs, RUN_ID_ATTR, None)
+    with pd.HDFStore(os.path.join(exp_path, KEY_FILES[ALIGNED_KEY]), mode='r') as store:
+        storer = store.get_storer(ALIGNED_KEY)
+        run_id = getattr(storer.attrs, RUN_ID_ATTR, None)
+        nrows = storer.nrows if storer.is_table else storer.shape[0]
+    return aligned_run_id is not None and aligned_run_id == run_id and n_bouts * n_frames == nrows
+
+def get_aligned_features(exp_path):
+    """get names of features saved in aligned_bouts.h5
+
+    Args:
+        exp_path (string): directory of the analyzed data folder
+
+    Returns:
+        list: feature names, which are column names of prop_bout_aligned
+    """
+    with tables.open_file(os.path.join(exp_path, ALIGNED_FILE), mode='r') as h5:
+        return list(h5.get_node('/', ALIGNED_KEY).attrs.features)
+
+def get_feature_index(all_features, features):
+    """get positions of features along the feature axis
+
+    Args:
+        all_features (list): feature names saved in aligned_bouts.h5
+        features (list): column names of prop_bout_aligned, or names without the 'propBoutAligned_' prefix
+
+    Returns:
+        list: position of each feature
+    """
+    feature_index = []
+    for feature in features:
+        if feature in all_features:
+            feature_index.append(all_features.index(feature))
+        elif FEATURE_PREFIX + feature in all_features:
+            feature_index.append(all_features.index(FEATURE_PREFIX + feature))
+        else:
+            raise KeyError(f"{feature} not found in {ALIGNED_FILE}")
+    return feature_index
+
+def read_aligned_bouts(exp_path, idx_start=None, idx_end=None, features=None):
+    """read frames idx_start to idx_end-1 of selected features of all aligned bouts
+
+    Args:
+        exp_path (string): directory of the analyzed data folder
+        idx_start (int, optional): first frame to read. Defaults to None, the first frame of aligned bouts.
+        idx_end (int, optional): frame to stop, not included. Defaults to None, to the last frame of aligned bouts.
+        features (list, optional): features to read, see get_feature_index(). Defaults to None, all features.
+
+    Returns:
+        ndarray: shape (bouts, frames, features)
+    """
+    with tables.open_file(os.path.join(exp_path, ALIGNED_FILE), mode='r') as h5:
+        aligned = h5.get_node('/', ALIGNED_KEY)
+        if features is None:
+            return aligned[:, idx_start:idx_end, :]
+        feature_index = get_feature_index(list(aligned.attrs.features), features)
+        # read one feature at a time, each chunk holds frames of one feature
+        return np.stack([aligned[:, idx_start:idx_end, i] for i in feature_index], axis=2)
@@ -0,0 +1,115 @@
+'''
+Data shared by plotting functions
+PlotData keeps tables read from analyzed data folders and products derived from them in memory, so that plotting functions called one after another (see plot_all.py) read and process each data folder once:
+    1. Tables: each (data folder, key) is read once. Columns requested later are read and added to the loaded columns
+    2. Day rows: index of rows between 9:00 and 23:00, see plt_tools.day_night_split()
+    3. Bout features: extract_bout_features_v5() of day bouts, for each frame range
+
+Plotting functions take a PlotData as kwarg data=. If not given, a new PlotData is used, which is released when the function returns.
+Tables and products are shared between functions, do not modify them inplace.
+
+Example:
+    data = PlotData()
+    plot_kinematics(root, data=data)
+    plot_parameters(root, data=data)  # bout_data.h5 is not read again
+'''
+
+import numpy as np
+import pandas as pd
+from plot_functions.data_access import read_table
+from plot_functions.plt_tools import (day_night_split, round_half_up)
+from plot_functions.plt_v5 import (extract_bout_features_v5, BOUT_FEATURE_COLS)
+from plot_functions.get_index import get_aligned_rows
+
+class PlotData:
+    """Tables and derived products of analyzed data folders, loaded on first use
+    """
+    def __init__(self):
+        self.tables = {}
+        self.if_all_columns = {}
+        self.day_index = {}
+        self.bout_features = {}
+
+    def read_table(self, exp_path, key, columns=None):
+        """read a table saved by SAMPL_analysis, see data_access.read_table(). Only columns not loaded before are read
+
+        Args:
+            exp_path (string): directory of the analyzed data folder
+            key (string): name of the table, e.g. 'prop_bout2'
+            columns (list, optional): columns to read. Defaults to None, all columns.
+
+        Returns:
+            DataFrame: selected columns, with a default index
+        """
+        name = (exp_path, key)
+        if columns is None:
+            if not self.if_all_columns.get(name, False):
+                self.tables[name] = read_table(exp_path, key)
+                self.if_all_columns[name] = True
+            return self.tables[name]
+        columns = list(columns)
+        if name not in self.tables:
+            self.tables[name] = read_table(exp_path, key, columns=columns)
+        else:
+            new_columns = [col for col in columns if col not in self.tables[name].columns]
+            if new_columns:
+                self.tables[name] = pd.concat([self.tables[name], read_table(exp_path, key, columns=new_columns)], axis=1)
+        return self.tables[name][columns]
+
+    def get_day_index(self, exp_path, key, time_column):
+        """index of rows in the day (9:00 to 23:00), see plt_tools.day_night_split()
+
+        Args:
+            exp_path (string): directory of the analyzed data folder
+            key (string): name of the table, e.g. 'prop_bout2'
+            time_column (string): datetime column, e.g. 'aligned_time'
+
+        Returns:
+            Index: index of day rows
+        """
+        name = (exp_path, key, time_column)
+        if name not in self.day_index:
+            self.day_index[name] = day_night_split(self.read_table(exp_path, key, columns=[time_column]), time_column).index
+        return self.day_index[name]
+
+    def read_day_table(self, exp_path, key, columns, time_column):
+        """read day rows of a table, same as day_night_split(read_table(), time_column)
+
+        Args:
+            exp_path (string): directory of the analyzed data folder
+            key (string): name of the table, e.g. 'prop_bout_IEI2'
+            columns (list): columns to read
+            time_column (string): datetime column, e.g. 'propBoutIEItime'
+
+        Returns:
+            DataFrame: day rows of selected columns, index is row number in the table
+        """
+        return self.read_table(exp_path, key, columns=columns).loc[self.get_day_index(exp_path, key, time_column), :]
+
+    def get_bout_features(self, exp_path, peak_idx, total_aligned, idxRANGE, FRAME_RATE, **kwargs):
+        """features of day bouts extracted from frames idxRANGE[0] to idxRANGE[1]-1 of aligned bouts, see plt_v5.extract_bout_features_v5()
+
+        Args:
+            exp_path (string): directory of the analyzed data folder
+            peak_idx (int): index of the frame at time of peak speed
+            total_aligned (int): number of frames of each aligned bout
+            idxRANGE (list): [start, end) frames of each bout to extract features from
+            FRAME_RATE (int): frame rate
+            ---kwargs---
+            idx_max_angvel (int): passed to extract_bout_features_v5()
+
+        Returns:
+            DataFrame: one row per day bout, with a default index
+        """
+        name = (exp_path, peak_idx, total_aligned, tuple(idxRANGE), FRAME_RATE, tuple(sorted(kwargs.items())))
+        if name not in self.bout_features:
+            exp_data = self.read_table(exp_path, 'prop_bout_aligned', columns=BOUT_FEATURE_COLS)
+            # assign frame number, total_aligned frames per bout
+            exp_data = exp_data.assign(idx=round_half_up(len(exp_data)/total_aligned)*list(range(0,total_aligned)))
+            rows = get_aligned_rows(self.get_day_index(exp_path, 'prop_bout2', 'aligned_time'), total_aligned, idxRANGE)
+            trunc_day_exp_data = exp_data.loc[rows,:]
+            trunc_day_exp_data = trunc_day_exp_data.assign(
+                bout_num = trunc_day_exp_data.groupby(np.arange(len(trunc_day_exp_data))//(idxRANGE[1]-idxRANGE[0])).ngroup()
+                )
+            self.bout_features[name] = extract_bout_features_v5(trunc_day_exp_data,peak_idx,FRAME_RATE,**kwargs).reset_index(drop=True)
+        return self.bout_features[name]
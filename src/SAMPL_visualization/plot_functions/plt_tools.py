@@ -5,6 +5,7 @@ import numpy as np
 from decimal import Decimal
 import decimal
 import os
+from plot_functions.data_access import PARQUET_DIR
 
 def round_half_up(var):
     """round half up
@@ -42,6 +43,20 @@ def day_night_split(df,time_col_name):
     df_day = df.loc[hour[(hour>=9) & (hour<23)].index, :]
     return df_day
 
+def walk_data_dirs(root):
+    """os.walk() through data folders under root, skipping Parquet datasets and hidden folders (such as the .dlm cache) saved in data folders by SAMPL_analysis, see data_access.py
+
+    Args:
+        root (str): data directory
+
+    Yields:
+        tuple: (path, dir_list, file_list) of each folder, same as os.walk()
+    """
+    for path, dir_list, file_list in os.walk(root):
+        # dir_list is edited inplace, so that os.walk() doesn't enter skipped folders
+        dir_list[:] = [folder for folder in dir_list if folder != PARQUET_DIR and not folder.startswith('.')]
+        yield path, dir_list, file_list
+
 def setup_vis_parameter(root, fig_dir, if_sample=False, SAMPLE_N=-1, if_multiple_repeats=False, **kwargs):
     """Prepare parameters for plotting. Make figure directory. Decide whether to sample data from each experimental repeat.
 
@@ -60,7 +75,7 @@ def setup_vis_parameter(root, fig_dir, if_sample=False, SAMPLE_N=-1, if_multiple
             if value:
                 fig_dir = value
             
-    all_dir = [ele[0] for ele in os.walk(root)]
+    all_dir = [ele[0] for ele in walk_data_dirs(root)]
     if len(all_dir) > 1:
         all_dir = all_dir[1:]
         if_multiple_repeats = True
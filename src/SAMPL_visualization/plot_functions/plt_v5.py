@@ -2,14 +2,75 @@ import pandas as pd # pandas library
 import numpy as np # numpy
 from plot_functions.plt_tools import jackknife_list
 from plot_functions.plt_tools import round_half_up
+from plot_functions.get_index import get_aligned_frames
 
+# columns of prop_bout_aligned used by extract_bout_features_v5(), read only these with data_access.read_table()
+BOUT_FEATURE_COLS = ['propBoutAligned_pitch','propBoutAligned_instHeading','propBoutAligned_speed','propBoutAligned_x','propBoutAligned_y']
 
 
+def get_bout_frames(bout_data, cols):
+    """reshape columns of aligned bouts to arrays of (bouts, frames). Bouts are numbered by 'bout_num' and have the same frames ('idx')
+
+    Args:
+        bout_data (dataFrame): aligned bouts with 'idx' and 'bout_num' columns, frames of each bout in consecutive rows
+        cols (list): columns to reshape
+
+    Returns:
+        frames (ndarray): frame number (idx) of each frame
+        bout_frames (dict): array of (bouts, frames) for each column, a view of the column
+    """
+    n_bouts = bout_data['bout_num'].nunique()
+    n_frames = len(bout_data) // n_bouts if n_bouts else 1
+    frame_idx = get_aligned_frames(bout_data['idx'].to_numpy(), None, n_frames, [0, n_frames])
+    if n_bouts * n_frames != len(bout_data) or not (frame_idx == frame_idx[:1]).all():
+        raise ValueError("all bouts need to have the same frames")
+    frames = frame_idx[0] if n_bouts else np.array([], dtype=frame_idx.dtype)
+    bout_frames = {col:get_aligned_frames(bout_data[col].to_numpy(), None, n_frames, [0, n_frames]) for col in cols}
+    return frames, bout_frames
+
+def get_frame_values(values, frames, idx):
+    """values of each bout at frame idx
+
+    Args:
+        values (ndarray): (bouts, frames), see get_bout_frames()
+        frames (ndarray): frame number of each frame
+        idx (int): frame number to get
+
+    Returns:
+        ndarray: value of each bout, NaN if idx is not in frames
+    """
+    position = np.flatnonzero(frames == idx)
+    if len(position) == 0:
+        return np.full(len(values), np.nan)
+    return values[:, position[0]]
+
+def get_swim_displ(speed, x, y, threshold):
+    """displacement from the first to the last frame with speed above threshold of each bout
+
+    Args:
+        speed (ndarray): (bouts, frames) speed
+        x (ndarray): (bouts, frames) x position
+        y (ndarray): (bouts, frames) y position
+        threshold (numeric): speed threshold
+
+    Returns:
+        ndarray: displacement of each bout, NaN if speed is never above threshold
+    """
+    if_swim = speed > threshold
+    if_any = if_swim.any(axis=1)
+    first = if_swim.argmax(axis=1)
+    # last frame above threshold is the first one searching from the end
+    last = if_swim.shape[1] - 1 - if_swim[:, ::-1].argmax(axis=1)
+    bouts = np.arange(len(speed))
+    y_swim = np.where(if_any, y[bouts, first] - y[bouts, last], np.nan)
+    x_swim = np.where(if_any, x[bouts, first] - x[bouts, last], np.nan)
+    return np.sqrt(np.square(y_swim) + np.square(x_swim))
+
 def extract_bout_features_v5(bout_data,PEAK_IDX, FRAME_RATE,**kwargs):
     """extract bout features from analyzed bout data.
 
     Args:
-        bout_data (dataFrame): bout data read from ('bout_data.h5', key='prop_bout_aligned')
+        bout_data (dataFrame): bout data read from ('bout_data.h5', key='prop_bout_aligned'), with frame number 'idx' and 'bout_num'. All bouts need to have the same frames
         PEAK_IDX (numeric): index of the frame at time of peak speed
         FRAME_RATE (int): frame rate
 
@@ -34,22 +95,22 @@ def extract_bout_features_v5(bout_data,PEAK_IDX, FRAME_RATE,**kwargs):
     for key, value in kwargs.items():
         if key == 'idx_max_angvel':
             idx_max_angvel = value
-            
+    
+    # reshape once, features are read by frame position
+    frames, bout_frames = get_bout_frames(bout_data, BOUT_FEATURE_COLS)
+    pitch = bout_frames['propBoutAligned_pitch']
     this_exp_features = pd.DataFrame(data={
-        'pitch_initial':bout_data.loc[bout_data['idx']==idx_initial,'propBoutAligned_pitch'].values, 
-        'pitch_pre_bout':bout_data.loc[bout_data['idx']==idx_pre_bout,'propBoutAligned_pitch'].values, 
-        'pitch_peak':bout_data.loc[bout_data['idx']==PEAK_IDX,'propBoutAligned_pitch'].values, 
-        'pitch_post_bout':bout_data.loc[bout_data['idx']==idx_post_bout,'propBoutAligned_pitch'].values, 
-        'pitch_end': bout_data.loc[bout_data['idx']==idx_end,'propBoutAligned_pitch'].values, 
-        # 'pitch_mid_accel': bout_data.loc[bout_data['idx']==idx_mid_accel,'propBoutAligned_pitch'].values, 
-        'pitch_max_angvel': bout_data.loc[bout_data['idx']==idx_max_angvel,'propBoutAligned_pitch'].values, 
-        'traj_peak':bout_data.loc[bout_data['idx']==PEAK_IDX,'propBoutAligned_instHeading'].values, 
-        'spd_peak':bout_data.loc[bout_data['idx']==PEAK_IDX,'propBoutAligned_speed'].values, 
+        'pitch_initial':get_frame_values(pitch, frames, idx_initial), 
+        'pitch_pre_bout':get_frame_values(pitch, frames, idx_pre_bout), 
+        'pitch_peak':get_frame_values(pitch, frames, PEAK_IDX), 
+        'pitch_post_bout':get_frame_values(pitch, frames, idx_post_bout), 
+        'pitch_end': get_frame_values(pitch, frames, idx_end), 
+        # 'pitch_mid_accel': get_frame_values(pitch, frames, idx_mid_accel), 
+        'pitch_max_angvel': get_frame_values(pitch, frames, idx_max_angvel), 
+        'traj_peak':get_frame_values(bout_frames['propBoutAligned_instHeading'], frames, PEAK_IDX), 
+        'spd_peak':get_frame_values(bout_frames['propBoutAligned_speed'], frames, PEAK_IDX), 
     })
-    swim_indicator = bout_data['propBoutAligned_speed'] > 5
-    y_swim = bout_data.loc[swim_indicator].groupby('bout_num').head(1)['propBoutAligned_y'].values - bout_data.loc[swim_indicator].groupby('bout_num').tail(1)['propBoutAligned_y'].values
-    x_swim = bout_data.loc[swim_indicator].groupby('bout_num').head(1)['propBoutAligned_x'].values - bout_data.loc[swim_indicator].groupby('bout_num').tail(1)['propBoutAligned_x'].values
-    displ = np.sqrt(np.square(y_swim) + np.square(x_swim))
+    displ = get_swim_displ(bout_frames['propBoutAligned_speed'], bout_frames['propBoutAligned_x'], bout_frames['propBoutAligned_y'], 5)
     
     this_exp_features = this_exp_features.assign(rot_total=this_exp_features['pitch_post_bout']-this_exp_features['pitch_initial'],
                                                  rot_steering = this_exp_features['pitch_peak']-this_exp_features['pitch_initial'],
@@ -61,6 +122,43 @@ def extract_bout_features_v5(bout_data,PEAK_IDX, FRAME_RATE,**kwargs):
                                                 )  
     return this_exp_features
 
+def get_bout_category(bout_category, category):
+    """get nose-up, nose-down or flat bouts from bout category codes
+
+    Args:
+        bout_category (array): category code of each bout, read from ('bout_data.h5', key='prop_bout2')['propBout_category']
+        category (string): 'hUp', 'hDn' or 'flat'
+
+    Returns:
+        ndarray: True for bouts in the category
+    """
+    bout_category = np.asarray(bout_category)
+    if category == 'hUp':
+        return (bout_category & 1) > 0
+    elif category == 'hDn':
+        return (bout_category & 1) == 0
+    elif category == 'flat':
+        return (bout_category & 2) > 0
+    raise ValueError(f"unknown bout category: {category}")
+
+def add_category_columns(bout_data, bout_category, categories=['hUp','hDn','flat']):
+    """derive _hUp, _hDn and _flat columns of aligned angVel, speed and pitch, which are no longer saved in prop_bout_aligned by default. Values of bouts outside the category are NaN
+
+    Args:
+        bout_data (dataFrame): bout data read from ('bout_data.h5', key='prop_bout_aligned'), same number of frames for each bout
+        bout_category (array): category code of each bout, see get_bout_category()
+        categories (list, optional): categories to derive. Defaults to ['hUp','hDn','flat'].
+
+    Returns:
+        dataFrame: bout_data with category columns
+    """
+    n_frames = len(bout_data) // len(bout_category)
+    for category in categories:
+        if_category = np.repeat(get_bout_category(bout_category, category), n_frames)
+        for col in ['angVel', 'speed', 'pitch']:
+            bout_data[f'propBoutAligned_{col}_{category}'] = np.where(if_category, bout_data[f'propBoutAligned_{col}'].values, np.nan)
+    return bout_data
+
 def get_kinematics(df):
     """get kinematics measurements: righting gain, steering tgain, set point
 
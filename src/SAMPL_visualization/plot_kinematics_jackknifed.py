@@ -33,8 +33,9 @@ import numpy as np # numpy
 import seaborn as sns
 import matplotlib.pyplot as plt
 from plot_functions.plt_tools import (set_font_type, day_night_split, round_half_up, setup_vis_parameter, defaultPlotting)
-from plot_functions.plt_v5 import (jackknife_kinematics, extract_bout_features_v5, get_kinematics)
+from plot_functions.plt_v5 import (jackknife_kinematics, get_kinematics)
 from plot_functions.get_index import (get_index, get_frame_rate)
+from plot_functions.plot_data import PlotData
 
 # %%
 def plot_kinematics_jackknifed(root, **kwargs):
@@ -45,6 +46,7 @@ def plot_kinematics_jackknifed(root, **kwargs):
         ---kwargs---
         sample_bout (int): number of bouts to sample from each experimental repeat. default is off
         figure_dir (str): directory to save figures. If not defined, figures will be saved to folder "figures"
+        data (PlotData): data shared with other plotting functions, see plot_functions/plot_data.py. If not defined, data is read for this function only
 
     """
     print('------\n+ Plotting bout kinematics (jackknife across repeats)')
@@ -54,6 +56,10 @@ def plot_kinematics_jackknifed(root, **kwargs):
     fig_dir = os.path.join(folder_dir, 'figures', folder_name)
     
     root, all_dir, fig_dir, if_sample, SAMPLE_N, if_multiple_repeats = setup_vis_parameter(root, fig_dir, if_sample=False, SAMPLE_N=-1, if_multiple_repeats=False, **kwargs)
+    data = PlotData()
+    for key, value in kwargs.items():
+        if key == 'data':
+            data = value
         
     # get frame rate
     try:
@@ -82,28 +88,9 @@ def plot_kinematics_jackknifed(root, **kwargs):
     all_dir.sort()
     # go through each condition folders under the root
     for expNum, exp in enumerate(all_dir):
-        # angular velocity (angVel) calculation
-        rows = []
-        # for each sub-folder, get the path
-        exp_path = exp
-        # get pitch                
-        exp_data = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout_aligned')
-        # assign frame number, total_aligned frames per bout
-        exp_data = exp_data.assign(idx=round_half_up(len(exp_data)/total_aligned)*list(range(0,total_aligned)))
-        
-        # - get the index of the rows in exp_data to keep (for each bout, there are range(0:51) frames. keep range(20:41) frames)
-        bout_time = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout2').loc[:,['aligned_time']]
-        # # if only need day or night bouts:
-        for i in day_night_split(bout_time,'aligned_time').index:
-            rows.extend(list(range(i*total_aligned+round_half_up(idxRANGE[0]),i*total_aligned+round_half_up(idxRANGE[1]))))
-        exp_data = exp_data.assign(expNum = exp)
-        trunc_day_exp_data = exp_data.loc[rows,:]
-        trunc_day_exp_data = trunc_day_exp_data.assign(
-            bout_num = trunc_day_exp_data.groupby(np.arange(len(trunc_day_exp_data))//(idxRANGE[1]-idxRANGE[0])).ngroup()
-            )
-        num_of_bouts = len(trunc_day_exp_data.loc[trunc_day_exp_data['idx'] == peak_idx])
-        
-        this_exp_features = extract_bout_features_v5(trunc_day_exp_data,peak_idx,FRAME_RATE)
+        # features of day bouts, extracted once for all plotting functions sharing data
+        this_exp_features = data.get_bout_features(exp, peak_idx, total_aligned, idxRANGE, FRAME_RATE)
+        num_of_bouts = len(this_exp_features)
         this_exp_features = this_exp_features.assign(
             expNum = [expNum]*num_of_bouts,
             )
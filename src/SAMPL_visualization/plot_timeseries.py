@@ -37,8 +37,9 @@ import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-from plot_functions.plt_tools import (set_font_type, day_night_split, round_half_up, setup_vis_parameter, defaultPlotting)
-from plot_functions.get_index import (get_index, get_frame_rate)
+from plot_functions.plt_tools import (set_font_type, day_night_split, round_half_up, setup_vis_parameter, defaultPlotting, walk_data_dirs)
+from plot_functions.get_index import (get_index, get_frame_rate, get_aligned_rows)
+from plot_functions.plot_data import PlotData
 
 from tqdm import tqdm
 
@@ -50,6 +51,7 @@ def plot_aligned(root, **kwargs):
         root (str): a directory containing analyzed dlm data.
         ---kwargs---
         figure_dir (str): directory to save figures. If not defined, figures will be saved to folder "figures"
+        data (PlotData): data shared with other plotting functions, see plot_functions/plot_data.py. If not defined, data is read for this function only
 
     """
     print('------\n+ Plotting parameter time series (mean ± SD).')
@@ -93,6 +95,10 @@ def plot_aligned(root, **kwargs):
     fig_dir = os.path.join(folder_dir, 'figures', folder_name)
     
     root, all_dir, fig_dir, if_sample, SAMPLE_N, if_multiple_repeats = setup_vis_parameter(root, fig_dir, if_sample=False, SAMPLE_N=0, if_multiple_repeats=False, **kwargs)
+    data = PlotData()
+    for key, value in kwargs.items():
+        if key == 'data':
+            data = value
         
     # get frame rate
     try:
@@ -109,9 +115,10 @@ def plot_aligned(root, **kwargs):
     
     exp_data_all = pd.DataFrame()
     for expNum, exp_path in enumerate(all_dir):
-        rows = []
         # get pitch                
-        exp_data = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout_aligned')
+        # linear accel is calculated from speed
+        aligned_cols = ['propBoutAligned_speed'] + [col for col in all_features.keys() if col not in ['propBoutAligned_speed', 'propBoutAligned_linearAccel']]
+        exp_data = data.read_table(exp_path, 'prop_bout_aligned', columns=aligned_cols)
         exp_data = exp_data.assign(
             propBoutAligned_linearAccel = exp_data['propBoutAligned_speed'].diff()
         )
@@ -121,11 +128,8 @@ def plot_aligned(root, **kwargs):
         exp_data = exp_data.assign(idx=round_half_up(len(exp_data)/total_aligned)*list(range(0,total_aligned)))
 
         # - get the index of the rows in exp_data to keep
-        bout_time = pd.read_hdf(f"{exp_path}/bout_data.h5", key='prop_bout2').loc[:,['aligned_time']]
-        # for i in bout_time.index:
         # # if only need day or night bouts:
-        for i in day_night_split(bout_time,'aligned_time').index:
-            rows.extend(list(range(i*total_aligned+idxRANGE[0],i*total_aligned+idxRANGE[1])))
+        rows = get_aligned_rows(data.get_day_index(exp_path, 'prop_bout2', 'aligned_time'), total_aligned, idxRANGE)
 
         exp_data = exp_data.assign(time_s = (exp_data['idx']-peak_idx)/FRAME_RATE*1000)
         exp_data_all = pd.concat([exp_data_all,exp_data.loc[rows,:]])
@@ -174,13 +178,19 @@ def plot_aligned(root, **kwargs):
         plt.savefig(os.path.join(fig_dir, f"{feature_toplt}_timeSeries.pdf"),format='PDF')
 
 # %%
-def plot_raw(root):
+def plot_raw(root, **kwargs):
     """Plots single epoch that contains one or more bouts
 
     Args:
         root (string): a directory containing analyzed dlm data.
+        ---kwargs---
+        data (PlotData): data shared with other plotting functions, see plot_functions/plot_data.py. If not defined, data is read for this function only
 
     """
+    data = PlotData()
+    for key, value in kwargs.items():
+        if key == 'data':
+            data = value
     print('------\n+ Plotting time series (raw)')
 
     # %% features for plotting
@@ -219,7 +229,7 @@ def plot_raw(root):
 
     # %%
     # for each sub-folder, get the path
-    all_dir = [ele[0] for ele in os.walk(root)]
+    all_dir = [ele[0] for ele in walk_data_dirs(root)]
     if len(all_dir) > 1:
         all_dir = all_dir[1:]
         
@@ -234,7 +244,7 @@ def plot_raw(root):
     epoch_data_all = pd.DataFrame()
     for expNum, exp_path in enumerate(all_dir):
         # get pitch                
-        all_data = pd.read_hdf(f"{exp_path}/all_data.h5", key='grabbed_all')
+        all_data = data.read_table(exp_path, 'grabbed_all', columns=list(all_features.keys()) + ['epochNum', 'deltaT'])
 
         exp_data = all_data.loc[:,all_features.keys()]
         exp_data = exp_data.rename(columns=all_features)
@@ -0,0 +1,63 @@
+'''
+Analysis and visualization scripts import their packages relative to their own folders (e.g. "from preprocessing.epoch_ops import ..."), add both folders to sys.path
+Tests that run the analysis pipeline use synthetic .dlm files written by benchmarks/synthetic_dlm.py
+'''
+
+import os
+import sys
+import shutil
+import pytest
+
+# plotting functions save figures without showing them
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for folder in [os.path.join('src', 'SAMPL_analysis'), os.path.join('src', 'SAMPL_visualization'), 'benchmarks']:
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+FRAME_RATE = 166
+# .dlm files named by recording time, as saved by the apparatus
+DLM_FILES = ["221212 10.30.00.dlm", "221213 11.30.00.dlm"]
+
+@pytest.fixture(scope='session')
+def dlm_folder(tmp_path_factory):
+    """folder of synthetic .dlm files, 3 MB each
+    """
+    from synthetic_dlm import write_synthetic_dlm
+    folder = tmp_path_factory.mktemp('dlm')
+    for i, filename in enumerate(DLM_FILES):
+        write_synthetic_dlm(folder / filename, 3*1024**2, seed=i, frame_rate=FRAME_RATE)
+    return folder
+
+@pytest.fixture(scope='session')
+def analyze(dlm_folder, tmp_path_factory):
+    """function to run grab_fish_angle_v5.run() on copies of synthetic .dlm files in a data folder
+    """
+    from bout_analysis import grab_fish_angle_v5
+    log_dir = tmp_path_factory.mktemp('log')
+
+    def run_analysis(folder, n_files=len(DLM_FILES), **kwargs):
+        """analyze the first n_files synthetic .dlm files in folder, other .dlm files in folder are removed
+
+        Args:
+            folder (Path): data folder, created if it doesn't exist
+            n_files (int, optional): number of .dlm files to analyze. Defaults to all files.
+            ---kwargs---
+            passed to grab_fish_angle_v5.run()
+
+        Returns:
+            string: directory of the data folder
+        """
+        folder.mkdir(parents=True, exist_ok=True)
+        for filename in folder.glob('*.dlm'):
+            filename.unlink()
+        for filename in DLM_FILES[:n_files]:
+            shutil.copy(dlm_folder / filename, folder / filename)
+        cwd = os.getcwd()
+        os.chdir(log_dir)  # log file is written to the working directory
+        try:
+            grab_fish_angle_v5.run(sorted(str(f) for f in folder.glob('*.dlm')), str(folder), FRAME_RATE, **kwargs)
+        finally:
+            os.chdir(cwd)
+        return str(folder)
+    return run_analysis
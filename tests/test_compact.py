@@ -0,0 +1,41 @@
+'''
+Numerical drift of compact outputs (SAMPL_analysis(root, frame_rate, compact=True)) against float64 outputs, on kinematics calculated by plotting scripts: righting gain, steering gain and set point
+'''
+
+import numpy as np
+import pytest
+from conftest import FRAME_RATE
+from plot_functions.data_access import read_table
+from plot_functions.plt_v5 import extract_bout_features_v5, get_kinematics, BOUT_FEATURE_COLS
+from plot_functions.get_index import get_index
+
+# max relative difference of kinematics between compact and float64 outputs
+KINEMATICS_RTOL = 1e-5
+
+@pytest.fixture(scope='module')
+def analyzed_folders(analyze, tmp_path_factory):
+    """analyze the same synthetic .dlm files with float64 and compact data types
+    """
+    root = tmp_path_factory.mktemp('compact')
+    return {name:analyze(root / name, compact=compact) for name, compact in [('float64', False), ('compact', True)]}
+
+def get_bout_features(exp_path):
+    peak_idx, total_aligned = get_index(FRAME_RATE)
+    bout_data = read_table(exp_path, 'prop_bout_aligned', columns=BOUT_FEATURE_COLS)
+    n_bouts = len(bout_data) // total_aligned
+    bout_data = bout_data.assign(
+        idx = np.tile(np.arange(total_aligned), n_bouts),
+        bout_num = np.repeat(np.arange(n_bouts), total_aligned),
+    )
+    return extract_bout_features_v5(bout_data, peak_idx, FRAME_RATE)
+
+def test_compact_outputs_are_compact(analyzed_folders):
+    bout_data = read_table(analyzed_folders['compact'], 'prop_bout_aligned', columns=['propBoutAligned_pitch'])
+    assert bout_data['propBoutAligned_pitch'].dtype == 'float32'
+
+def test_compact_kinematics_drift(analyzed_folders):
+    features = {name:get_bout_features(folder) for name, folder in analyzed_folders.items()}
+    assert len(features['float64']) == len(features['compact']) > 0
+    kinematics = {name:get_kinematics(value) for name, value in features.items()}
+    rel_diff = ((kinematics['compact'] - kinematics['float64']) / kinematics['float64']).abs()
+    assert (rel_diff < KINEMATICS_RTOL).all(), rel_diff
@@ -0,0 +1,56 @@
+'''
+smooth_segments_ML() against the previous per-epoch smoothing: smooth_series_ML() of each epoch from df.groupby('epochNum', sort=False)
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+from preprocessing.epoch_ops import get_epoch_segments, to_segments, from_segments, smooth_segments_ML
+from preprocessing.analyze_dlm_v5 import smooth_series_ML
+
+def smooth_series_ML_previous(a,WSZ):
+    '''
+    smooth_series_ML() before it called smooth_segments_ML(). np.cumsum() of a Series skips NaN
+    '''
+    out0 = np.convolve(a,np.ones(WSZ,dtype=int),'valid')/WSZ
+    r = np.arange(1,WSZ-1,2)
+    start = np.cumsum(a[:WSZ-1])[::2]/r
+    stop = (np.cumsum(a[:-WSZ:-1])[::2]/r)[::-1]
+    res = np.concatenate((  start , out0, stop  ))
+    return pd.Series(data=res, index=a.index)
+
+def make_epochs(seed, WSZ, if_contiguous, nan_fraction):
+    """random frames of epochs at least WSZ frames long, with a non-default index
+    """
+    rng = np.random.default_rng(seed)
+    n_epochs = rng.integers(1, 8)
+    epoch_len = rng.integers(WSZ, 60, n_epochs)
+    epoch_num = np.repeat(rng.permutation(1000)[:n_epochs], epoch_len)
+    if not if_contiguous:
+        # frames of the first epoch appear again after other epochs
+        epoch_num = np.concatenate([epoch_num, epoch_num[:epoch_len[0]]])
+    values = rng.normal(size=len(epoch_num))*50
+    values[rng.random(len(epoch_num)) < nan_fraction] = np.nan
+    return pd.DataFrame({'epochNum':epoch_num, 'ang':values}, index=np.arange(len(epoch_num))+3)
+
+@pytest.mark.parametrize('WSZ', [1, 3, 5, 7, 9, 11])
+@pytest.mark.parametrize('if_contiguous', [True, False])
+@pytest.mark.parametrize('nan_fraction', [0, 0.05])
+def test_smooth_segments_ML_matches_per_epoch_smoothing(WSZ, if_contiguous, nan_fraction):
+    for seed in range(20):
+        df = make_epochs(seed, WSZ, if_contiguous, nan_fraction)
+        expected = pd.concat(
+            smooth_series_ML_previous(group['ang'], WSZ) for _, group in df.groupby('epochNum', sort=False)
+        ).reindex(df.index).to_numpy()
+        order, offsets = get_epoch_segments(df['epochNum'].values)
+        res = from_segments(smooth_segments_ML(to_segments(df['ang'].values, order), offsets, WSZ), order)
+        np.testing.assert_array_equal(res, expected)
+
+@pytest.mark.parametrize('WSZ', [1, 3, 5, 7, 9, 11])
+def test_smooth_series_ML_matches_previous(WSZ):
+    df = make_epochs(0, WSZ, True, 0.05)
+    pd.testing.assert_series_equal(smooth_series_ML(df['ang'], WSZ), smooth_series_ML_previous(df['ang'], WSZ))
+
+def test_smooth_segments_ML_short_segment():
+    with pytest.raises(ValueError):
+        smooth_segments_ML(np.arange(10), [0, 2, 10], 3)
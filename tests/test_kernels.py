@@ -0,0 +1,143 @@
+'''
+Parity of bout detection kernels (bout_analysis/kernels.py): numba-compiled kernels, their Python loops and NumPy implementations against the previous pandas implementations in grab_fish_angle(), on frames with NaN and ties
+Tests of compiled kernels are skipped if numba is not installed
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+from bout_analysis import kernels
+from bout_analysis.kernels import window_argmax, smooth_diff_argmax, link_swim_gaps
+from bout_analysis.bout_windows import get_loco_index, get_swim_windows, link_swim_windows
+from bout_analysis.grab_fish_angle_v5 import grp_by_swim
+from test_epoch_ops import smooth_series_ML_previous
+
+MIN_SWIM_INTERVAL = 0.1
+FRAME_INTERVAL = np.timedelta64(6024096, 'ns')  # 166 Hz
+
+requires_numba = pytest.mark.skipif(not kernels.if_jit(True), reason="numba is not installed")
+
+def idxmax_skipna(series):
+    """series.idxmax(), NaN if all values are NaN
+    """
+    return np.nan if series.isna().all() else series.idxmax()
+
+def make_values(seed, n_frames=3000):
+    """values with NaN, runs of NaN and ties
+    """
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.normal(size=n_frames)*3)
+    values[rng.random(n_frames) < 0.05] = np.nan
+    values[100:130] = np.nan
+    return values
+
+def make_windows(seed, n_frames, min_len, n_windows=300):
+    rng = np.random.default_rng(seed)
+    window_len = rng.integers(min_len, 60, n_windows)
+    window_start = rng.integers(0, n_frames-window_len)
+    return window_start, window_start + window_len - 1
+
+def make_swim_indicator(seed, first, n_runs=300):
+    """runs of swim/non-swim frames of 1 to 40 frames, with the first frame set to first
+    """
+    rng = np.random.default_rng(seed)
+    run_len = rng.integers(1, 40, n_runs)
+    swim_indicator = np.repeat(np.arange(n_runs) % 2, run_len)
+    swim_indicator[0] = first
+    abs_time = np.datetime64('2022-12-12T10:30:00') + np.arange(len(swim_indicator))*FRAME_INTERVAL
+    # recording gaps
+    abs_time[len(abs_time)//2:] += np.timedelta64(1, 's')
+    return swim_indicator, abs_time
+
+def window_argmax_previous(values, window_start, window_end):
+    """df.loc[start:end].idxmax() of each window, as in grab_fish_angle() before kernels.py
+    """
+    series = pd.Series(values)
+    return np.array([idxmax_skipna(series.loc[start:end]) for start, end in zip(window_start, window_end)], dtype='float64')
+
+def smooth_diff_argmax_previous(values, window_start, window_end, WSZ):
+    """smooth_series_ML(df.loc[start:end], WSZ).diff().idxmax() of each window, as in grab_fish_angle() before kernels.py
+    """
+    series = pd.Series(values)
+    return np.array([idxmax_skipna(smooth_series_ML_previous(series.loc[start:end], WSZ).diff()) for start, end in zip(window_start, window_end)], dtype='float64')
+
+def link_swim_windows_previous(swim_indicator, abs_time, min_swim_interval):
+    """linking of swim windows in grab_fish_angle() before bout_windows.py
+    """
+    spd_window = pd.DataFrame({'swimIndicator':swim_indicator, 'absTime':abs_time})
+    spd_window = spd_window.assign(
+        locoIDX = spd_window['swimIndicator'].diff().abs().cumsum()
+    )
+    fast_win_st = grp_by_swim(spd_window,'locoIDX')[['locoIDX', 'absTime']].head(1)
+    fast_win_ed = grp_by_swim(spd_window,'locoIDX')[['locoIDX', 'absTime']].tail(1).reset_index(drop=True)
+    fast_win_st_shift = fast_win_st.iloc[1:].reset_index(drop=True)
+    loco_idx_adj_calculator = fast_win_ed[['locoIDX']]
+    loco_idx_adj_calculator = loco_idx_adj_calculator.assign(swimDelay = fast_win_st_shift['absTime'] - fast_win_ed['absTime'])
+    loco_idx_adj = loco_idx_adj_calculator.loc[loco_idx_adj_calculator['swimDelay'] < pd.Timedelta(seconds=min_swim_interval),'locoIDX'] + 1
+    spd_window_adj = spd_window.copy()
+    for window_idx in loco_idx_adj:
+        spd_window_adj.loc[spd_window_adj.locoIDX==window_idx,'swimIndicator'] = 1
+    return spd_window_adj['swimIndicator'].to_numpy()
+
+WINDOW_ARGMAX = {
+    'numpy': lambda values, start, end: window_argmax(values, start, end, jit=False),
+    'loop': kernels._window_argmax_loop,
+    'jit': pytest.param(lambda values, start, end: window_argmax(values, start, end, jit=True), marks=requires_numba),
+}
+SMOOTH_DIFF_ARGMAX = {
+    'numpy': lambda values, start, end, WSZ: smooth_diff_argmax(values, start, end, WSZ, jit=False),
+    'loop': kernels._smooth_diff_argmax_loop,
+    'jit': pytest.param(lambda values, start, end, WSZ: smooth_diff_argmax(values, start, end, WSZ, jit=True), marks=requires_numba),
+}
+
+@pytest.mark.parametrize('func', WINDOW_ARGMAX.values(), ids=WINDOW_ARGMAX.keys())
+@pytest.mark.parametrize('seed', range(3))
+def test_window_argmax(func, seed):
+    values = make_values(seed)
+    window_start, window_end = make_windows(seed, len(values), 1)
+    # windows crossing the edges of values and all-NaN windows
+    window_start = np.append(window_start, [-5, len(values)-10, 100, 105])
+    window_end = np.append(window_end, [10, len(values)+5, 129, 110])
+    expected = window_argmax_previous(values, window_start, window_end)
+    np.testing.assert_array_equal(func(values, window_start, window_end), expected)
+
+@pytest.mark.parametrize('func', WINDOW_ARGMAX.values(), ids=WINDOW_ARGMAX.keys())
+def test_swim_speed_peaks(func):
+    """peak search of swim windows, grp_by_swim(spd_window_adj,'locoIDXadj')['swimSpeed'].idxmax() before kernels.py
+    """
+    swim_indicator, _ = make_swim_indicator(0, 0)
+    swim_speed = np.abs(make_values(0, len(swim_indicator)))
+    df = pd.DataFrame({'swimSpeed':swim_speed, 'locoIDXadj':get_loco_index(swim_indicator)})
+    expected = grp_by_swim(df, 'locoIDXadj')['swimSpeed'].agg(idxmax_skipna)['swimSpeed'].to_numpy(dtype='float64')
+    swim_windows = get_swim_windows(df['locoIDXadj'])
+    np.testing.assert_array_equal(func(swim_speed, swim_windows['start'].values, swim_windows['end'].values), expected)
+
+@pytest.mark.parametrize('func', SMOOTH_DIFF_ARGMAX.values(), ids=SMOOTH_DIFF_ARGMAX.keys())
+@pytest.mark.parametrize('WSZ', [3, 5, 7])
+@pytest.mark.parametrize('seed', range(3))
+def test_smooth_diff_argmax(func, WSZ, seed):
+    values = make_values(seed)
+    window_start, window_end = make_windows(seed, len(values), WSZ)
+    expected = smooth_diff_argmax_previous(values, window_start, window_end, WSZ)
+    np.testing.assert_array_equal(func(values, window_start, window_end, WSZ), expected)
+
+def test_smooth_diff_argmax_short_window():
+    with pytest.raises(ValueError):
+        smooth_diff_argmax(np.arange(10.0), [0], [1], 3)
+
+@pytest.mark.parametrize('impl', ['numpy', 'loop', pytest.param('jit', marks=requires_numba)])
+@pytest.mark.parametrize('first', [0, 1])
+def test_link_swim_windows(impl, first, monkeypatch):
+    swim_indicator, abs_time = make_swim_indicator(first, first)
+    expected = link_swim_windows_previous(swim_indicator, abs_time, MIN_SWIM_INTERVAL)
+    if impl == 'numpy':
+        res = link_swim_windows(swim_indicator, get_loco_index(swim_indicator), abs_time, MIN_SWIM_INTERVAL)
+    else:
+        if impl == 'loop':
+            # link_swim_gaps() runs the Python loop if numba is not installed
+            monkeypatch.setattr(kernels, 'numba', None)
+        res = link_swim_gaps(swim_indicator, abs_time, MIN_SWIM_INTERVAL)
+    if first == 0:
+        # short gaps are linked. If the first frame is a swim frame, runs of non-swim frames are numbered as swim windows, setting frames between them as swim changes nothing
+        assert (expected != swim_indicator).any()
+    np.testing.assert_array_equal(res, expected)
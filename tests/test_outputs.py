@@ -0,0 +1,92 @@
+'''
+Outputs of reanalyzed data folders: files written by previous runs with other options must not be read instead of new outputs
+Outputs of data folders without any usable .dlm file
+'''
+
+import os
+import shutil
+import numpy as np
+import tables
+import pandas as pd
+from plot_functions.data_access import read_table, if_aligned_store
+from bout_analysis import grab_fish_angle_v5
+from synthetic_dlm import gen_epoch
+from conftest import FRAME_RATE, DLM_FILES
+
+def test_rerun_without_aligned_store(analyze, tmp_path):
+    folder = analyze(tmp_path / 'exp', n_files=2)
+    assert os.path.isfile(os.path.join(folder, 'aligned_bouts.h5'))
+    analyze(tmp_path / 'exp', n_files=1, aligned_store=False)
+    assert not os.path.isfile(os.path.join(folder, 'aligned_bouts.h5'))
+    pitch = read_table(folder, 'prop_bout_aligned', columns=['propBoutAligned_pitch'])
+    expected = pd.read_hdf(os.path.join(folder, 'bout_data.h5'), 'prop_bout_aligned', columns=['propBoutAligned_pitch'])
+    assert len(pitch) == len(expected)
+
+def test_rerun_with_hdf_backend(analyze, tmp_path):
+    folder = analyze(tmp_path / 'exp', n_files=2, output_backend='both')
+    assert os.path.isdir(os.path.join(folder, 'parquet'))
+    analyze(tmp_path / 'exp', n_files=1, output_backend='hdf')
+    assert not os.path.isdir(os.path.join(folder, 'parquet'))
+    bout_time = read_table(folder, 'prop_bout2', columns=['aligned_time'])
+    expected = pd.read_hdf(os.path.join(folder, 'bout_data.h5'), 'prop_bout2', columns=['aligned_time'])
+    pd.testing.assert_frame_equal(bout_time, expected)
+
+def test_stale_aligned_store_is_not_read(analyze, tmp_path):
+    """aligned_bouts.h5 that doesn't match bout_data.h5, e.g. copied from another analysis, is not used
+    """
+    folder = analyze(tmp_path / 'exp', n_files=2)
+    expected = pd.read_hdf(os.path.join(folder, 'bout_data.h5'), 'prop_bout_aligned', columns=['propBoutAligned_pitch'])
+    pd.testing.assert_frame_equal(read_table(folder, 'prop_bout_aligned', columns=['propBoutAligned_pitch']), expected)
+    shutil.copy(os.path.join(folder, 'aligned_bouts.h5'), tmp_path / 'aligned_bouts.h5')
+    analyze(tmp_path / 'exp', n_files=1)
+    shutil.copy(tmp_path / 'aligned_bouts.h5', os.path.join(folder, 'aligned_bouts.h5'))
+    expected = pd.read_hdf(os.path.join(folder, 'bout_data.h5'), 'prop_bout_aligned', columns=['propBoutAligned_pitch'])
+    pd.testing.assert_frame_equal(read_table(folder, 'prop_bout_aligned', columns=['propBoutAligned_pitch']), expected)
+
+def test_no_dlm_file(analyze, tmp_path):
+    folder = analyze(tmp_path / 'exp', n_files=0)
+    assert not os.path.isfile(os.path.join(folder, 'bout_data.h5'))
+    assert not os.path.isfile(os.path.join(folder, 'analysis info.csv'))
+
+def test_all_files_skipped(tmp_path, monkeypatch):
+    """files with epochs too short to analyze are skipped by analyze_dlm_resliced()
+    """
+    folder = tmp_path / 'exp'
+    folder.mkdir()
+    filenames = [str(folder / filename) for filename in DLM_FILES]
+    rng = np.random.default_rng(0)
+    for filename in filenames:
+        epochs = [gen_epoch(rng, epoch_num, epoch_num*10.0)[:20] for epoch_num in range(1, 6)]
+        np.savetxt(filename, np.concatenate(epochs), fmt='%.6f', delimiter='\t')
+    monkeypatch.chdir(tmp_path)  # log file is written to the working directory
+    grab_fish_angle_v5.run(filenames, str(folder), FRAME_RATE)
+    assert not os.path.isfile(folder / 'bout_data.h5')
+    assert not os.path.isfile(folder / 'analysis info.csv')
+
+def test_fish_length_of_all_files(analyze, dlm_folder, tmp_path, monkeypatch):
+    """fish length in analysis info is the mean of all files, not of the last file
+    """
+    read_fish_length = lambda folder: float(pd.read_csv(os.path.join(folder, 'analysis info.csv'), index_col=0).iloc[:, 0]['fish_length'])
+    fish_length_all = read_fish_length(analyze(tmp_path / 'all'))
+    fish_length_first = read_fish_length(analyze(tmp_path / 'first', n_files=1))
+    folder = tmp_path / 'last'
+    folder.mkdir()
+    shutil.copy(dlm_folder / DLM_FILES[-1], folder / DLM_FILES[-1])
+    monkeypatch.chdir(tmp_path)  # log file is written to the working directory
+    grab_fish_angle_v5.run([str(folder / DLM_FILES[-1])], str(folder), FRAME_RATE)
+    fish_length_last = read_fish_length(folder)
+    assert fish_length_all != fish_length_last
+    assert min(fish_length_first, fish_length_last) <= fish_length_all <= max(fish_length_first, fish_length_last)
+
+def test_stale_aligned_store_with_same_bouts(analyze, tmp_path):
+    """aligned_bouts.h5 of a previous analysis with the same number of bouts is not used
+    """
+    folder = analyze(tmp_path / 'exp', n_files=1)
+    shutil.copy(os.path.join(folder, 'aligned_bouts.h5'), tmp_path / 'aligned_bouts.h5')
+    analyze(tmp_path / 'exp', n_files=1, output_backend='hdf')
+    shutil.copy(tmp_path / 'aligned_bouts.h5', os.path.join(folder, 'aligned_bouts.h5'))
+    assert not if_aligned_store(folder)
+    with tables.open_file(os.path.join(folder, 'aligned_bouts.h5'), mode='a') as h5:
+        h5.get_node('/', 'prop_bout_aligned')[0, 0, :] = 1e6  # stale values
+    expected = pd.read_hdf(os.path.join(folder, 'bout_data.h5'), 'prop_bout_aligned', columns=['propBoutAligned_pitch'])
+    pd.testing.assert_frame_equal(read_table(folder, 'prop_bout_aligned', columns=['propBoutAligned_pitch']), expected)
@@ -0,0 +1,15 @@
+'''
+Dates of .dlm files used to partition Parquet outputs
+'''
+
+import pytest
+from bout_analysis.parquet_output import get_dlm_date
+
+@pytest.mark.parametrize('filename', [
+    '221212 10.30.00.dlm',
+    'fish0 221212 10.30.00.dlm',
+    '/data/box 1/221212 10.30.00.dlm',
+    '/data/box 1/fish0 221212 10.30.00.dlm',
+])
+def test_get_dlm_date(filename):
+    assert get_dlm_date(filename) == '221212'
@@ -0,0 +1,23 @@
+'''
+Plotting functions on data folders analyzed with different options. Folders saved inside data folders by SAMPL_analysis (Parquet datasets, .dlm cache) are not experiment repeats
+'''
+
+import os
+from plot_kinematics import plot_kinematics
+from plot_functions.plt_tools import setup_vis_parameter
+
+def test_plot_with_parquet_outputs(analyze, tmp_path):
+    folder = analyze(tmp_path / 'exp', output_backend='both')
+    assert os.path.isdir(os.path.join(folder, 'parquet'))
+    _, all_dir, _, _, _, if_multiple_repeats = setup_vis_parameter(folder, str(tmp_path / 'figures'))
+    assert all_dir == [folder] and not if_multiple_repeats
+    plot_kinematics(folder, figure_dir=str(tmp_path / 'figures'))
+    assert os.listdir(tmp_path / 'figures')
+
+def test_plot_with_dlm_cache(analyze, tmp_path):
+    folder = analyze(tmp_path / 'exp', dlm_cache=True)
+    assert os.path.isdir(os.path.join(folder, '.dlm_cache'))
+    _, all_dir, _, _, _, if_multiple_repeats = setup_vis_parameter(folder, str(tmp_path / 'figures'))
+    assert all_dir == [folder] and not if_multiple_repeats
+    plot_kinematics(folder, figure_dir=str(tmp_path / 'figures'))
+    assert os.listdir(tmp_path / 'figures')
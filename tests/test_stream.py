@@ -0,0 +1,40 @@
+'''
+Streaming analysis (stream=True) compared with whole-file analysis
+Chunks hold complete epochs and positions are offset by previous chunks, so all outputs match exactly except:
+    epoch_attributes: per-epoch means are matched to rows within each chunk (epoch numbers and times match)
+    wolpert_IEI: the first IEI of each chunk has no pair
+'''
+
+import os
+import pandas as pd
+import pytest
+from bout_analysis.hdf_output import OUTPUT_FILES
+
+# chunk size of streaming analysis, synthetic .dlm files are split into 3 chunks
+CHUNK_SIZE = 1024**2
+# tables that depend on chunks, see module docstring
+CHUNK_DEPENDENT = {
+    'epoch_attributes':['mean_bl_angVel', 'epoch_mean_angVel', 'epoch_pause_yvel', 'epoch_bout_yvel', 'yvel_mean'],
+    'wolpert_IEI':None,
+}
+
+@pytest.fixture(scope='module')
+def folders(analyze, tmp_path_factory):
+    root = tmp_path_factory.mktemp('stream')
+    return analyze(root / 'whole'), analyze(root / 'stream', stream=True, chunk_size=CHUNK_SIZE)
+
+@pytest.mark.parametrize('filename, key', [(filename, key) for filename, keys in OUTPUT_FILES.items() for key in keys])
+def test_stream_matches_whole_file(folders, filename, key):
+    whole, stream = [pd.read_hdf(os.path.join(folder, filename), key) for folder in folders]
+    if key in CHUNK_DEPENDENT:
+        if CHUNK_DEPENDENT[key] is None:
+            return
+        whole = whole.drop(columns=CHUNK_DEPENDENT[key])
+        stream = stream.drop(columns=CHUNK_DEPENDENT[key])
+    pd.testing.assert_frame_equal(whole, stream)
+
+def test_stream_has_chunks(folders):
+    """outputs that depend on chunks differ, i.e. files are analyzed in more than one chunk
+    """
+    whole, stream = [pd.read_hdf(os.path.join(folder, 'IEI_data.h5'), 'wolpert_IEI') for folder in folders]
+    assert len(stream) < len(whole)